@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import hashlib
+import threading
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    按 (模型名称, 文本哈希) 寻址的持久化嵌入缓存，可被所有知识库共享
+
+    每个模型一个目录：
+        vectors.f32  按行追加的 float32 向量矩阵，读取时内存映射
+        keys.txt     与向量行一一对应的文本哈希，每行一个
+        meta.json    向量维度
+    """
+
+    def __init__(self, cache_dir, model_name):
+        """
+        初始化嵌入缓存
+
+        Args:
+            cache_dir: 缓存根目录
+            model_name: 嵌入模型名称，不同模型的向量互不共享
+        """
+        self.model_name = model_name
+        self.path = os.path.join(cache_dir, re.sub(r'[^\w.-]', '_', model_name))
+        self.vectors_path = os.path.join(self.path, "vectors.f32")
+        self.keys_path = os.path.join(self.path, "keys.txt")
+        self.meta_path = os.path.join(self.path, "meta.json")
+
+        self.dimension = None
+        self._rows = {}  # 文本哈希 -> 行号
+        self._matrix = None  # 当前的内存映射，行数增长后重新映射
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.path, exist_ok=True)
+        self._load()
+
+    def key(self, text):
+        """
+        计算文本的缓存键
+
+        Args:
+            text: 文本
+
+        Returns:
+            十六进制哈希字符串
+        """
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, texts):
+        """
+        批量查询缓存
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            与texts一一对应的向量列表，未命中的位置为None
+        """
+        with self._lock:
+            matrix = self._mapped_matrix()
+            results = []
+            for text in texts:
+                row = self._rows.get(self.key(text))
+                if row is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(np.array(matrix[row]))
+            return results
+
+    def put_many(self, texts, vectors):
+        """
+        批量写入缓存，已存在的文本会被跳过
+
+        Args:
+            texts: 文本列表
+            vectors: 与texts一一对应的向量（二维数组或向量列表）
+        """
+        vectors = np.asarray(vectors, dtype='float32')
+        if len(texts) == 0:
+            return
+
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = int(vectors.shape[1])
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"dimension": self.dimension, "model_name": self.model_name}, f)
+            elif vectors.shape[1] != self.dimension:
+                print(f"嵌入缓存维度不匹配: {vectors.shape[1]} != {self.dimension}，跳过写入")
+                return
+
+            new_keys = {}
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                if key not in self._rows and key not in new_keys:
+                    new_keys[key] = vector
+            if not new_keys:
+                return
+
+            # 先写向量再写键，中途崩溃时只会留下没有键的多余向量行
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.ascontiguousarray(list(new_keys.values()), dtype='float32').tobytes())
+            with open(self.keys_path, "a", encoding="utf-8") as f:
+                f.write("".join(key + "\n" for key in new_keys))
+
+            start = len(self._rows)
+            for offset, key in enumerate(new_keys):
+                self._rows[key] = start + offset
+            self._matrix = None
+
+    def stats(self):
+        """
+        获取缓存统计信息
+
+        Returns:
+            统计信息字典
+        """
+        with self._lock:
+            return {
+                "model_name": self.model_name,
+                "entries": len(self._rows),
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+    def _load(self):
+        """加载维度信息和哈希索引"""
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self.dimension = json.load(f)["dimension"]
+
+        lines = []
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        keys = [line.strip() for line in lines if line.endswith("\n") and len(line.strip()) == 64]
+
+        vectors_size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        available_rows = vectors_size // (self.dimension * 4) if self.dimension else 0
+
+        # 上次写入中断时向量行与键可能不一致，截断到两者都完整的行数，保证后续追加对齐
+        rows = min(len(keys), available_rows)
+        if vectors_size != rows * (self.dimension or 0) * 4:
+            os.truncate(self.vectors_path, rows * (self.dimension or 0) * 4)
+        if rows < len(lines):
+            keys = keys[:rows]
+            with open(self.keys_path, "w", encoding="utf-8") as f:
+                f.write("".join(key + "\n" for key in keys))
+
+        for row, key in enumerate(keys):
+            self._rows[key] = row
+
+    def _mapped_matrix(self):
+        """获取覆盖全部已知行的内存映射矩阵"""
+        if not self._rows:
+            return None
+        if self._matrix is None or len(self._matrix) < len(self._rows):
+            self._matrix = np.memmap(self.vectors_path, dtype='float32', mode='r',
+                                     shape=(len(self._rows), self.dimension))
+        return self._matrix
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(cache_dir, model_name):
+    """
+    获取共享的嵌入缓存实例，同一目录和模型在进程内只打开一次，避免多个实例交错追加
+
+    Args:
+        cache_dir: 缓存根目录
+        model_name: 嵌入模型名称
+
+    Returns:
+        EmbeddingCache 实例
+    """
+    key = (os.path.abspath(cache_dir), model_name)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = EmbeddingCache(cache_dir, model_name)
+        return _caches[key]
@@ -1,7 +1,51 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import re
+import random
+import asyncio
 from abc import ABC, abstractmethod
+import aiohttp
+import numpy as np
+from embedding_models.embedding_cache import get_embedding_cache
+
+# 中日韩字符大致一个字一个token，其余文本按约4个字符一个token估算
+_CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
+
+def estimate_tokens(text):
+    """
+    粗略估算文本的token数量
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算的token数量
+    """
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+class EmbeddingAPIError(Exception):
+    """嵌入接口返回错误状态码时抛出的异常"""
+
+    def __init__(self, status, message):
+        """
+        初始化异常
+
+        Args:
+            status: HTTP状态码
+            message: 错误信息
+        """
+        super().__init__(f"API请求失败: {status}, {message}")
+        self.status = status
+
+    @property
+    def retryable(self):
+        """限流、超时和服务端错误可以重试，其余客户端错误重试也不会成功"""
+        return self.status in (408, 409, 429) or self.status >= 500
+
 
 class EmbeddingModel(ABC):
     """嵌入模型的抽象基类，定义了所有嵌入模型需要实现的接口"""
@@ -15,11 +59,19 @@ class EmbeddingModel(ABC):
         """
         self.config_manager = config_manager
         self.proxy = config_manager.get_proxy_settings()
+        self.model_name = None  # 由子类设置，同时用作嵌入缓存的命名空间
+        self.cache_enabled = config_manager.get_config('EMBEDDING_CACHE', 'enabled', 'true').lower() == 'true'
+        self.cache_dir = config_manager.get_config('EMBEDDING_CACHE', 'path', 'embedding_cache')
+
+        # 批量请求设置
+        self.batch_size = max(1, config_manager.get_int_config('EMBEDDING_MODELS', 'batch_size', 32))
+        self.batch_max_tokens = max(1, config_manager.get_int_config('EMBEDDING_MODELS', 'batch_max_tokens', 16384))
+        self.max_concurrency = max(1, config_manager.get_int_config('EMBEDDING_MODELS', 'max_concurrency', 4))
+        self.max_retries = max(0, config_manager.get_int_config('EMBEDDING_MODELS', 'max_retries', 3))
 
-    @abstractmethod
     async def embed(self, text):
         """
-        将文本转换为嵌入向量
+        将查询文本转换为嵌入向量，命中缓存时直接返回，未命中时不写入缓存
 
         Args:
             text: 要嵌入的文本
@@ -27,12 +79,63 @@ class EmbeddingModel(ABC):
         Returns:
             嵌入向量
         """
-        pass
+        return (await self.embed_batch([text], store=False))[0]
 
-    @abstractmethod
-    async def embed_batch(self, texts):
+    async def embed_batch(self, texts, store=True):
+        """
+        批量将文本转换为嵌入向量，已缓存的文本不会再次请求
+
+        Args:
+            texts: 要嵌入的文本列表
+            store: 是否把新请求的向量写入缓存；查询文本几乎不会重复，写入只会让缓存无限增长，应传False
+
+        Returns:
+            嵌入向量数组，形状为 (len(texts), 维度)
+        """
+        cache = self.get_cache()
+        if cache is None:
+            return np.asarray(await self._embed_uncached(list(texts)), dtype='float32')
+
+        cached = cache.get_many(texts)
+
+        # 只请求未命中的文本，批内重复的文本只请求一次
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+        if missing:
+            new_vectors = np.asarray(await self._embed_uncached(missing), dtype='float32')
+            if store:
+                cache.put_many(missing, new_vectors)
+            fetched = dict(zip(missing, new_vectors))
+            cached = [vector if vector is not None else fetched[text] for text, vector in zip(texts, cached)]
+
+        return np.asarray(cached, dtype='float32')
+
+    def get_cache(self):
+        """
+        获取当前模型的嵌入缓存
+
+        Returns:
+            EmbeddingCache 实例，未启用缓存时返回None
+        """
+        if not self.cache_enabled or not self.model_name:
+            return None
+        return get_embedding_cache(self.cache_dir, self.model_name)
+
+    def cache_stats(self):
         """
-        批量将文本转换为嵌入向量
+        获取嵌入缓存的命中统计
+
+        Returns:
+            统计信息字典，未启用缓存时返回None
+        """
+        cache = self.get_cache()
+        return cache.stats() if cache else None
+
+    async def _embed_uncached(self, texts):
+        """
+        实际请求嵌入向量，不经过缓存
+
+        输入按条数和token预算切分为多个批次，通过有限数量的并发请求发送，
+        结果按原始顺序拼接；失败的批次单独退避重试，不影响其他批次。
 
         Args:
             texts: 要嵌入的文本列表
@@ -40,4 +143,77 @@ class EmbeddingModel(ABC):
         Returns:
             嵌入向量列表
         """
+        batches = self._make_batches(texts)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_concurrency)) as session:
+            async def run_batch(batch):
+                async with semaphore:
+                    return await self._request_with_retry(session, batch)
+
+            results = await asyncio.gather(*(run_batch(batch) for batch in batches))
+
+        return [vector for batch_result in results for vector in batch_result]
+
+    def _make_batches(self, texts):
+        """
+        按条数和token预算切分批次
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            批次列表，单条超出预算的文本独占一个批次
+        """
+        batches = []
+        current = []
+        current_tokens = 0
+        for text in texts:
+            tokens = estimate_tokens(text)
+            if current and (len(current) >= self.batch_size or current_tokens + tokens > self.batch_max_tokens):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(text)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _request_with_retry(self, session, texts):
+        """
+        请求一个批次，失败时按指数退避重试
+
+        Args:
+            session: aiohttp 会话
+            texts: 批次内的文本列表
+
+        Returns:
+            嵌入向量列表
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                vectors = await self._request_embeddings(session, texts)
+                if len(vectors) != len(texts):
+                    raise EmbeddingAPIError(500, f"返回向量数量 {len(vectors)} 与输入数量 {len(texts)} 不一致")
+                return vectors
+            except (EmbeddingAPIError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries or (isinstance(e, EmbeddingAPIError) and not e.retryable):
+                    raise
+                delay = min(30.0, 2 ** attempt) * (0.5 + random.random())
+                print(f"嵌入批次请求失败，{delay:.1f} 秒后第 {attempt + 1} 次重试: {e}")
+                await asyncio.sleep(delay)
+
+    @abstractmethod
+    async def _request_embeddings(self, session, texts):
+        """
+        发送单个批次的嵌入请求
+
+        Args:
+            session: aiohttp 会话
+            texts: 批次内的文本列表
+
+        Returns:
+            嵌入向量列表，与texts一一对应
+        """
         pass
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from embedding_models.embedding_model import EmbeddingModel
+
+# 64位 FNV-1a 哈希参数
+_FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+_FNV_PRIME = np.uint64(0x100000001b3)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def hash_embed(texts, dimension, max_ngram=3):
+    """
+    用字符 n-gram 特征哈希生成嵌入向量，作为进程池任务执行，因此定义为模块级函数
+
+    每个文本的 1~max_ngram 字符片段经 FNV-1a 哈希后落入 dimension 个桶，哈希的最低位决定符号，
+    桶内计数取对数压缩后做 L2 归一化，L2 距离因此与余弦相似度等价。
+
+    Args:
+        texts: 文本列表
+        dimension: 向量维度
+        max_ngram: 最长的字符片段长度
+
+    Returns:
+        float32 数组，形状为 (len(texts), dimension)
+    """
+    vectors = np.zeros((len(texts), dimension), dtype='float32')
+    for row, text in enumerate(texts):
+        codes = np.frombuffer(text.lower().encode("utf-32-le"), dtype='uint32').astype('uint64')
+        hashes = []
+        for n in range(1, max_ngram + 1):
+            count = len(codes) - n + 1
+            if count <= 0:
+                break
+            # 各 n-gram 长度使用不同的初始值，避免 "a" 与 "aa" 等落入同一哈希序列
+            h = np.full(count, _FNV_OFFSET ^ np.uint64(n), dtype='uint64')
+            for k in range(n):
+                h = (h ^ codes[k:k + count]) * _FNV_PRIME
+            hashes.append(h)
+        if not hashes:
+            continue
+
+        hashes = np.concatenate(hashes)
+        signs = np.where(hashes & np.uint64(1), 1.0, -1.0)
+        counts = np.bincount((hashes >> np.uint64(1)) % np.uint64(dimension), weights=signs, minlength=dimension)
+        vector = np.sign(counts) * np.log1p(np.abs(counts))
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vectors[row] = vector / norm
+    return vectors
+
+
+def _get_executor(workers):
+    """
+    获取共享的进程池，首次使用时创建
+
+    Args:
+        workers: 工作进程数
+
+    Returns:
+        ProcessPoolExecutor 实例
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=workers)
+        return _executor
+
+
+class LocalEmbedding(EmbeddingModel):
+    """
+    本地嵌入模型，基于字符 n-gram 特征哈希，只依赖 NumPy，不需要网络和API密钥
+
+    语义能力弱于神经网络嵌入模型，适合离线使用、无API密钥时的兜底以及知识库构建的性能测试。
+    """
+
+    def __init__(self, config_manager):
+        """
+        初始化本地嵌入模型
+
+        Args:
+            config_manager: 配置管理器实例
+        """
+        super().__init__(config_manager)
+        self.dimension = max(16, config_manager.get_int_config('EMBEDDING_MODELS', 'local_embedding_dimension', 512))
+        self.workers = config_manager.get_int_config('EMBEDDING_MODELS', 'local_embedding_workers', 0) or os.cpu_count() or 1
+        self.model_name = f"local-hash-{self.dimension}"
+        # 本地计算比读写缓存更快，不使用嵌入缓存
+        self.cache_enabled = False
+        # 少于该数量的文本直接在线程中计算，不值得分发到进程池
+        self.parallel_threshold = 64
+
+    async def _embed_uncached(self, texts):
+        """
+        计算嵌入向量，大批量文本按工作进程数切分后并行计算
+
+        Args:
+            texts: 要嵌入的文本列表
+
+        Returns:
+            嵌入向量数组
+        """
+        if not texts:
+            return np.zeros((0, self.dimension), dtype='float32')
+
+        if self.workers <= 1 or len(texts) < self.parallel_threshold:
+            return await asyncio.to_thread(hash_embed, texts, self.dimension)
+
+        loop = asyncio.get_running_loop()
+        executor = _get_executor(self.workers)
+        step = -(-len(texts) // self.workers)
+        parts = [texts[i:i + step] for i in range(0, len(texts), step)]
+        results = await asyncio.gather(*(loop.run_in_executor(executor, hash_embed, part, self.dimension)
+                                         for part in parts))
+        return np.concatenate(results)
+
+    async def _request_embeddings(self, session, texts):
+        """
+        本地模型不发送网络请求，保留该方法以满足基类接口
+
+        Args:
+            session: 未使用
+            texts: 文本列表
+
+        Returns:
+            嵌入向量数组
+        """
+        return hash_embed(texts, self.dimension)
@@ -2,9 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import aiohttp
-import json
-import asyncio
-from embedding_models.embedding_model import EmbeddingModel
+from embedding_models.embedding_model import EmbeddingModel, EmbeddingAPIError
 
 class SiliconFlowEmbedding(EmbeddingModel):
     """SiliconFlow嵌入模型实现"""
@@ -27,24 +25,13 @@ class SiliconFlowEmbedding(EmbeddingModel):
         if not self.model_name:
             self.model_name = "BAAI/bge-m3"  # 默认模型
 
-    async def embed(self, text):
+    async def _request_embeddings(self, session, texts):
         """
-        将文本转换为嵌入向量
+        请求SiliconFlow接口获取一个批次的嵌入向量
 
         Args:
-            text: 要嵌入的文本
-
-        Returns:
-            嵌入向量
-        """
-        return (await self.embed_batch([text]))[0]
-
-    async def embed_batch(self, texts):
-        """
-        批量将文本转换为嵌入向量
-
-        Args:
-            texts: 要嵌入的文本列表
+            session: aiohttp 会话
+            texts: 批次内的文本列表
 
         Returns:
             嵌入向量列表
@@ -59,11 +46,14 @@ class SiliconFlowEmbedding(EmbeddingModel):
             "input": texts
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(self.api_url, headers=headers, json=data, proxy=self.proxy.get("https") if self.proxy else None) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"API请求失败: {response.status}, {error_text}")
-
-                result = await response.json()
-                return [item["embedding"] for item in result["data"]]
+        async with session.post(self.api_url, headers=headers, json=data,
+                                proxy=self.proxy.get("https") if self.proxy else None,
+                                timeout=aiohttp.ClientTimeout(total=120)) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                raise EmbeddingAPIError(response.status, error_text)
+
+            result = await response.json()
+            # 按 index 字段排序，保证与输入顺序一致
+            data_items = sorted(result["data"], key=lambda item: item.get("index", 0))
+            return [item["embedding"] for item in data_items]
@@ -12,6 +12,7 @@ import sys
 import os
 import argparse
 import asyncio
+import multiprocessing
 import traceback # 导入 traceback 模块，这可是抓 Bug 的神器！
 import logging # 导入 logging 模块，日志记录也要跟上！
 from PyQt6.QtWidgets import QApplication, QMessageBox # 导入 QMessageBox，万一闪退了还能给用户个交代
@@ -115,6 +116,9 @@ async def main():
         return loop.run_forever()
 
 if __name__ == "__main__":
+    # 打包后的程序在文档解析子进程中启动时，直接进入工作进程逻辑
+    multiprocessing.freeze_support()
+
     # 在应用程序主逻辑开始之前，设置全局异常钩子！这可是关键一步！
     sys.excepthook = handle_exception
     logging.info("全局异常钩子 sys.excepthook 已设置。") # 确认一下钩子挂上了！
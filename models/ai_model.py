@@ -1,8 +1,138 @@
+import functools
+from contextlib import aclosing
 from abc import ABC, abstractmethod
+from models.http_pool import http_pool
+from models.rate_limiter import get_rate_limiter
+from models.response_cache import ResponseCache, get_response_cache
+
+
+def _rate_limited_generate(method):
+    """包装 generate：请求前等待限流器，结束后按实际输出修正token用量"""
+    @functools.wraps(method)
+    async def generate(self, prompt, *args, **kwargs):
+        ticket = await self.rate_limiter().acquire(prompt, self.expected_output_tokens())
+        result = None
+        try:
+            result = await method(self, prompt, *args, **kwargs)
+            return result
+        finally:
+            ticket.finish(result if isinstance(result, str) else "")
+    return generate
+
+
+def _rate_limited_generate_stream(method):
+    """包装 generate_stream：请求前等待限流器，流结束后按实际输出修正token用量"""
+    @functools.wraps(method)
+    async def generate_stream(self, prompt, *args, **kwargs):
+        ticket = await self.rate_limiter().acquire(prompt, self.expected_output_tokens())
+        output = []
+        try:
+            # 调用方提前结束或取消时显式关闭内层生成器，及时结束请求、归还并发名额
+            async with aclosing(method(self, prompt, *args, **kwargs)) as stream:
+                async for chunk in stream:
+                    output.append(chunk)
+                    yield chunk
+        finally:
+            ticket.finish("".join(chunk for chunk in output if isinstance(chunk, str)))
+    return generate_stream
+
+
+def _cached_generate(method):
+    """包装 generate：启用响应缓存时，相同的请求直接返回缓存的文本"""
+    @functools.wraps(method)
+    async def generate(self, prompt, callback=None):
+        cache = get_response_cache(self.config_manager) if isinstance(prompt, str) else None
+        if cache is None:
+            return await method(self, prompt, callback)
+
+        key = self.response_cache_key(prompt, stream=False)
+        cached = cache.get(key)
+        if cached is not None:
+            text = "".join(cached[0])
+            # 与未命中时一致：给了回调就把完整文本交给回调
+            if callback:
+                callback(text)
+            return text
+        result = await method(self, prompt, callback)
+        if isinstance(result, str):
+            cache.put(key, [result], provider=self.provider, model_name=getattr(self, "model_name", None))
+        return result
+    return generate
+
+
+def _cached_generate_stream(method):
+    """包装 generate_stream：启用响应缓存时，相同的请求按原来的分块重放缓存的文本"""
+    @functools.wraps(method)
+    async def generate_stream(self, prompt, callback=None):
+        cache = get_response_cache(self.config_manager) if isinstance(prompt, str) else None
+        if cache is None:
+            async with aclosing(method(self, prompt, callback)) as stream:
+                async for chunk in stream:
+                    yield chunk
+            return
+
+        key = self.response_cache_key(prompt, stream=True)
+        cached = cache.get(key)
+        if cached is not None:
+            chunks, callback_used = cached
+            for chunk in chunks:
+                # 与真实生成一致：只有模型本身会调用回调时才调用
+                if callback and callback_used:
+                    callback(chunk)
+                yield chunk
+            return
+
+        # 始终传入回调以记录模型是否使用回调，调用方提供了回调时再转发
+        callback_used = False
+
+        def recording_callback(chunk):
+            nonlocal callback_used
+            callback_used = True
+            if callback:
+                callback(chunk)
+
+        chunks = []
+        # 调用方提前结束或取消时显式关闭内层生成器，限流名额随之归还
+        async with aclosing(method(self, prompt, recording_callback)) as stream:
+            async for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+        # 只缓存完整结束的流，中途失败或被调用方提前结束时不会执行到这里
+        if all(isinstance(chunk, str) for chunk in chunks):
+            cache.put(key, chunks, callback_used, self.provider, getattr(self, "model_name", None))
+    return generate_stream
+
 
 class AIModel(ABC):
     """AI模型的抽象基类，定义了所有AI模型需要实现的接口"""
 
+    # 限流配置中使用的提供方名称，见 [RATE_LIMITS]
+    provider = "default"
+    # 子类的 generate / generate_stream 是否自动经过限流器，包装其他模型的类应设为False
+    rate_limited = True
+    # 子类的 generate / generate_stream 是否经过响应缓存（[RESPONSE_CACHE] 启用时），包装其他模型的类应设为False
+    response_cached = True
+
+    def __init_subclass__(cls, **kwargs):
+        """
+        子类定义的 generate / generate_stream 自动包装：外层为响应缓存，命中时不占用限流配额；
+        内层为限流，每次请求前等待配额
+        """
+        super().__init_subclass__(**kwargs)
+        wrappers = {
+            "generate": (_rate_limited_generate, _cached_generate),
+            "generate_stream": (_rate_limited_generate_stream, _cached_generate_stream)
+        }
+        for name, (rate_limit, cache) in wrappers.items():
+            method = cls.__dict__.get(name)
+            if method is None or getattr(method, "__isabstractmethod__", False):
+                continue
+            if cls.rate_limited:
+                method = rate_limit(method)
+            if cls.response_cached:
+                method = cache(method)
+            setattr(cls, name, method)
+
     def __init__(self, config_manager):
         """
         初始化AI模型
@@ -12,6 +142,61 @@ class AIModel(ABC):
         """
         self.config_manager = config_manager
         self.proxy = config_manager.get_proxy_settings()
+        http_pool.configure(
+            limit=config_manager.get_int_config('HTTP_POOL', 'limit', 32),
+            limit_per_host=config_manager.get_int_config('HTTP_POOL', 'limit_per_host', 8),
+            keepalive_timeout=config_manager.get_float_config('HTTP_POOL', 'keepalive_timeout', 60),
+            dns_cache_ttl=config_manager.get_int_config('HTTP_POOL', 'dns_cache_ttl', 300)
+        )
+
+    def rate_limiter(self):
+        """
+        获取本模型的限流器，同一提供方、同一API密钥的所有模型实例共享
+
+        Returns:
+            RateLimiter 实例
+        """
+        return get_rate_limiter(self.config_manager, self.provider, getattr(self, "api_key", None))
+
+    def expected_output_tokens(self):
+        """请求前为输出预留的token数，请求结束后按实际输出修正"""
+        return self.config_manager.get_int_config('RATE_LIMITS', 'expected_output_tokens', 1024)
+
+    def sampling_params(self):
+        """
+        请求中使用的采样参数，作为响应缓存键的一部分；发送 temperature、max_tokens 等参数的子类应覆盖此方法
+
+        Returns:
+            采样参数字典，使用接口默认值时为空
+        """
+        return {}
+
+    def response_cache_key(self, prompt, stream=False):
+        """
+        计算请求的响应缓存键
+
+        Args:
+            prompt: 提示词
+            stream: 是否流式生成
+
+        Returns:
+            十六进制哈希字符串
+        """
+        return ResponseCache.key(self.provider, getattr(self, "model_name", None), getattr(self, "api_url", None),
+                                 prompt, self.sampling_params(), stream)
+
+    def _post(self, url, **kwargs):
+        """
+        通过共享连接池发送 POST 请求，同一模型类的所有实例共用一个会话
+
+        Args:
+            url: 请求地址
+            **kwargs: 传给 aiohttp 的参数，如 headers、json、proxy
+
+        Returns:
+            可 await 或用作 async with 的请求对象，响应接口与 aiohttp.ClientResponse 一致
+        """
+        return http_pool.post(type(self).__name__, url, **kwargs)
 
     @abstractmethod
     async def generate(self, prompt, callback=None):
@@ -1,11 +1,13 @@
-import aiohttp
 import json
 import asyncio
 from models.ai_model import AIModel
+from models.resilience import ModelAPIError
 
 class ClaudeModel(AIModel):
     """Anthropic Claude模型实现"""
 
+    provider = "claude"
+
     def __init__(self, config_manager):
         """
         初始化Claude模型
@@ -48,19 +50,18 @@ class ClaudeModel(AIModel):
             "stream": False
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                self.api_url,
-                headers=headers,
-                json=data,
-                proxy=self.proxy["https"] if self.proxy else None
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"Anthropic API错误: {response.status} - {error_text}")
+        async with self._post(
+            self.api_url,
+            headers=headers,
+            json=data,
+            proxy=self.proxy["https"] if self.proxy else None
+        ) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                raise ModelAPIError(response.status, error_text, response.headers.get("Retry-After"), "Anthropic")
 
-                result = await response.json()
-                return result["content"][0]["text"]
+            result = await response.json()
+            return result["content"][0]["text"]
 
     async def generate_stream(self, prompt, callback=None):
         """
@@ -86,27 +87,26 @@ class ClaudeModel(AIModel):
             "stream": True
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                self.api_url,
-                headers=headers,
-                json=data,
-                proxy=self.proxy["https"] if self.proxy else None
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"Anthropic API错误: {response.status} - {error_text}")
-
-                async for line in response.content:
-                    line = line.decode('utf-8').strip()
-                    if not line or line == "data: [DONE]":
+        async with self._post(
+            self.api_url,
+            headers=headers,
+            json=data,
+            proxy=self.proxy["https"] if self.proxy else None
+        ) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                raise ModelAPIError(response.status, error_text, response.headers.get("Retry-After"), "Anthropic")
+
+            async for line in response.content:
+                line = line.decode('utf-8').strip()
+                if not line or line == "data: [DONE]":
+                    continue
+                if line.startswith("data: "):
+                    json_str = line[6:]
+                    try:
+                        data = json.loads(json_str)
+                        delta = data.get("delta", {})
+                        if delta.get("type") == "text_delta":
+                            yield delta.get("text", "")
+                    except json.JSONDecodeError:
                         continue
-                    if line.startswith("data: "):
-                        json_str = line[6:]
-                        try:
-                            data = json.loads(json_str)
-                            delta = data.get("delta", {})
-                            if delta.get("type") == "text_delta":
-                                yield delta.get("text", "")
-                        except json.JSONDecodeError:
-                            continue
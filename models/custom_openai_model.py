@@ -5,10 +5,13 @@ import aiohttp
 import json
 import asyncio
 from models.ai_model import AIModel
+from models.resilience import ModelAPIError
 
 class CustomOpenAIModel(AIModel):
     """自定义OpenAI兼容API模型实现"""
 
+    provider = "custom_openai"
+
     def __init__(self, config_manager, model_config=None):
         """
         初始化自定义OpenAI兼容模型
@@ -71,29 +74,28 @@ class CustomOpenAIModel(AIModel):
             proxy = self.proxy.get("https")
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.api_url,
-                    json=data,
-                    headers=headers,
-                    proxy=proxy,
-                    timeout=aiohttp.ClientTimeout(total=120)
-                ) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        raise Exception(f"API请求失败: {response.status}, {error_text}")
-
-                    result = await response.json()
-
-                    # 解析响应
-                    if "choices" in result and len(result["choices"]) > 0:
-                        if "message" in result["choices"][0]:
-                            return result["choices"][0]["message"]["content"]
-                        elif "text" in result["choices"][0]:
-                            return result["choices"][0]["text"]
-
-                    # 如果无法解析，返回原始响应
-                    return str(result)
+            async with self._post(
+                self.api_url,
+                json=data,
+                headers=headers,
+                proxy=proxy,
+                timeout=aiohttp.ClientTimeout(total=120)
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    raise ModelAPIError(response.status, error_text, response.headers.get("Retry-After"))
+
+                result = await response.json()
+
+                # 解析响应
+                if "choices" in result and len(result["choices"]) > 0:
+                    if "message" in result["choices"][0]:
+                        return result["choices"][0]["message"]["content"]
+                    elif "text" in result["choices"][0]:
+                        return result["choices"][0]["text"]
+
+                # 如果无法解析，返回原始响应
+                return str(result)
         except Exception as e:
             raise Exception(f"生成文本时出错: {str(e)}")
 
@@ -127,46 +129,45 @@ class CustomOpenAIModel(AIModel):
             proxy = self.proxy.get("https")
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.api_url,
-                    json=data,
-                    headers=headers,
-                    proxy=proxy,
-                    timeout=aiohttp.ClientTimeout(total=300)
-                ) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        raise Exception(f"API请求失败: {response.status}, {error_text}")
-
-                    # 处理流式响应
-                    async for line in response.content:
-                        line = line.decode('utf-8').strip()
-                        if line:
-                            # 跳过空行和"data: [DONE]"
-                            if line == "data: [DONE]":
-                                continue
-
-                            # 处理"data: "前缀
-                            if line.startswith("data: "):
-                                line = line[6:]
-
-                            try:
-                                data = json.loads(line)
-                                if "choices" in data and len(data["choices"]) > 0:
-                                    choice = data["choices"][0]
-                                    if "delta" in choice and "content" in choice["delta"]:
-                                        chunk = choice["delta"]["content"]
-                                    elif "text" in choice:
-                                        chunk = choice["text"]
-                                    else:
-                                        continue
-
-                                    if callback:
-                                        callback(chunk)
-                                    yield chunk
-                            except json.JSONDecodeError:
-                                # 忽略无法解析的行
-                                continue
+            async with self._post(
+                self.api_url,
+                json=data,
+                headers=headers,
+                proxy=proxy,
+                timeout=aiohttp.ClientTimeout(total=300)
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    raise ModelAPIError(response.status, error_text, response.headers.get("Retry-After"))
+
+                # 处理流式响应
+                async for line in response.content:
+                    line = line.decode('utf-8').strip()
+                    if line:
+                        # 跳过空行和"data: [DONE]"
+                        if line == "data: [DONE]":
+                            continue
+
+                        # 处理"data: "前缀
+                        if line.startswith("data: "):
+                            line = line[6:]
+
+                        try:
+                            data = json.loads(line)
+                            if "choices" in data and len(data["choices"]) > 0:
+                                choice = data["choices"][0]
+                                if "delta" in choice and "content" in choice["delta"]:
+                                    chunk = choice["delta"]["content"]
+                                elif "text" in choice:
+                                    chunk = choice["text"]
+                                else:
+                                    continue
+
+                                if callback:
+                                    callback(chunk)
+                                yield chunk
+                        except json.JSONDecodeError:
+                            # 忽略无法解析的行
+                            continue
         except Exception as e:
             raise Exception(f"流式生成文本时出错: {str(e)}")
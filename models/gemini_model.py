@@ -1,10 +1,14 @@
 from google import genai
 import asyncio
+from contextlib import aclosing
 from models.ai_model import AIModel
+from models.stream_bridge import iterate_in_thread
 
 class GeminiModel(AIModel):
     """Google Gemini模型实现"""
 
+    provider = "gemini"
+
     def __init__(self, config_manager):
         """
         初始化Gemini模型
@@ -68,21 +72,19 @@ class GeminiModel(AIModel):
             生成的文本流（异步生成器）
         """
 
-        # 在事件循环中运行同步API调用
-        loop = asyncio.get_event_loop()
-        response_stream = await loop.run_in_executor(
-            None,
-            lambda: self.client.models.generate_content_stream(
-                model=self.model_name,
-                contents=prompt
-            )
+        # 同步的API调用和流式迭代都在工作线程中执行，不阻塞事件循环
+        response_stream = iterate_in_thread(
+            self.client.models.generate_content_stream,
+            model=self.model_name,
+            contents=prompt
         )
 
         # 处理流式响应
-        async for chunk in self._process_stream(response_stream):
-            if callback:
-                callback(chunk)
-            yield chunk
+        async with aclosing(self._process_stream(response_stream)) as stream:
+            async for chunk in stream:
+                if callback:
+                    callback(chunk)
+                yield chunk
 
         # 异步生成器不能使用return返回值
 
@@ -91,22 +93,21 @@ class GeminiModel(AIModel):
         处理Gemini流式响应
 
         Args:
-            response_stream: Gemini流式响应
+            response_stream: Gemini流式响应的异步迭代器
 
         Yields:
             文本块
         """
-        for chunk in response_stream:
-            chunk_text = ""
-            if hasattr(chunk, 'text'):
-                chunk_text = chunk.text
-            elif hasattr(chunk, 'parts') and chunk.parts:
-                chunk_text = chunk.parts[0].text
-            elif hasattr(chunk, 'content') and chunk.content:
-                chunk_text = chunk.content.parts[0].text
-
-            if chunk_text:
-                yield chunk_text
-
-            # 给异步事件循环一个机会执行
-            await asyncio.sleep(0)
+        # 提前结束时关闭桥接生成器，工作线程随之停止
+        async with aclosing(response_stream) as stream:
+            async for chunk in stream:
+                chunk_text = ""
+                if hasattr(chunk, 'text'):
+                    chunk_text = chunk.text
+                elif hasattr(chunk, 'parts') and chunk.parts:
+                    chunk_text = chunk.parts[0].text
+                elif hasattr(chunk, 'content') and chunk.content:
+                    chunk_text = chunk.content.parts[0].text
+
+                if chunk_text:
+                    yield chunk_text
@@ -1,11 +1,13 @@
-import aiohttp
 import json
 import asyncio
 from models.ai_model import AIModel
+from models.resilience import ModelAPIError
 
 class GPTModel(AIModel):
     """OpenAI GPT模型实现"""
 
+    provider = "gpt"
+
     def __init__(self, config_manager):
         """
         初始化GPT模型
@@ -47,19 +49,18 @@ class GPTModel(AIModel):
             "stream": False
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                self.api_url,
-                headers=headers,
-                json=data,
-                proxy=self.proxy["https"] if self.proxy else None
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"OpenAI API错误: {response.status} - {error_text}")
+        async with self._post(
+            self.api_url,
+            headers=headers,
+            json=data,
+            proxy=self.proxy["https"] if self.proxy else None
+        ) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                raise ModelAPIError(response.status, error_text, response.headers.get("Retry-After"), "OpenAI")
 
-                result = await response.json()
-                return result["choices"][0]["message"]["content"]
+            result = await response.json()
+            return result["choices"][0]["message"]["content"]
 
     async def generate_stream(self, prompt, callback=None):
         """
@@ -84,27 +85,26 @@ class GPTModel(AIModel):
             "stream": True
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                self.api_url,
-                headers=headers,
-                json=data,
-                proxy=self.proxy["https"] if self.proxy else None
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"OpenAI API错误: {response.status} - {error_text}")
-
-                async for line in response.content:
-                    line = line.decode('utf-8').strip()
-                    if line == "data: [DONE]":
-                        break
-                    if line.startswith("data: "):
-                        json_str = line[6:]
-                        try:
-                            data = json.loads(json_str)
-                            content = data.get("choices", [{}])[0].get("delta", {}).get("content", "")
-                            if content:
-                                yield content
-                        except json.JSONDecodeError:
-                            continue
+        async with self._post(
+            self.api_url,
+            headers=headers,
+            json=data,
+            proxy=self.proxy["https"] if self.proxy else None
+        ) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                raise ModelAPIError(response.status, error_text, response.headers.get("Retry-After"), "OpenAI")
+
+            async for line in response.content:
+                line = line.decode('utf-8').strip()
+                if line == "data: [DONE]":
+                    break
+                if line.startswith("data: "):
+                    json_str = line[6:]
+                    try:
+                        data = json.loads(json_str)
+                        content = data.get("choices", [{}])[0].get("delta", {}).get("content", "")
+                        if content:
+                            yield content
+                    except json.JSONDecodeError:
+                        continue
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+共享的HTTP连接池
+
+界面中的每次生成都在 GenerationThread 新建的事件循环中执行，任务结束后循环即被关闭，
+绑定在该循环上的 aiohttp 会话无法复用。连接池因此运行在一个常驻的后台事件循环中，
+每个模型提供方一个长期存在的 ClientSession（keep-alive、DNS 缓存、单主机连接数限制），
+调用方所在的事件循环通过 run_coroutine_threadsafe 把请求交给它执行，
+同一提供方的后续请求可以直接复用已建立的 TCP/TLS 连接。
+"""
+
+import json
+import asyncio
+import threading
+import weakref
+import aiohttp
+
+
+class PooledResponse:
+    """
+    连接池中请求的响应代理，接口与 aiohttp.ClientResponse 的常用部分一致
+
+    所有读取操作都在连接池的事件循环中执行，调用方在自己的事件循环中等待结果。
+    """
+
+    def __init__(self, pool, response):
+        """
+        初始化响应代理
+
+        Args:
+            pool: HttpPool 实例
+            response: 连接池事件循环中的 aiohttp.ClientResponse
+        """
+        self._pool = pool
+        self._response = response
+        self.status = response.status
+        self.headers = response.headers
+        self.content = _PooledContent(pool, response)
+        # 调用方的事件循环被直接关闭时 __aexit__ 不会执行，对象回收时归还连接
+        self._finalizer = weakref.finalize(self, pool.submit_nowait, _release, response)
+
+    async def text(self):
+        """读取完整的响应文本"""
+        return await self._pool.run(self._response.text())
+
+    async def json(self):
+        """读取并解析JSON响应"""
+        return json.loads(await self.text())
+
+    async def read(self):
+        """读取完整的响应字节"""
+        return await self._pool.run(self._response.read())
+
+    async def release(self):
+        """归还连接，未读完的响应会关闭连接而不是放回连接池"""
+        if self._finalizer.detach():
+            await self._pool.run(_release(self._response))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+
+class _PooledContent:
+    """响应流的代理，按行异步迭代，与 ClientResponse.content 的行迭代一致"""
+
+    def __init__(self, pool, response):
+        self._pool = pool
+        self._response = response
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        line = await self._pool.run(self._response.content.readline())
+        if not line:
+            raise StopAsyncIteration
+        return line
+
+    async def iter_any(self):
+        """
+        按到达顺序读取数据块
+
+        Yields:
+            字节块
+        """
+        while True:
+            data = await self._pool.run(self._response.content.readany())
+            if not data:
+                break
+            yield data
+
+
+async def _release(response):
+    """在连接池事件循环中归还响应占用的连接"""
+    response.release()
+
+
+class _PooledRequest:
+    """http_pool.post() 的返回值，可直接 await，也可用作 async with"""
+
+    def __init__(self, pool, provider, method, url, kwargs):
+        self._pool = pool
+        self._coro_args = (provider, method, url, kwargs)
+        self._response = None
+
+    def __await__(self):
+        return self._open().__await__()
+
+    async def _open(self):
+        response = await self._pool.run(self._pool._request(*self._coro_args))
+        self._response = PooledResponse(self._pool, response)
+        return self._response
+
+    async def __aenter__(self):
+        return await self._open()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._response is not None:
+            await self._response.release()
+
+
+class HttpPool:
+    """
+    常驻后台事件循环中的HTTP会话池，按提供方名称区分会话，所有标签页共用
+    """
+
+    def __init__(self, limit=32, limit_per_host=8, keepalive_timeout=60, dns_cache_ttl=300):
+        """
+        初始化连接池，后台线程在第一次请求时启动
+
+        Args:
+            limit: 每个会话的总连接数上限
+            limit_per_host: 每个会话对同一主机的连接数上限
+            keepalive_timeout: 空闲连接保持的秒数
+            dns_cache_ttl: DNS 解析结果缓存的秒数
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self._sessions = {}
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def configure(self, limit=None, limit_per_host=None, keepalive_timeout=None, dns_cache_ttl=None):
+        """
+        修改连接参数，只影响之后新建的会话
+
+        Args:
+            limit: 每个会话的总连接数上限
+            limit_per_host: 每个会话对同一主机的连接数上限
+            keepalive_timeout: 空闲连接保持的秒数
+            dns_cache_ttl: DNS 解析结果缓存的秒数
+        """
+        if limit is not None:
+            self.limit = limit
+        if limit_per_host is not None:
+            self.limit_per_host = limit_per_host
+        if keepalive_timeout is not None:
+            self.keepalive_timeout = keepalive_timeout
+        if dns_cache_ttl is not None:
+            self.dns_cache_ttl = dns_cache_ttl
+
+    def post(self, provider, url, **kwargs):
+        """
+        发送 POST 请求
+
+        Args:
+            provider: 提供方名称，同一名称的请求共用一个会话
+            url: 请求地址
+            **kwargs: 传给 aiohttp 的参数，如 headers、json、proxy、timeout
+
+        Returns:
+            可 await 或用作 async with 的请求对象，结果为 PooledResponse
+        """
+        return _PooledRequest(self, provider, "POST", url, kwargs)
+
+    def get(self, provider, url, **kwargs):
+        """
+        发送 GET 请求
+
+        Args:
+            provider: 提供方名称，同一名称的请求共用一个会话
+            url: 请求地址
+            **kwargs: 传给 aiohttp 的参数
+
+        Returns:
+            可 await 或用作 async with 的请求对象，结果为 PooledResponse
+        """
+        return _PooledRequest(self, provider, "GET", url, kwargs)
+
+    async def run(self, coro):
+        """
+        在连接池的事件循环中执行协程，并在调用方的事件循环中等待结果
+
+        调用方被取消时，连接池中对应的任务也会被取消。
+
+        Args:
+            coro: 协程对象
+
+        Returns:
+            协程的返回值
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        return await asyncio.wrap_future(future)
+
+    def submit_nowait(self, coro_function, *args):
+        """
+        在连接池的事件循环中执行协程函数，不等待结果；连接池已关闭时直接忽略
+
+        Args:
+            coro_function: 协程函数
+            *args: 协程函数的参数
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        coro = coro_function(*args)
+        try:
+            asyncio.run_coroutine_threadsafe(coro, loop)
+        except RuntimeError:
+            coro.close()
+
+    def close_all(self, timeout=5):
+        """
+        关闭全部会话并停止后台事件循环，之后的请求会重新启动连接池
+
+        Args:
+            timeout: 等待会话关闭的最长秒数
+        """
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = None
+            self._thread = None
+        if loop is None:
+            return
+
+        try:
+            asyncio.run_coroutine_threadsafe(self._close_sessions(), loop).result(timeout)
+        except Exception as e:
+            print(f"关闭HTTP连接池出错: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+
+    def _ensure_loop(self):
+        """获取后台事件循环，首次调用时启动后台线程"""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._run_loop, args=(loop,), name="http-pool", daemon=True)
+                thread.start()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    @staticmethod
+    def _run_loop(loop):
+        """后台线程入口"""
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    async def _request(self, provider, method, url, kwargs):
+        """在连接池事件循环中发送请求，返回尚未读取内容的响应"""
+        return await self._session(provider).request(method, url, **kwargs)
+
+    def _session(self, provider):
+        """获取提供方的会话，不存在或已关闭时新建"""
+        session = self._sessions.get(provider)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_cache_ttl
+            )
+            session = aiohttp.ClientSession(connector=connector)
+            self._sessions[provider] = session
+        return session
+
+    async def _close_sessions(self):
+        """关闭全部会话"""
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            await session.close()
+
+
+# 全局共享的连接池，所有模型共用
+http_pool = HttpPool()
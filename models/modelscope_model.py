@@ -2,12 +2,16 @@
 # -*- coding: utf-8 -*-
 
 import asyncio
+from contextlib import aclosing
 from openai import OpenAI
 from models.ai_model import AIModel
+from models.stream_bridge import iterate_in_thread
 
 class ModelScopeModel(AIModel):
     """ModelScope模型实现，支持DeepSeek-R1等模型"""
 
+    provider = "modelscope"
+
     def __init__(self, config_manager):
         """
         初始化ModelScope模型
@@ -89,8 +93,8 @@ class ModelScopeModel(AIModel):
             生成的文本流（异步生成器）
         """
         try:
-            # 使用to_thread将同步API调用转换为异步
-            response = await asyncio.to_thread(
+            # 同步的API调用和流式迭代都在工作线程中执行，不阻塞事件循环
+            response = iterate_in_thread(
                 self.client.chat.completions.create,
                 model=self.model_name,
                 messages=[{"role": "user", "content": prompt}],
@@ -99,36 +103,38 @@ class ModelScopeModel(AIModel):
 
             # 处理流式响应
             done_reasoning = False
-            for chunk in response:
-                # 获取思考过程和最终答案
-                reasoning_content = ""
-                content = ""
-
-                if hasattr(chunk.choices[0].delta, 'reasoning_content'):
-                    reasoning_content = chunk.choices[0].delta.reasoning_content or ""
-
-                if hasattr(chunk.choices[0].delta, 'content'):
-                    content = chunk.choices[0].delta.content or ""
-
-                # 先输出思考过程
-                if reasoning_content:
-                    if callback:
-                        callback(reasoning_content)
-                    yield reasoning_content
-
-                # 再输出最终答案
-                elif content:
-                    # 如果是第一次输出最终答案，添加分隔符
-                    if not done_reasoning:
-                        separator = "\n\n === 最终答案 ===\n\n"
+            # 提前结束时关闭桥接生成器，工作线程随之停止
+            async with aclosing(response) as stream:
+                async for chunk in stream:
+                    # 获取思考过程和最终答案
+                    reasoning_content = ""
+                    content = ""
+
+                    if hasattr(chunk.choices[0].delta, 'reasoning_content'):
+                        reasoning_content = chunk.choices[0].delta.reasoning_content or ""
+
+                    if hasattr(chunk.choices[0].delta, 'content'):
+                        content = chunk.choices[0].delta.content or ""
+
+                    # 先输出思考过程
+                    if reasoning_content:
                         if callback:
-                            callback(separator)
-                        yield separator
-                        done_reasoning = True
+                            callback(reasoning_content)
+                        yield reasoning_content
+
+                    # 再输出最终答案
+                    elif content:
+                        # 如果是第一次输出最终答案，添加分隔符
+                        if not done_reasoning:
+                            separator = "\n\n === 最终答案 ===\n\n"
+                            if callback:
+                                callback(separator)
+                            yield separator
+                            done_reasoning = True
 
-                    if callback:
-                        callback(content)
-                    yield content
+                        if callback:
+                            callback(content)
+                        yield content
 
         except Exception as e:
             raise Exception(f"流式生成文本时出错: {str(e)}")
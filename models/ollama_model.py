@@ -8,13 +8,15 @@ Ollama模型实现
 """
 
 import json
-import aiohttp
 from models.ai_model import AIModel
+from models.resilience import ModelAPIError
 
 
 class OllamaModel(AIModel):
     """Ollama模型实现类"""
 
+    provider = "ollama"
+
     def __init__(self, config_manager, model_config=None):
         """
         初始化Ollama模型
@@ -58,34 +60,32 @@ class OllamaModel(AIModel):
             ]
         }
 
-        # 创建HTTP会话
-        async with aiohttp.ClientSession() as session:
-            # 发送请求
-            async with session.post(self.api_url, json=data, proxy=self.proxy) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"Ollama API错误: {response.status} - {error_text}")
+        # 发送请求
+        async with self._post(self.api_url, json=data, proxy=self.proxy) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                raise ModelAPIError(response.status, error_text, response.headers.get("Retry-After"), "Ollama")
 
-                # 读取完整响应
-                full_response = ""
-                async for line in response.content:
-                    if not line:
-                        continue
+            # 读取完整响应
+            full_response = ""
+            async for line in response.content:
+                if not line:
+                    continue
 
-                    try:
-                        chunk = json.loads(line)
-                        if chunk.get("done", False):
-                            break
+                try:
+                    chunk = json.loads(line)
+                    if chunk.get("done", False):
+                        break
 
-                        content = chunk.get("message", {}).get("content", "")
-                        full_response += content
+                    content = chunk.get("message", {}).get("content", "")
+                    full_response += content
 
-                        if callback:
-                            callback(content)
-                    except json.JSONDecodeError:
-                        print(f"无法解析JSON: {line}")
+                    if callback:
+                        callback(content)
+                except json.JSONDecodeError:
+                    print(f"无法解析JSON: {line}")
 
-                return full_response
+            return full_response
 
     async def generate_stream(self, prompt, callback=None):
         """
@@ -109,34 +109,32 @@ class OllamaModel(AIModel):
             ]
         }
 
-        # 创建HTTP会话
-        async with aiohttp.ClientSession() as session:
-            # 发送请求
-            async with session.post(self.api_url, json=data, proxy=self.proxy) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"Ollama API错误: {response.status} - {error_text}")
-
-                # 读取流式响应
-                full_response = ""
-                async for line in response.content:
-                    if not line:
-                        continue
-
-                    try:
-                        chunk = json.loads(line)
-                        if chunk.get("done", False):
-                            break
-
-                        content = chunk.get("message", {}).get("content", "")
-                        full_response += content
-
-                        if callback:
-                            callback(content)
-
-                        yield content
-                    except json.JSONDecodeError:
-                        print(f"无法解析JSON: {line}")
-
-                # 异步生成器不能使用带返回值的return语句
-                # 这里只是为了结束生成器
\ No newline at end of file
+        # 发送请求
+        async with self._post(self.api_url, json=data, proxy=self.proxy) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                raise ModelAPIError(response.status, error_text, response.headers.get("Retry-After"), "Ollama")
+
+            # 读取流式响应
+            full_response = ""
+            async for line in response.content:
+                if not line:
+                    continue
+
+                try:
+                    chunk = json.loads(line)
+                    if chunk.get("done", False):
+                        break
+
+                    content = chunk.get("message", {}).get("content", "")
+                    full_response += content
+
+                    if callback:
+                        callback(content)
+
+                    yield content
+                except json.JSONDecodeError:
+                    print(f"无法解析JSON: {line}")
+
+            # 异步生成器不能使用带返回值的return语句
+            # 这里只是为了结束生成器
\ No newline at end of file
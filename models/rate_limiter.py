@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+按提供方和API密钥的客户端限流
+
+每个 (提供方, API密钥) 有三项预算：每分钟请求数、每分钟token数（提示词与输出的估算值之和）和并发请求数。
+界面中的每次生成运行在各自的事件循环中，限流器的状态因此用线程锁保护，等待则在调用方自己的事件循环中进行。
+
+请求数和token数各用一个令牌桶：桶容量为每分钟配额的1/6，补充速率为其余5/6按分钟均匀分布，
+任意60秒窗口内放行的总量不超过配额。请求发出前按估算值预留，允许余额为负，
+后来的请求按欠额等待，先到先得；请求结束后按实际输出修正预留的token数。
+"""
+
+import time
+import asyncio
+import threading
+import weakref
+from collections import deque
+from embedding_models.embedding_model import estimate_tokens
+
+# 令牌桶容量占每分钟配额的比例
+BURST_FRACTION = 1 / 6
+
+
+class TokenBucket:
+    """允许预留（余额为负）的令牌桶，线程安全"""
+
+    def __init__(self, per_minute):
+        """
+        初始化令牌桶
+
+        Args:
+            per_minute: 每分钟配额，0 表示不限制
+        """
+        self._lock = threading.Lock()
+        self.per_minute = None
+        self.configure(per_minute)
+
+    def configure(self, per_minute):
+        """
+        修改每分钟配额，当前余额保留
+
+        Args:
+            per_minute: 每分钟配额，0 表示不限制
+        """
+        with self._lock:
+            if per_minute == self.per_minute:
+                return
+            self.per_minute = max(0, per_minute)
+            self.capacity = self.per_minute * BURST_FRACTION
+            self.rate = (self.per_minute - self.capacity) / 60.0
+            self.level = self.capacity
+            self.updated = time.monotonic()
+
+    def reserve(self, amount):
+        """
+        预留配额
+
+        Args:
+            amount: 预留的数量
+
+        Returns:
+            需要等待的秒数，不限制时为0
+        """
+        with self._lock:
+            if self.per_minute <= 0:
+                return 0.0
+            self._refill()
+            self.level -= amount
+            return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def adjust(self, amount):
+        """
+        修正之前的预留，amount 为正表示多用，为负表示退还
+
+        Args:
+            amount: 修正的数量
+        """
+        with self._lock:
+            if self.per_minute <= 0:
+                return
+            self._refill()
+            self.level = min(self.capacity, self.level - amount)
+
+    def _refill(self):
+        """按经过的时间补充余额"""
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class ConcurrencySlots:
+    """不依赖特定事件循环的并发上限，等待方可以来自不同线程的事件循环"""
+
+    def __init__(self, limit):
+        """
+        初始化并发上限
+
+        Args:
+            limit: 最多同时进行的请求数，0 表示不限制
+        """
+        self.limit = limit
+        self.active = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    async def acquire(self):
+        """等待一个空闲名额"""
+        with self._lock:
+            if self.limit <= 0 or self.active < self.limit:
+                self.active += 1
+                return
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if (loop, future) in self._waiters:
+                    self._waiters.remove((loop, future))
+            # 已被唤醒的名额由 _grant 发现取消后归还
+            raise
+
+    def release(self):
+        """归还名额，有等待方时直接转交给最早的等待方"""
+        with self._lock:
+            while self._waiters:
+                loop, future = self._waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(self._grant, future)
+                    return
+                except RuntimeError:
+                    # 等待方的事件循环已关闭
+                    continue
+            self.active = max(0, self.active - 1)
+
+    def _grant(self, future):
+        """在等待方的事件循环中唤醒它，等待方已取消时把名额继续转交"""
+        if future.done():
+            self.release()
+        else:
+            future.set_result(None)
+
+
+class RateLimitTicket:
+    """一次请求占用的限流资源，结束时调用 finish 归还并发名额、修正token用量"""
+
+    def __init__(self, limiter, reserved_tokens, prompt_tokens):
+        self.limiter = limiter
+        self.reserved_tokens = reserved_tokens
+        self.prompt_tokens = prompt_tokens
+        # 调用方的事件循环被直接关闭、finish 没有执行时，对象回收时归还并发名额
+        self._finalizer = weakref.finalize(self, limiter.slots.release)
+
+    def finish(self, output_text=""):
+        """
+        结束请求
+
+        Args:
+            output_text: 模型输出的文本，用于修正预留的token数
+        """
+        if self._finalizer.detach():
+            self.limiter.slots.release()
+            actual = self.prompt_tokens + estimate_tokens(output_text or "")
+            self.limiter.tokens.adjust(actual - self.reserved_tokens)
+
+
+class RateLimiter:
+    """单个 (提供方, API密钥) 的限流器"""
+
+    def __init__(self, rpm=0, tpm=0, concurrency=0):
+        """
+        初始化限流器
+
+        Args:
+            rpm: 每分钟请求数上限，0 表示不限制
+            tpm: 每分钟token数上限，0 表示不限制
+            concurrency: 并发请求数上限，0 表示不限制
+        """
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.slots = ConcurrencySlots(concurrency)
+
+    def configure(self, rpm, tpm, concurrency):
+        """
+        修改限额，已在等待的请求不受影响
+
+        Args:
+            rpm: 每分钟请求数上限
+            tpm: 每分钟token数上限
+            concurrency: 并发请求数上限
+        """
+        self.requests.configure(rpm)
+        self.tokens.configure(tpm)
+        self.slots.limit = concurrency
+
+    async def acquire(self, prompt, expected_output_tokens=0):
+        """
+        等待并发名额和配额
+
+        Args:
+            prompt: 提示词
+            expected_output_tokens: 预计的输出token数，请求结束后按实际输出修正
+
+        Returns:
+            RateLimitTicket，请求结束时调用其 finish
+        """
+        await self.slots.acquire()
+        try:
+            prompt_tokens = estimate_tokens(prompt) if isinstance(prompt, str) else 0
+            reserved = prompt_tokens + expected_output_tokens
+            delay = max(self.requests.reserve(1), self.tokens.reserve(reserved))
+            ticket = RateLimitTicket(self, reserved, prompt_tokens)
+        except BaseException:
+            self.slots.release()
+            raise
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return ticket
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(config_manager, provider, api_key=None):
+    """
+    获取 (提供方, API密钥) 的限流器，所有模型实例共享；每次获取时按配置更新限额
+
+    Args:
+        config_manager: 配置管理器实例
+        provider: 提供方名称，如 gpt、siliconflow
+        api_key: API密钥，不同密钥的配额分别计算
+
+    Returns:
+        RateLimiter 实例
+    """
+    def limit(name):
+        value = config_manager.get_int_config('RATE_LIMITS', f'{provider}_{name}', -1)
+        if value < 0:
+            value = config_manager.get_int_config('RATE_LIMITS', f'default_{name}', 0)
+        return value
+
+    rpm, tpm, concurrency = limit('rpm'), limit('tpm'), limit('concurrency')
+    with _limiters_lock:
+        limiter = _limiters.get((provider, api_key))
+        if limiter is None:
+            limiter = RateLimiter(rpm, tpm, concurrency)
+            _limiters[(provider, api_key)] = limiter
+        else:
+            limiter.configure(rpm, tpm, concurrency)
+    return limiter
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+模型调用的重试、退避与故障转移
+
+各模型在接口返回错误状态码时抛出 ModelAPIError，ResilientModel 包装一条按顺序排列的模型链：
+可重试的错误（限流、超时、服务端错误、网络错误）按带抖动的指数退避重试，优先遵循 Retry-After；
+重试用尽或错误不可重试时切换到链中的下一个模型。流式生成中途失败时，用已生成的内容续写。
+"""
+
+import random
+import asyncio
+from contextlib import aclosing
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import aiohttp
+from models.ai_model import AIModel
+
+# 错误分类，键为分类标识，值为显示名称
+ERROR_KINDS = {
+    "rate_limit": "请求过于频繁",
+    "server": "服务端错误",
+    "network": "网络错误",
+    "auth": "认证失败",
+    "client": "请求错误",
+    "unknown": "未知错误"
+}
+
+# 可以重试的错误分类，其余分类直接切换到下一个模型
+RETRYABLE_KINDS = {"rate_limit", "server", "network"}
+
+# Retry-After 最多等待的秒数，超过时按该值等待
+MAX_RETRY_AFTER = 300
+
+# 流式生成中断后续写时附加的提示
+RESUME_PROMPT = "\n\n以下是你针对上述要求已经输出的内容，输出在此处中断：\n\n{partial}\n\n请从中断处直接继续输出，不要重复已输出的内容，也不要添加任何说明。"
+
+
+class ModelAPIError(Exception):
+    """模型接口返回错误状态码时抛出的异常"""
+
+    def __init__(self, status, message, retry_after=None, provider=None):
+        """
+        初始化异常
+
+        Args:
+            status: HTTP状态码
+            message: 错误信息
+            retry_after: 响应头 Retry-After 的原始值
+            provider: 提供方名称，用于错误信息
+        """
+        if provider:
+            super().__init__(f"{provider} API错误: {status} - {message}")
+        else:
+            super().__init__(f"API请求失败: {status}, {message}")
+        self.status = status
+        self.retry_after = parse_retry_after(retry_after)
+
+    @property
+    def kind(self):
+        """错误分类，见 ERROR_KINDS"""
+        return _kind_for_status(self.status)
+
+    @property
+    def retryable(self):
+        """限流、超时和服务端错误可以重试，其余客户端错误重试也不会成功"""
+        return self.kind in RETRYABLE_KINDS
+
+
+def parse_retry_after(value):
+    """
+    解析 Retry-After 响应头
+
+    Args:
+        value: 秒数或 HTTP 日期字符串，可以为None
+
+    Returns:
+        需要等待的秒数，无法解析时返回None
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        when = parsedate_to_datetime(str(value))
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def classify_error(error):
+    """
+    对模型调用的异常分类，沿异常链查找状态码，兼容 SDK 抛出的异常和被包装过的异常
+
+    Args:
+        error: 异常对象
+
+    Returns:
+        (分类, Retry-After 秒数或None)
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, ModelAPIError):
+            return error.kind, error.retry_after
+
+        # OpenAI SDK 的 status_code、aiohttp 的 status、Gemini SDK 的 code
+        status = getattr(error, "status_code", None) or getattr(error, "status", None) or getattr(error, "code", None)
+        if isinstance(status, int) and 100 <= status < 600:
+            response = getattr(error, "response", None)
+            headers = getattr(response, "headers", None) or getattr(error, "headers", None) or {}
+            return _kind_for_status(status), parse_retry_after(headers.get("Retry-After"))
+        if isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError)):
+            return "network", None
+        if type(error).__name__ in ("APIConnectionError", "APITimeoutError"):
+            return "network", None
+
+        error = error.__cause__ or error.__context__
+    return "unknown", None
+
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=30.0, retry_after=None):
+    """
+    计算重试前的等待时间
+
+    Args:
+        attempt: 已重试的次数，从0开始
+        base_delay: 第一次重试的基准等待秒数
+        max_delay: 指数退避的等待上限
+        retry_after: 服务端要求的等待秒数，存在时优先遵循
+
+    Returns:
+        等待秒数
+    """
+    if retry_after is not None:
+        # 多个请求同时被限流时加少量抖动，避免同时重试
+        return min(retry_after, MAX_RETRY_AFTER) + random.uniform(0, base_delay)
+    delay = min(max_delay, base_delay * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+
+def _kind_for_status(status):
+    """按HTTP状态码分类"""
+    if status == 429:
+        return "rate_limit"
+    if status in (408, 409, 425):
+        return "network"
+    if status in (401, 403):
+        return "auth"
+    if status >= 500:
+        return "server"
+    if status >= 400:
+        return "client"
+    return "unknown"
+
+
+class ResilientModel(AIModel):
+    """
+    带重试和故障转移的模型包装，接口与 AIModel 一致，未定义的属性转发给首选模型
+    """
+
+    # 每次尝试都经过被包装模型自身的限流器和响应缓存，包装层不再重复处理
+    rate_limited = False
+    response_cached = False
+
+    def __init__(self, config_manager, models):
+        """
+        初始化模型包装
+
+        Args:
+            config_manager: 配置管理器实例
+            models: (模型类型, 模型实例) 列表，第一个为首选模型，其余按顺序作为故障转移的备选
+        """
+        super().__init__(config_manager)
+        self.models = list(models)
+        self.max_retries = config_manager.get_int_config('RESILIENCE', 'max_retries', 3)
+        self.base_delay = config_manager.get_float_config('RESILIENCE', 'base_delay', 1.0)
+        self.max_delay = config_manager.get_float_config('RESILIENCE', 'max_delay', 30.0)
+        self.resume_stream = config_manager.get_config('RESILIENCE', 'resume_stream', 'true').lower() == 'true'
+
+    def __getattr__(self, name):
+        # 只有实例和类上都找不到的属性才会到这里，如 model_name、api_url
+        models = self.__dict__.get("models")
+        if not models:
+            raise AttributeError(name)
+        return getattr(models[0][1], name)
+
+    async def generate(self, prompt, callback=None):
+        """
+        生成文本（非流式），失败时重试或切换到下一个模型
+
+        Args:
+            prompt: 提示词
+            callback: 回调函数，用于处理生成的文本块
+
+        Returns:
+            生成的文本
+        """
+        last_error = None
+        for position, (model_type, model) in enumerate(self.models):
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return await model.generate(prompt, callback)
+                except Exception as e:
+                    last_error = e
+                    if not await self._wait_before_retry(model_type, e, attempt):
+                        break
+            self._report_failover(position, model_type, last_error)
+        raise last_error
+
+    async def generate_stream(self, prompt, callback=None):
+        """
+        流式生成文本，失败时重试或切换到下一个模型；已输出部分内容时以续写的方式继续
+
+        Args:
+            prompt: 提示词
+            callback: 回调函数，用于处理生成的文本块
+
+        Returns:
+            生成的文本流（异步生成器）
+        """
+        produced = []
+        last_error = None
+        for position, (model_type, model) in enumerate(self.models):
+            attempt = 0
+            while True:
+                request_prompt = prompt
+                if produced:
+                    request_prompt = prompt + RESUME_PROMPT.format(partial="".join(produced))
+                try:
+                    async with aclosing(model.generate_stream(request_prompt, callback)) as stream:
+                        async for chunk in stream:
+                            produced.append(chunk)
+                            yield chunk
+                    return
+                except Exception as e:
+                    last_error = e
+                    if produced and not self.resume_stream:
+                        raise
+                    if not await self._wait_before_retry(model_type, e, attempt):
+                        break
+                    attempt += 1
+            self._report_failover(position, model_type, last_error)
+        raise last_error
+
+    async def _wait_before_retry(self, model_type, error, attempt):
+        """
+        判断是否重试，需要重试时等待退避时间
+
+        Args:
+            model_type: 模型类型
+            error: 本次失败的异常
+            attempt: 已重试的次数
+
+        Returns:
+            是否重试同一模型
+        """
+        kind, retry_after = classify_error(error)
+        if kind not in RETRYABLE_KINDS or attempt >= self.max_retries:
+            return False
+        delay = backoff_delay(attempt, self.base_delay, self.max_delay, retry_after)
+        print(f"{model_type} 请求失败（{ERROR_KINDS[kind]}），{delay:.1f} 秒后第 {attempt + 1} 次重试: {error}")
+        await asyncio.sleep(delay)
+        return True
+
+    def _report_failover(self, position, model_type, error):
+        """输出切换到下一个模型的提示"""
+        if position + 1 < len(self.models):
+            print(f"{model_type} 调用失败，切换到 {self.models[position + 1][0]}: {error}")
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+模型响应的持久化缓存
+
+按 (提供方, 模型名称, 接口地址, 消息, 采样参数, 是否流式) 的哈希寻址，存放在单个 SQLite 文件中。
+缓存总大小超过上限时按最近访问时间淘汰最久未用的条目，超过有效期的条目在读取和写入时清理。
+流式生成只在完整结束后写入，命中时按原来的分块重放，调用方看到的文本流与真实生成一致。
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+
+class ResponseCache:
+    """
+    SQLite 中的模型响应缓存，线程安全，可被所有模型共享
+    """
+
+    def __init__(self, path, max_size_mb=200, ttl_hours=168):
+        """
+        初始化响应缓存
+
+        Args:
+            path: SQLite 文件路径
+            max_size_mb: 缓存内容的总大小上限（MB），0 表示不限制
+            ttl_hours: 条目的有效期（小时），0 表示永不过期
+        """
+        self.path = path
+        self.max_size = 0
+        self.ttl = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.configure(max_size_mb, ttl_hours)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                provider TEXT,
+                model_name TEXT,
+                chunks TEXT NOT NULL,
+                callback_used INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def configure(self, max_size_mb, ttl_hours):
+        """
+        修改大小上限和有效期，下一次写入时生效
+
+        Args:
+            max_size_mb: 缓存内容的总大小上限（MB），0 表示不限制
+            ttl_hours: 条目的有效期（小时），0 表示永不过期
+        """
+        self.max_size = int(max(0, max_size_mb) * 1024 * 1024)
+        self.ttl = max(0, ttl_hours) * 3600
+
+    @staticmethod
+    def key(provider, model_name, api_url, prompt, params=None, stream=False):
+        """
+        计算请求的缓存键
+
+        Args:
+            provider: 提供方名称
+            model_name: 模型名称
+            api_url: 接口地址，同名模型部署在不同地址时互不共享
+            prompt: 提示词
+            params: 采样参数，如 temperature、max_tokens
+            stream: 是否流式生成；部分模型流式时还会输出思考过程，两种方式的结果分别缓存
+
+        Returns:
+            十六进制哈希字符串
+        """
+        request = {
+            "provider": provider,
+            "model_name": model_name,
+            "api_url": api_url,
+            "messages": [{"role": "user", "content": prompt}],
+            "params": params or {},
+            "stream": bool(stream)
+        }
+        payload = json.dumps(request, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        查询缓存，命中时刷新访问时间
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            (文本块列表, 生成时是否调用过回调)，未命中或已过期时返回None
+        """
+        now = time.time()
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT chunks, callback_used, size, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and self.ttl and row[3] < now - self.ttl:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._size -= row[2]
+                    self._conn.commit()
+                    row = None
+                if row is None:
+                    self.misses += 1
+                    return None
+                self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                self.hits += 1
+                return json.loads(row[0]), bool(row[1])
+            except (sqlite3.Error, ValueError) as e:
+                print(f"读取响应缓存出错: {e}")
+                return None
+
+    def put(self, key, chunks, callback_used=False, provider=None, model_name=None):
+        """
+        写入缓存，之后淘汰过期条目和超出大小上限的最久未用条目
+
+        Args:
+            key: 缓存键
+            chunks: 文本块列表，非流式生成为只有一个元素的列表
+            callback_used: 生成时是否调用过回调，重放时保持一致
+            provider: 提供方名称，仅用于统计
+            model_name: 模型名称，仅用于统计
+        """
+        payload = json.dumps(chunks, ensure_ascii=False)
+        size = len(payload.encode("utf-8"))
+        if self.max_size and size > self.max_size:
+            return
+
+        now = time.time()
+        with self._lock:
+            try:
+                old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, provider, model_name, payload, int(bool(callback_used)), size, now, now)
+                )
+                self._size += size - (old[0] if old else 0)
+                self._evict(now)
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"写入响应缓存出错: {e}")
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            try:
+                self._conn.execute("DELETE FROM responses")
+                self._conn.commit()
+                self._size = 0
+            except sqlite3.Error as e:
+                print(f"清空响应缓存出错: {e}")
+
+    def stats(self):
+        """
+        获取缓存统计信息
+
+        Returns:
+            统计信息字典
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return {
+                "path": self.path,
+                "entries": entries,
+                "size": self._size,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+    def _evict(self, now):
+        """删除过期条目，再按访问时间从旧到新删除，直到总大小不超过上限"""
+        if self.ttl:
+            expired = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses WHERE created < ?", (now - self.ttl,)
+            ).fetchone()[0]
+            if expired:
+                self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+                self._size -= expired
+
+        while self.max_size and self._size > self.max_size:
+            rows = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._size = 0
+                break
+            for key, size in rows:
+                if self._size <= self.max_size:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._size -= size
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(config_manager):
+    """
+    按配置获取共享的响应缓存，未启用时返回None；同一文件在进程内只打开一次
+
+    Args:
+        config_manager: 配置管理器实例
+
+    Returns:
+        ResponseCache 实例或None
+    """
+    if config_manager.get_config('RESPONSE_CACHE', 'enabled', 'false').lower() != 'true':
+        return None
+
+    path = config_manager.get_config('RESPONSE_CACHE', 'path', 'response_cache.db')
+    max_size_mb = config_manager.get_float_config('RESPONSE_CACHE', 'max_size_mb', 200)
+    ttl_hours = config_manager.get_float_config('RESPONSE_CACHE', 'ttl_hours', 168)
+    with _caches_lock:
+        cache = _caches.get(os.path.abspath(path))
+        if cache is None:
+            try:
+                cache = ResponseCache(path, max_size_mb, ttl_hours)
+            except (sqlite3.Error, OSError) as e:
+                print(f"打开响应缓存出错: {e}")
+                return None
+            _caches[os.path.abspath(path)] = cache
+        else:
+            cache.configure(max_size_mb, ttl_hours)
+        return cache
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+同步迭代器到异步迭代器的桥接
+
+ModelScope（OpenAI SDK）和 Gemini SDK 的流式接口都是同步迭代器，直接在协程中迭代会在整个生成期间
+阻塞事件循环。这里在独立的工作线程中创建并迭代同步迭代器，元素经 asyncio 队列交给事件循环，
+事件循环在等待下一个元素时可以继续处理其他任务。
+"""
+
+import asyncio
+import threading
+
+# 迭代结束的标记
+_DONE = object()
+
+
+async def iterate_in_thread(factory, *args, buffer_size=64, **kwargs):
+    """
+    在工作线程中调用 factory(*args, **kwargs) 并迭代其结果，以异步生成器的形式逐个产出元素
+
+    创建流的调用（如发送请求）同样在工作线程中执行。工作线程最多领先消费方 buffer_size 个元素，
+    消费方提前结束或被取消时，工作线程在取得下一个元素后停止并关闭同步迭代器。
+
+    Args:
+        factory: 返回同步可迭代对象的函数
+        *args: factory 的位置参数
+        buffer_size: 队列中最多缓存的元素数
+        **kwargs: factory 的关键字参数
+
+    Yields:
+        同步迭代器产出的元素；工作线程中的异常在消费方重新抛出
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    slots = threading.Semaphore(buffer_size)
+    stopped = threading.Event()
+
+    def deliver(item, error=None):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+        except RuntimeError:
+            # 消费方的事件循环已关闭
+            stopped.set()
+
+    def pump():
+        iterator = None
+        try:
+            iterator = iter(factory(*args, **kwargs))
+            for item in iterator:
+                slots.acquire()
+                if stopped.is_set():
+                    break
+                deliver(item)
+            else:
+                deliver(_DONE)
+        except Exception as e:
+            deliver(_DONE, e)
+        finally:
+            close = getattr(iterator, "close", None)
+            if stopped.is_set() and close is not None:
+                try:
+                    close()
+                except Exception:
+                    pass
+
+    # 不使用默认线程池，长时间的流式生成不会占用 asyncio.to_thread 的工作线程
+    threading.Thread(target=pump, name="stream-bridge", daemon=True).start()
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            slots.release()
+            yield item
+    finally:
+        stopped.set()
+        slots.release()
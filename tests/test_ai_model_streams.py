@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+from models.ai_model import AIModel
+from models.rate_limiter import get_rate_limiter
+from models.response_cache import get_response_cache
+
+
+class _Config:
+    """只提供模型基类用到的配置项"""
+
+    def __init__(self, values=None):
+        self.values = values or {}
+
+    def get_config(self, section, key, default=''):
+        return self.values.get((section, key), default)
+
+    def get_int_config(self, section, key, default=0):
+        return int(self.values.get((section, key), default))
+
+    def get_float_config(self, section, key, default=0.0):
+        return float(self.values.get((section, key), default))
+
+    def get_proxy_settings(self):
+        return {}
+
+
+class _StreamModel(AIModel):
+    provider = "test_stream"
+
+    def __init__(self, config_manager):
+        super().__init__(config_manager)
+        self.api_key = "key"
+        self.closed = False
+
+    async def generate(self, prompt, callback=None):
+        if callback:
+            callback(prompt)
+        return prompt
+
+    async def generate_stream(self, prompt, callback=None):
+        try:
+            for chunk in ("a", "b", "c"):
+                await asyncio.sleep(0)
+                yield chunk
+        finally:
+            self.closed = True
+
+
+def test_closing_stream_early_releases_concurrency_slot():
+    config = _Config({("RATE_LIMITS", "test_stream_concurrency"): 1})
+    model = _StreamModel(config)
+    limiter = get_rate_limiter(config, model.provider, model.api_key)
+
+    async def consume_one():
+        stream = model.generate_stream("prompt")
+        assert await stream.__anext__() == "a"
+        assert limiter.slots.active == 1
+        await stream.aclose()
+        # 不依赖事件循环结束时对未关闭生成器的清理
+        assert model.closed
+        assert limiter.slots.active == 0
+
+    asyncio.run(consume_one())
+
+
+def test_closing_cached_stream_early_releases_concurrency_slot(tmp_path):
+    config = _Config({
+        ("RATE_LIMITS", "test_stream_concurrency"): 1,
+        ("RESPONSE_CACHE", "enabled"): "true",
+        ("RESPONSE_CACHE", "path"): str(tmp_path / "responses.db")
+    })
+    model = _StreamModel(config)
+    limiter = get_rate_limiter(config, model.provider, model.api_key)
+
+    async def consume_one():
+        stream = model.generate_stream("cached prompt")
+        assert await stream.__anext__() == "a"
+        await stream.aclose()
+        assert model.closed
+        assert limiter.slots.active == 0
+
+    asyncio.run(consume_one())
+
+
+def test_cache_hit_calls_callback_like_a_miss(tmp_path):
+    config = _Config({
+        ("RESPONSE_CACHE", "enabled"): "true",
+        ("RESPONSE_CACHE", "path"): str(tmp_path / "responses.db")
+    })
+    model = _StreamModel(config)
+    received = []
+
+    assert asyncio.run(model.generate("hello", received.append)) == "hello"
+    assert asyncio.run(model.generate("hello", received.append)) == "hello"
+    assert received == ["hello", "hello"]
+    assert get_response_cache(config).stats()["hits"] == 1
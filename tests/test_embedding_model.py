@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import numpy as np
+from embedding_models.embedding_model import EmbeddingModel
+
+
+class _Config:
+    """只提供嵌入模型基类用到的配置项"""
+
+    def __init__(self, values=None):
+        self.values = values or {}
+
+    def get_config(self, section, key, default=''):
+        return self.values.get((section, key), default)
+
+    def get_int_config(self, section, key, default=0):
+        return int(self.values.get((section, key), default))
+
+    def get_proxy_settings(self):
+        return {}
+
+
+class _CountingEmbedding(EmbeddingModel):
+    def __init__(self, config_manager):
+        super().__init__(config_manager)
+        self.model_name = "test-counting"
+        self.requested = []
+
+    async def _embed_uncached(self, texts):
+        self.requested.extend(texts)
+        return np.array([[len(text), 1.0] for text in texts], dtype='float32')
+
+    async def _request_embeddings(self, session, texts):
+        return await self._embed_uncached(texts)
+
+
+def test_query_embeddings_are_not_written_to_the_cache(tmp_path):
+    model = _CountingEmbedding(_Config({("EMBEDDING_CACHE", "path"): str(tmp_path / "cache")}))
+
+    asyncio.run(model.embed_batch(["文档一", "文档二"]))
+    asyncio.run(model.embed("查询"))
+    asyncio.run(model.embed("查询"))
+    asyncio.run(model.embed("文档一"))
+
+    assert model.cache_stats()["entries"] == 2
+    # 查询文本每次都重新请求，与文档相同的查询命中缓存
+    assert model.requested == ["文档一", "文档二", "查询", "查询"]
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import numpy as np
+import pytest
+from embedding_models.local_embedding import LocalEmbedding
+from utils.knowledge_base_manager import KnowledgeBaseManager, EmbeddingMismatchError
+from utils.text_processor import TextProcessor
+
+
+class _Config:
+    """只提供知识库管理器和本地嵌入模型用到的配置项"""
+
+    def __init__(self, values=None):
+        self.values = values or {}
+
+    def get_config(self, section, key, default=''):
+        return self.values.get((section, key), default)
+
+    def get_int_config(self, section, key, default=0):
+        return int(self.values.get((section, key), default))
+
+    def get_float_config(self, section, key, default=0.0):
+        return float(self.values.get((section, key), default))
+
+    def get_proxy_settings(self):
+        return {}
+
+
+def _manager(dimension):
+    config = _Config({("EMBEDDING_MODELS", "local_embedding_dimension"): dimension})
+    manager = KnowledgeBaseManager(config, LocalEmbedding(config))
+    manager.register_processor(TextProcessor())
+    return manager
+
+
+def _build(manager, tmp_path, kb_name="kb"):
+    doc = tmp_path / "doc.txt"
+    doc.write_text("".join(f"第{i}段讲述了山川与河流。\n\n" for i in range(400)), encoding="utf-8")
+    assert asyncio.run(manager.create_knowledge_base(kb_name, [str(doc)], chunk_size=100, chunk_overlap=20))
+
+
+def test_query_with_a_different_embedding_model_raises(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _build(_manager(32), tmp_path)
+
+    _, metadata = _manager(32).vector_store.load_index("kb")
+    assert metadata["embedding_model_name"] == "local-hash-32"
+    assert metadata["embedding_dimension"] == 32
+    assert asyncio.run(_manager(32).query("kb", "山川", mode="vector"))
+
+    with pytest.raises(EmbeddingMismatchError):
+        asyncio.run(_manager(64).query("kb", "山川", mode="vector"))
+    with pytest.raises(EmbeddingMismatchError):
+        asyncio.run(_manager(64).add_documents("kb", [str(tmp_path / "doc.txt")]))
+    # 关键词检索不使用向量，不受嵌入模型影响
+    assert asyncio.run(_manager(64).query("kb", "山川", mode="keyword"))
+
+
+def test_federated_query_rejects_knowledge_bases_built_with_different_models(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _build(_manager(32), tmp_path, "small")
+    _build(_manager(64), tmp_path, "large")
+
+    calls = []
+    manager = _manager(32)
+    embed_batch = manager.embedding_model.embed_batch
+
+    async def counting_embed_batch(texts, store=True):
+        calls.append(len(texts))
+        return await embed_batch(texts, store)
+
+    manager.embedding_model.embed_batch = counting_embed_batch
+    with pytest.raises(EmbeddingMismatchError):
+        asyncio.run(manager.query_federated(["small", "large"], "山川", mode="vector"))
+    # 拒绝发生在嵌入查询文本之前
+    assert calls == []
+
+    results = asyncio.run(manager.query_federated(["small"], "山川", mode="vector"))
+    assert results and calls == [1]
+    assert asyncio.run(manager.query_federated(["small", "large"], "山川", mode="keyword"))
+
+
+def test_benchmark_uses_held_out_queries_from_a_bounded_sample(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manager = _manager(32)
+    _build(manager, tmp_path)
+
+    sampled = []
+    sample_vectors = manager.vector_store.sample_vectors
+
+    def recording_sample_vectors(kb_name, sample_size, seed=0):
+        vectors = sample_vectors(kb_name, sample_size, seed)
+        sampled.append(len(vectors))
+        return vectors
+
+    manager.vector_store.sample_vectors = recording_sample_vectors
+    manager.config_manager.values[("KNOWLEDGE_BASE", "benchmark_sample_size")] = 20
+    results, _ = manager.benchmark_index_types("kb", ["flat"], num_queries=5, top_k=3)
+
+    assert sampled == [20]
+    # 查询向量不在索引中：精确检索的召回率仍为1，但不是因为命中自身
+    assert results[0]["recall"] == 1.0
+
+
+def test_training_sample_is_drawn_from_all_chunks(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manager = _manager(32)
+    manager.config_manager.values[("KNOWLEDGE_BASE", "train_sample_size")] = 10
+
+    trained = []
+    train_index = manager.vector_store.train_index
+
+    def recording_train_index(index, vectors, sample_size=100000):
+        trained.append(np.array(vectors))
+        return train_index(index, vectors, sample_size)
+
+    manager.vector_store.train_index = recording_train_index
+    doc = tmp_path / "doc.txt"
+    doc.write_text("".join(f"第{i}段讲述了山川与河流。\n\n" for i in range(400)), encoding="utf-8")
+    assert asyncio.run(manager.create_knowledge_base("kb", [str(doc)], chunk_size=100, chunk_overlap=20,
+                                                     index_params={"storage": "sq8"}))
+
+    texts = [text for _, text in manager.vector_store.open_chunk_store("kb").iter_chunks()]
+    embedded = asyncio.run(manager.embedding_model.embed_batch(texts))
+    rows = [int(np.argmin(((embedded - vector) ** 2).sum(axis=1))) for vector in trained[0]]
+    assert len(rows) == 10
+    # 样本不只来自最先处理的文本块
+    assert max(rows) >= 10
+    assert manager.vector_store.load_index("kb")[0].ntotal == len(texts)
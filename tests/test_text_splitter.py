@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import math
+import random
+from utils.text_splitter import TextSplitter
+
+
+def _corpus(paragraphs=600, seed=0):
+    """生成固定的中文语料：每段2~12句，每句8~90字"""
+    rng = random.Random(seed)
+    chars = [chr(code) for code in range(0x4e00, 0x4e00 + 2000)]
+    result = []
+    for _ in range(paragraphs):
+        sentences = ["".join(rng.choice(chars) for _ in range(rng.randint(8, 90))) + rng.choice("。！？")
+                     for _ in range(rng.randint(2, 12))]
+        result.append("".join(sentences))
+    return "\n\n".join(result)
+
+
+def test_chunk_count_not_above_fixed_window_baseline():
+    text = _corpus()
+    for chunk_size, chunk_overlap in [(1000, 200), (500, 100), (300, 50)]:
+        chunks = TextSplitter(chunk_size, chunk_overlap).split(text)
+        # 原来的固定窗口分块每次前进 chunk_size - chunk_overlap 个字符
+        baseline = math.ceil(len(text) / (chunk_size - chunk_overlap))
+        assert len(chunks) <= baseline
+        assert max(len(chunk) for chunk in chunks) <= chunk_size
+
+
+def test_overlap_is_at_most_one_trailing_sentence():
+    text = _corpus(paragraphs=50)
+    splitter = TextSplitter(1000, 200)
+    spans = splitter.split_spans(text)
+    for (_, previous_end), (start, _) in zip(spans, spans[1:]):
+        overlap = max(0, previous_end - start)
+        assert overlap <= 200
+        # 重叠部分内不含句末标点之外的句子边界，即最多一句
+        assert sum(text[start:previous_end].count(mark) for mark in "。！？") <= 1
@@ -7,6 +7,7 @@ UI组件模块
 提供通用的UI组件，用于减少重复代码和统一界面风格。
 """
 
+import re
 import json
 import asyncio
 from PyQt6.QtWidgets import (
@@ -24,7 +25,8 @@ from utils.config_manager import ConfigManager
 
 from utils.async_utils import GenerationThread, ProgressIndicator, AsyncHelper
 from ui.styles import get_style
-from utils.knowledge_base_manager import KnowledgeBaseManager 
+from utils.knowledge_base_manager import KnowledgeBaseManager, QUERY_MODES
+from utils.result_ranker import RERANKERS 
 
 
 class AIGenerateDialog(QDialog):
@@ -420,10 +422,19 @@ class AIGenerateDialog(QDialog):
             self.kb_select_combo.addItem("无可用知识库")
             self.kb_select_combo.setEnabled(False)
         kb_controls_layout.addRow("选择知识库:", self.kb_select_combo)
+
+        self.kb_search_all_checkbox = QCheckBox("同时搜索全部知识库")
+        self.kb_search_all_checkbox.setToolTip("在所有知识库中联合查询，按相似度合并结果")
+        self.kb_search_all_checkbox.toggled.connect(
+            lambda checked: self.kb_select_combo.setEnabled(not checked and self.enable_kb_checkbox.isChecked()
+                                                            and bool(self.available_knowledge_bases))
+        )
+        kb_controls_layout.addRow("", self.kb_search_all_checkbox)
  
         # 查询关键词输入和快速查询按钮的水平布局
         kb_query_input_layout = QHBoxLayout() # 新增：用于放置查询输入和快速查询按钮
         self.kb_query_edit = QLineEdit() # 原来的 self.kb_query_input
+        self.kb_query_edit.setPlaceholderText("多个关键词可用分号分隔，合并为一次查询")
         kb_query_input_layout.addWidget(self.kb_query_edit)
 
         # 新增：“快速查询”按钮
@@ -433,11 +444,35 @@ class AIGenerateDialog(QDialog):
         kb_query_input_layout.addWidget(self.kb_quick_query_button)
         kb_controls_layout.addRow("查询关键词:", kb_query_input_layout) # 将整个水平布局添加到FormLayout
 
+        self.kb_query_mode_combo = QComboBox()
+        for mode, mode_name in QUERY_MODES.items():
+            self.kb_query_mode_combo.addItem(mode_name, mode)
+        default_mode = self.config_manager.get_config('KNOWLEDGE_BASE', 'query_mode', 'vector') if self.config_manager else 'vector'
+        self.kb_query_mode_combo.setCurrentIndex(max(0, self.kb_query_mode_combo.findData(default_mode)))
+        self.kb_query_mode_combo.setToolTip("关键词检索适合人名、地名等专有名词，不调用嵌入接口")
+        kb_controls_layout.addRow("检索方式:", self.kb_query_mode_combo)
+
         self.kb_results_count_spinbox = QSpinBox()
         self.kb_results_count_spinbox.setMinimum(1)
         self.kb_results_count_spinbox.setMaximum(20) 
         self.kb_results_count_spinbox.setValue(5)   # 默认返回5条
         kb_controls_layout.addRow("返回结果数量:", self.kb_results_count_spinbox)
+
+        self.kb_reranker_combo = QComboBox()
+        for reranker, reranker_name in RERANKERS.items():
+            self.kb_reranker_combo.addItem(reranker_name, reranker)
+        default_reranker = self.config_manager.get_config('KNOWLEDGE_BASE', 'reranker', 'none') if self.config_manager else 'none'
+        self.kb_reranker_combo.setCurrentIndex(max(0, self.kb_reranker_combo.findData(default_reranker)))
+        self.kb_reranker_combo.setToolTip("关键词重排在本地按查询词对候选重新打分，不调用任何接口")
+        kb_controls_layout.addRow("结果重排:", self.kb_reranker_combo)
+
+        self.kb_token_budget_spinbox = QSpinBox()
+        self.kb_token_budget_spinbox.setRange(0, 32000)
+        self.kb_token_budget_spinbox.setSingleStep(500)
+        self.kb_token_budget_spinbox.setSpecialValueText("按数量")
+        self.kb_token_budget_spinbox.setValue(self.config_manager.get_int_config('KNOWLEDGE_BASE', 'token_budget', 0) if self.config_manager else 0)
+        self.kb_token_budget_spinbox.setToolTip("按估算的token数装入结果，代替固定的结果数量；0 表示按返回结果数量截取")
+        kb_controls_layout.addRow("结果token预算:", self.kb_token_budget_spinbox)
         kb_layout.addLayout(kb_controls_layout)
  
         self.kb_query_button = QPushButton("查询知识库")
@@ -985,11 +1020,16 @@ class AIGenerateDialog(QDialog):
     def _on_toggle_knowledge_base(self, is_enabled: bool):
         """根据复选框状态控制知识库相关UI的显隐和可用性"""
         # 这些控件应该一直可见，但根据is_enabled来启用/禁用
-        self.kb_select_combo.setEnabled(is_enabled and bool(self.available_knowledge_bases) and self.available_knowledge_bases[0] != "无可用知识库")
+        self.kb_select_combo.setEnabled(is_enabled and bool(self.available_knowledge_bases) and self.available_knowledge_bases[0] != "无可用知识库"
+                                        and not self.kb_search_all_checkbox.isChecked())
+        self.kb_search_all_checkbox.setEnabled(is_enabled and len(self.available_knowledge_bases) > 1)
         self.kb_query_edit.setEnabled(is_enabled)
         # “快速查询”按钮的可用性也由复选框控制
         self.kb_quick_query_button.setEnabled(is_enabled)
+        self.kb_query_mode_combo.setEnabled(is_enabled)
         self.kb_results_count_spinbox.setEnabled(is_enabled)
+        self.kb_reranker_combo.setEnabled(is_enabled)
+        self.kb_token_budget_spinbox.setEnabled(is_enabled)
         self.kb_query_button.setEnabled(is_enabled)
 
         # 这些控件的可见性也受is_enabled控制
@@ -1038,13 +1078,32 @@ class AIGenerateDialog(QDialog):
         self.kb_query_button.setEnabled(False) # 查询期间禁用按钮
         self.progress_bar.setVisible(True) # 显示主进度条
  
+        # 多个关键词用分号分隔时合并为一次批量查询
+        queries = [q.strip() for q in re.split(r'[;；]', query_text) if q.strip()]
+        select_options = {"mode": self.kb_query_mode_combo.currentData(),
+                          "token_budget": self.kb_token_budget_spinbox.value(),
+                          "reranker": self.kb_reranker_combo.currentData()}
+
         # 使用类似GenerationThread的方式进行异步查询
         # 注意：KnowledgeBaseManager.query()本身可能是阻塞的，所以放入线程
-        self.kb_query_thread = GenerationThread(
-            self.knowledge_base_manager.query, # 传递方法本身
-            (kb_name, query_text, top_k),      # 参数元组
-            {}                                 # 关键字参数字典
-        )
+        if self.kb_search_all_checkbox.isChecked():
+            self.kb_query_thread = GenerationThread(
+                self.knowledge_base_manager.query_federated,
+                (self.available_knowledge_bases, query_text, top_k),
+                select_options
+            )
+        elif len(queries) > 1:
+            self.kb_query_thread = GenerationThread(
+                self.knowledge_base_manager.query_many,
+                (kb_name, queries, top_k),
+                select_options
+            )
+        else:
+            self.kb_query_thread = GenerationThread(
+                self.knowledge_base_manager.query, # 传递方法本身
+                (kb_name, query_text, top_k),      # 参数元组
+                select_options                     # 关键字参数字典
+            )
         self.kb_query_thread.finished_signal.connect(self._on_kb_query_finished)
         self.kb_query_thread.error_signal.connect(self._on_kb_query_error)
         self.kb_query_thread.start()
@@ -1068,7 +1127,10 @@ class AIGenerateDialog(QDialog):
             # 为了简单，按钮文本可以是 "结果 N (相关度: X.XX)"
             # 实际内容存储在按钮的属性中
             summary = doc_content[:50] + "..." if len(doc_content) > 50 else doc_content # 简单摘要
-            btn_text = f"片段{i+1} (相关度: {score:.2f})\n{summary}"
+            page_text = f" 第{result_item['page']}页" if result_item.get('page') is not None else ""
+            btn_text = f"片段{i+1}{page_text} (相关度: {score:.2f})\n{summary}"
+            if result_item.get('kb_name'):
+                btn_text = f"[{result_item['kb_name']}] {btn_text}"
             result_button = QPushButton(btn_text)
             # 确保按钮是可勾选的，这样才能被选中！
             result_button.setCheckable(True)
@@ -5,21 +5,29 @@ from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
     QTextEdit, QPushButton, QComboBox, QGroupBox, QFormLayout,
     QSpinBox, QDoubleSpinBox, QMessageBox, QSplitter, QFileDialog, QProgressBar,
-    QDialog, QInputDialog, QScrollArea, QListWidget, QTabWidget, QCheckBox
+    QDialog, QInputDialog, QScrollArea, QListWidget, QListWidgetItem, QTabWidget, QCheckBox
 )
 from PyQt6.QtCore import Qt, pyqtSignal, pyqtSlot
+from PyQt6.QtGui import QFont
 
 from utils.knowledge_base_manager import KnowledgeBaseManager
+from utils.kb_build_queue import KnowledgeBaseBuildQueue, JOB_STATUSES, BUILD_STAGES
+from utils.vector_store import INDEX_TYPES, VECTOR_STORAGE_TYPES
+from utils.text_splitter import CHUNK_UNITS
 from utils.text_processor import TextProcessor
 from utils.json_processor import JsonProcessor
 from utils.pdf_processor import PdfProcessor
 from utils.docx_processor import DocxProcessor
 from embedding_models.siliconflow_embedding import SiliconFlowEmbedding
+from embedding_models.local_embedding import LocalEmbedding
 from utils.async_utils import AsyncHelper, ProgressIndicator
 
 class KnowledgeBaseTab(QWidget):
     """知识库标签页"""
 
+    # 构建任务变化信号，从构建队列线程发出，在主线程更新任务列表
+    build_job_changed = pyqtSignal(dict)
+
     def __init__(self, main_window):
         """
         初始化知识库标签页
@@ -35,6 +43,8 @@ class KnowledgeBaseTab(QWidget):
         self.knowledge_base_manager = None
         self.embedding_model = None
         self.active_threads = []
+        self.build_queue = None
+        self.build_jobs = {}  # 任务ID -> 最新的任务信息
 
         # 初始化UI
         self._init_ui()
@@ -42,6 +52,15 @@ class KnowledgeBaseTab(QWidget):
         # 初始化嵌入模型和知识库管理器
         self._init_embedding_model()
 
+        # 启动构建队列，上次未完成的任务从断点继续
+        self.build_job_changed.connect(self._on_build_job_changed)
+        if self.knowledge_base_manager is not None:
+            self.build_queue = KnowledgeBaseBuildQueue(self.knowledge_base_manager, self.config_manager,
+                                                       listener=self.build_job_changed.emit)
+            self.build_queue.start()
+            for job in self.build_queue.jobs():
+                self._on_build_job_changed(job)
+
     def closeEvent(self, event):
         """
         关闭事件处理
@@ -57,6 +76,10 @@ class KnowledgeBaseTab(QWidget):
         # 清空线程列表
         self.active_threads.clear()
 
+        # 停止构建队列，未完成的任务保留断点
+        if self.build_queue is not None:
+            self.build_queue.stop()
+
         # 调用父类方法
         super().closeEvent(event)
 
@@ -98,14 +121,25 @@ class KnowledgeBaseTab(QWidget):
 
         # 嵌入模型选择
         self.embedding_model_combo = QComboBox()
-        self.embedding_model_combo.addItem("SiliconFlow")
+        self.embedding_model_combo.addItem("SiliconFlow", "siliconflow")
+        self.embedding_model_combo.addItem("本地（离线）", "local")
+        self.embedding_model_combo.setCurrentIndex(max(0, self.embedding_model_combo.findData(self._embedding_provider())))
+        self.embedding_model_combo.currentIndexChanged.connect(
+            lambda: self.embedding_model_name.setEnabled(self.embedding_model_combo.currentData() != "local")
+        )
         model_layout.addRow("嵌入模型:", self.embedding_model_combo)
 
         # 嵌入模型名称
         self.embedding_model_name = QLineEdit()
         self.embedding_model_name.setText(self.config_manager.get_embedding_model_name('siliconflow') or "BAAI/bge-m3")
+        self.embedding_model_name.setEnabled(self.embedding_model_combo.currentData() != "local")
         model_layout.addRow("模型名称:", self.embedding_model_name)
 
+        # 当前实际使用的嵌入模型，自动选择退回本地模型时给出提示
+        self.embedding_status_label = QLabel()
+        self.embedding_status_label.setWordWrap(True)
+        model_layout.addRow("当前使用:", self.embedding_status_label)
+
         # 保存设置按钮
         self.save_model_button = QPushButton("保存设置")
         self.save_model_button.clicked.connect(self._save_model_settings)
@@ -137,6 +171,13 @@ class KnowledgeBaseTab(QWidget):
         self.delete_kb_button.setEnabled(False)
         kb_buttons_layout.addWidget(self.delete_kb_button)
 
+        # 评估索引类型按钮
+        self.benchmark_kb_button = QPushButton("评估索引类型")
+        self.benchmark_kb_button.setToolTip("在选中知识库上比较各索引类型的召回率和查询延迟")
+        self.benchmark_kb_button.clicked.connect(self._benchmark_kb)
+        self.benchmark_kb_button.setEnabled(False)
+        kb_buttons_layout.addWidget(self.benchmark_kb_button)
+
         kb_list_layout.addLayout(kb_buttons_layout)
         kb_list_group.setLayout(kb_list_layout)
         layout.addWidget(kb_list_group)
@@ -161,6 +202,40 @@ class KnowledgeBaseTab(QWidget):
         self.chunk_overlap_spin.setValue(200)
         new_kb_layout.addRow("文本块重叠大小:", self.chunk_overlap_spin)
 
+        # 文本块大小单位
+        self.chunk_unit_combo = QComboBox()
+        for chunk_unit, display_name in CHUNK_UNITS.items():
+            self.chunk_unit_combo.addItem(display_name, chunk_unit)
+        default_chunk_unit = self.config_manager.get_config('KNOWLEDGE_BASE', 'chunk_unit', 'char')
+        self.chunk_unit_combo.setCurrentIndex(max(0, self.chunk_unit_combo.findData(default_chunk_unit)))
+        self.chunk_unit_combo.setToolTip("文本块在句子和段落边界处结束，大小和重叠按所选单位计算")
+        new_kb_layout.addRow("大小单位:", self.chunk_unit_combo)
+
+        # 索引类型
+        self.index_type_combo = QComboBox()
+        for index_type, display_name in INDEX_TYPES.items():
+            self.index_type_combo.addItem(display_name, index_type)
+        default_index_type = self.config_manager.get_config('KNOWLEDGE_BASE', 'index_type', 'flat')
+        self.index_type_combo.setCurrentIndex(max(0, self.index_type_combo.findData(default_index_type)))
+        new_kb_layout.addRow("索引类型:", self.index_type_combo)
+
+        # 向量存储格式
+        self.storage_combo = QComboBox()
+        for storage, display_name in VECTOR_STORAGE_TYPES.items():
+            self.storage_combo.addItem(display_name, storage)
+        default_storage = self.config_manager.get_config('KNOWLEDGE_BASE', 'storage', 'float32')
+        self.storage_combo.setCurrentIndex(max(0, self.storage_combo.findData(default_storage)))
+        self.storage_combo.setToolTip("压缩存储可减少内存占用，召回率的变化可通过“评估索引”查看")
+        new_kb_layout.addRow("向量存储:", self.storage_combo)
+
+        # PCA 降维
+        self.pca_spin = QSpinBox()
+        self.pca_spin.setRange(0, 4096)
+        self.pca_spin.setSingleStep(64)
+        self.pca_spin.setValue(self.config_manager.get_int_config('KNOWLEDGE_BASE', 'pca', 0))
+        self.pca_spin.setSpecialValueText("不降维")
+        new_kb_layout.addRow("PCA 降维:", self.pca_spin)
+
         # 选择文件按钮
         self.select_files_button = QPushButton("选择文件")
         self.select_files_button.clicked.connect(self._select_files)
@@ -183,6 +258,39 @@ class KnowledgeBaseTab(QWidget):
         new_kb_group.setLayout(new_kb_layout)
         layout.addWidget(new_kb_group)
 
+        # 构建任务组
+        build_jobs_group = QGroupBox("构建任务")
+        build_jobs_layout = QVBoxLayout()
+
+        # 任务列表
+        self.build_jobs_list = QListWidget()
+        self.build_jobs_list.itemSelectionChanged.connect(self._update_build_job_buttons)
+        build_jobs_layout.addWidget(self.build_jobs_list)
+
+        # 总吞吐量
+        self.build_throughput_label = QLabel("当前没有正在构建的知识库")
+        build_jobs_layout.addWidget(self.build_throughput_label)
+
+        # 按钮布局
+        build_jobs_buttons_layout = QHBoxLayout()
+
+        self.cancel_job_button = QPushButton("取消")
+        self.cancel_job_button.clicked.connect(lambda: self._on_build_job_action("cancel"))
+        build_jobs_buttons_layout.addWidget(self.cancel_job_button)
+
+        self.retry_job_button = QPushButton("从断点继续")
+        self.retry_job_button.clicked.connect(lambda: self._on_build_job_action("retry"))
+        build_jobs_buttons_layout.addWidget(self.retry_job_button)
+
+        self.remove_job_button = QPushButton("移除")
+        self.remove_job_button.clicked.connect(lambda: self._on_build_job_action("remove"))
+        build_jobs_buttons_layout.addWidget(self.remove_job_button)
+
+        build_jobs_layout.addLayout(build_jobs_buttons_layout)
+        build_jobs_group.setLayout(build_jobs_layout)
+        layout.addWidget(build_jobs_group)
+        self._update_build_job_buttons()
+
     def _init_query_tab(self, layout):
         """
         初始化知识库查询标签页
@@ -248,14 +356,33 @@ class KnowledgeBaseTab(QWidget):
         result_group.setLayout(result_layout)
         layout.addWidget(result_group)
 
+    def _embedding_provider(self):
+        """
+        获取当前使用的嵌入模型提供方，auto 在未配置 SiliconFlow 密钥时使用本地模型
+
+        Returns:
+            "siliconflow" 或 "local"
+        """
+        provider = self.config_manager.get_config('EMBEDDING_MODELS', 'provider', 'auto').lower()
+        if provider == 'auto':
+            has_key = self.config_manager.get_api_key('siliconflow_embedding') or self.config_manager.get_api_key('siliconflow')
+            return 'siliconflow' if has_key else 'local'
+        return provider
+
     def _init_embedding_model(self):
         """初始化嵌入模型和知识库管理器"""
         try:
             # 初始化嵌入模型
-            self.embedding_model = SiliconFlowEmbedding(self.config_manager)
+            if self._embedding_provider() == 'local':
+                self.embedding_model = LocalEmbedding(self.config_manager)
+            else:
+                self.embedding_model = SiliconFlowEmbedding(self.config_manager)
+            self._update_embedding_status()
 
-            # 初始化知识库管理器
+            # 初始化知识库管理器，之后提交的构建任务使用新的管理器
             self.knowledge_base_manager = KnowledgeBaseManager(self.config_manager, self.embedding_model)
+            if self.build_queue is not None:
+                self.build_queue.knowledge_base_manager = self.knowledge_base_manager
 
             # 注册文档处理器
             self.knowledge_base_manager.register_processor(TextProcessor())
@@ -270,17 +397,28 @@ class KnowledgeBaseTab(QWidget):
             print(f"初始化嵌入模型和知识库管理器出错: {e}")
             QMessageBox.warning(self, "初始化失败", f"初始化嵌入模型和知识库管理器出错: {e}")
 
+    def _update_embedding_status(self):
+        """显示当前实际使用的嵌入模型"""
+        status = self.embedding_model.model_name if self.embedding_model else "未初始化"
+        provider = self.config_manager.get_config('EMBEDDING_MODELS', 'provider', 'auto').lower()
+        if provider == 'auto' and isinstance(self.embedding_model, LocalEmbedding):
+            status += "（未配置 SiliconFlow 密钥，已自动使用本地模型；知识库只能用构建时的嵌入模型查询）"
+        self.embedding_status_label.setText(status)
+
     def _save_model_settings(self):
         """保存嵌入模型设置"""
         try:
             # 获取模型名称
+            provider = self.embedding_model_combo.currentData()
             model_name = self.embedding_model_name.text().strip()
-            if not model_name:
+            if provider != "local" and not model_name:
                 QMessageBox.warning(self, "保存失败", "模型名称不能为空")
                 return
 
             # 保存设置
-            self.config_manager.set_config("EMBEDDING_MODELS", "siliconflow_embedding_model", model_name)
+            self.config_manager.set_config("EMBEDDING_MODELS", "provider", provider)
+            if model_name:
+                self.config_manager.set_config("EMBEDDING_MODELS", "siliconflow_embedding_model", model_name)
             self.config_manager.save_config()
 
             # 重新初始化嵌入模型
@@ -304,8 +442,9 @@ class KnowledgeBaseTab(QWidget):
             for kb_name in kb_list:
                 self.kb_list.addItem(kb_name)
 
-            # 禁用删除按钮
+            # 禁用删除和评估按钮
             self.delete_kb_button.setEnabled(False)
+            self.benchmark_kb_button.setEnabled(False)
         except Exception as e:
             print(f"刷新知识库列表出错: {e}")
 
@@ -342,8 +481,9 @@ class KnowledgeBaseTab(QWidget):
         Args:
             item: 选中的项
         """
-        # 启用删除按钮
+        # 启用删除和评估按钮
         self.delete_kb_button.setEnabled(True)
+        self.benchmark_kb_button.setEnabled(True)
 
     def _on_query_kb_changed(self, index):
         """
@@ -411,21 +551,88 @@ class KnowledgeBaseTab(QWidget):
         else:
             QMessageBox.warning(self, "删除失败", f"删除知识库 '{kb_name}' 失败")
 
-    def _create_kb_async(self, kb_name, documents, chunk_size, chunk_overlap):
+    def _benchmark_kb(self):
+        """评估选中知识库上各索引类型的召回率与延迟"""
+        selected_items = self.kb_list.selectedItems()
+        if not selected_items:
+            QMessageBox.warning(self, "评估失败", "请先选择一个知识库")
+            return
+
+        kb_name = selected_items[0].text()
+
+        # 显示进度指示器
+        self.progress_indicator.start()
+        self.main_window.status_bar_manager.show_message(f"正在评估知识库 '{kb_name}' 的索引类型...")
+
+        # 评估是CPU密集的同步操作，放到后台线程执行
+        thread = self.async_helper.run_async(
+            lambda: self._run_benchmarks(kb_name),
+            lambda result: self._on_benchmark_kb_done(result, kb_name),
+            lambda e: self._on_benchmark_kb_error(e, kb_name)
+        )
+
+        # 保存线程引用
+        self.active_threads.append(thread)
+
+    def _run_benchmarks(self, kb_name):
         """
-        异步创建知识库
+        依次评估索引类型和向量存储格式
 
         Args:
             kb_name: 知识库名称
-            documents: 文档路径列表
-            chunk_size: 文本块大小
-            chunk_overlap: 文本块重叠大小
 
         Returns:
-            协程对象
+            (评估结果列表, 报告文本)
         """
-        # 直接返回协程对象，不要调用它
-        return self.knowledge_base_manager.create_knowledge_base(kb_name, documents, chunk_size, chunk_overlap)
+        index_results, index_report = self.knowledge_base_manager.benchmark_index_types(kb_name)
+        storage_results, storage_report = self.knowledge_base_manager.benchmark_storage_options(kb_name)
+        report = f"【索引类型】\n{index_report}\n\n【向量存储格式与PCA降维】\n{storage_report}"
+        return index_results + storage_results, report
+
+    def _on_benchmark_kb_done(self, result, kb_name):
+        """
+        索引评估完成事件处理
+
+        Args:
+            result: (评估结果列表, 报告文本)
+            kb_name: 知识库名称
+        """
+        # 停止进度指示器
+        self.progress_indicator.stop()
+
+        # 清理已完成的线程
+        self._cleanup_finished_threads()
+
+        _, report = result
+        self.main_window.status_bar_manager.show_message(f"知识库 '{kb_name}' 索引评估完成")
+
+        dialog = QDialog(self)
+        dialog.setWindowTitle(f"索引评估 - {kb_name}")
+        dialog.resize(960, 480)
+        dialog_layout = QVBoxLayout(dialog)
+        report_text = QTextEdit()
+        report_text.setReadOnly(True)
+        report_text.setFont(QFont("Monospace"))
+        report_text.setPlainText(report)
+        dialog_layout.addWidget(report_text)
+        dialog.exec()
+
+    def _on_benchmark_kb_error(self, error, kb_name):
+        """
+        索引评估错误事件处理
+
+        Args:
+            error: 错误信息
+            kb_name: 知识库名称
+        """
+        # 停止进度指示器
+        self.progress_indicator.stop()
+
+        # 清理已完成的线程
+        self._cleanup_finished_threads()
+
+        self.main_window.status_bar_manager.show_message(f"评估知识库 '{kb_name}' 出错: {error}")
+        QMessageBox.critical(self, "评估失败", f"评估知识库 '{kb_name}' 出错: {error}")
 
     def _create_kb(self):
         """创建知识库"""
@@ -438,6 +645,9 @@ class KnowledgeBaseTab(QWidget):
         # 获取文本块大小和重叠大小
         chunk_size = self.chunk_size_spin.value()
         chunk_overlap = self.chunk_overlap_spin.value()
+        index_type = self.index_type_combo.currentData()
+        chunk_unit = self.chunk_unit_combo.currentData()
+        index_params = {"storage": self.storage_combo.currentData(), "pca": self.pca_spin.value()}
 
         # 获取选中的文件
         documents = []
@@ -460,67 +670,110 @@ class KnowledgeBaseTab(QWidget):
         if reply != QMessageBox.StandardButton.Yes:
             return
 
-        # 显示进度指示器
-        self.progress_indicator.start()
-        self.main_window.status_bar_manager.show_message(f"正在创建知识库 '{kb_name}'...")
+        if self.build_queue is None:
+            QMessageBox.warning(self, "创建失败", "知识库管理器未初始化")
+            return
 
-        # 异步创建知识库
-        thread = self.async_helper.run_async(
-            self._create_kb_async(kb_name, documents, chunk_size, chunk_overlap),
-            self._on_create_kb_done,
-            lambda e: self._on_create_kb_error(e, kb_name)
-        )
+        # 加入构建队列，在后台构建，可与其他知识库同时进行
+        self.build_queue.submit(kb_name, documents, chunk_size, chunk_overlap, index_type=index_type,
+                                index_params=index_params, chunk_unit=chunk_unit)
+        self.main_window.status_bar_manager.show_message(f"知识库 '{kb_name}' 已加入构建队列")
 
-        # 保存线程引用
-        self.active_threads.append(thread)
+        # 清空输入
+        self.kb_name_edit.clear()
+        self.selected_files_list.clear()
 
-    def _on_create_kb_done(self, success):
+    @pyqtSlot(dict)
+    def _on_build_job_changed(self, job):
         """
-        创建知识库完成事件处理
+        构建任务变化事件处理
 
         Args:
-            success: 是否创建成功
+            job: 任务信息字典
         """
-        # 停止进度指示器
-        self.progress_indicator.stop()
+        previous = self.build_jobs.get(job["id"])
+        self.build_jobs[job["id"]] = job
+        self._render_build_jobs()
 
-        # 清理已完成的线程
-        self._cleanup_finished_threads()
-
-        kb_name = self.kb_name_edit.text().strip()
-
-        if success:
-            self.main_window.status_bar_manager.show_message(f"知识库 '{kb_name}' 创建成功")
-            QMessageBox.information(self, "创建成功", f"知识库 '{kb_name}' 创建成功")
+        if previous is None or previous["status"] == job["status"]:
+            return
 
-            # 清空输入
-            self.kb_name_edit.clear()
-            self.selected_files_list.clear()
+        kb_name = job["kb_name"]
+        if job["status"] == "done":
+            # 显示嵌入缓存命中情况
+            cache_stats = self.embedding_model.cache_stats() if self.embedding_model else None
+            cache_message = ""
+            if cache_stats:
+                cache_message = f"（嵌入缓存命中 {cache_stats['hits']} 次，未命中 {cache_stats['misses']} 次）"
+            self.main_window.status_bar_manager.show_message(f"知识库 '{kb_name}' 创建成功{cache_message}")
 
             # 刷新列表
             self._refresh_kb_list()
             self._refresh_query_kb_list()
+        elif job["status"] == "failed":
+            self.main_window.status_bar_manager.show_message(f"知识库 '{kb_name}' 创建失败: {job['error']}")
+
+    def _render_build_jobs(self):
+        """刷新构建任务列表和总吞吐量"""
+        selected_ids = {item.data(Qt.ItemDataRole.UserRole) for item in self.build_jobs_list.selectedItems()}
+        self.build_jobs_list.clear()
+
+        jobs = sorted(self.build_jobs.values(), key=lambda job: job["created"])
+        for job in jobs:
+            text = f"{job['kb_name']}  [{JOB_STATUSES.get(job['status'], job['status'])}]"
+            if job["status"] == "running":
+                text += (f"  {BUILD_STAGES.get(job['stage'], '')}：文档 {job['documents_done']}/{job['documents_total']}，"
+                         f"已嵌入 {job['chunks_done']} 个文本块（{job['chunks_per_second']:.1f} 块/秒）")
+            elif job["status"] == "done":
+                text += f"  共 {job['chunks_done']} 个文本块"
+            if job.get("chunks_deduplicated"):
+                text += f"，跳过 {job['chunks_deduplicated']} 个近似重复文本块（节省 {job['chunks_deduplicated']} 次嵌入）"
+            if job["documents_failed"]:
+                text += f"，{job['documents_failed']} 个文档失败"
+            if job["error"]:
+                text += f"  {job['error']}"
+
+            item = QListWidgetItem(text)
+            item.setData(Qt.ItemDataRole.UserRole, job["id"])
+            self.build_jobs_list.addItem(item)
+            item.setSelected(job["id"] in selected_ids)
+
+        running = [job for job in jobs if job["status"] == "running"]
+        if running:
+            throughput = sum(job["chunks_per_second"] for job in running)
+            self.build_throughput_label.setText(f"正在构建 {len(running)} 个知识库，总吞吐 {throughput:.1f} 块/秒")
         else:
-            self.main_window.status_bar_manager.show_message(f"知识库 '{kb_name}' 创建失败")
-            QMessageBox.warning(self, "创建失败", f"知识库 '{kb_name}' 创建失败")
-
-    def _on_create_kb_error(self, error, kb_name):
+            self.build_throughput_label.setText("当前没有正在构建的知识库")
+        self._update_build_job_buttons()
+
+    def _update_build_job_buttons(self):
+        """按选中任务的状态启用/禁用任务按钮"""
+        items = self.build_jobs_list.selectedItems()
+        job = self.build_jobs.get(items[0].data(Qt.ItemDataRole.UserRole)) if items else None
+        status = job["status"] if job else None
+        self.cancel_job_button.setEnabled(status in ("queued", "running"))
+        self.retry_job_button.setEnabled(status in ("failed", "cancelled"))
+        self.remove_job_button.setEnabled(status in ("done", "failed", "cancelled"))
+
+    def _on_build_job_action(self, action):
         """
-        创建知识库错误事件处理
+        对选中的构建任务执行操作
 
         Args:
-            error: 错误信息
-            kb_name: 知识库名称
+            action: cancel、retry 或 remove
         """
-        # 停止进度指示器
-        self.progress_indicator.stop()
-
-        # 清理已完成的线程
-        self._cleanup_finished_threads()
+        items = self.build_jobs_list.selectedItems()
+        if not items or self.build_queue is None:
+            return
 
-        # 显示错误消息
-        self.main_window.status_bar_manager.show_message(f"创建知识库 '{kb_name}' 出错: {error}")
-        QMessageBox.critical(self, "创建失败", f"创建知识库 '{kb_name}' 出错: {error}")
+        job_id = items[0].data(Qt.ItemDataRole.UserRole)
+        if action == "cancel":
+            self.build_queue.cancel(job_id)
+        elif action == "retry":
+            self.build_queue.retry(job_id)
+        elif action == "remove" and self.build_queue.remove(job_id):
+            self.build_jobs.pop(job_id, None)
+            self._render_build_jobs()
 
     def _query_kb_async(self, kb_name, query, top_k):
         """
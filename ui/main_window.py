@@ -22,7 +22,10 @@ from models.custom_openai_model import CustomOpenAIModel
 from models.modelscope_model import ModelScopeModel
 from models.ollama_model import OllamaModel
 from models.siliconflow_model import SiliconFlowModel # 导入 SiliconFlow 模型
+from models.http_pool import http_pool # 模型共用的HTTP连接池
+from models.resilience import ResilientModel # 重试与故障转移
 from embedding_models.siliconflow_embedding import SiliconFlowEmbedding # 导入 SiliconFlow 嵌入模型
+from embedding_models.local_embedding import LocalEmbedding # 导入本地嵌入模型
 from utils.knowledge_base_manager import KnowledgeBaseManager # 导入知识库管理器
 
 from ui.components import ThemeManager, StatusBarManager, KeyboardShortcutManager
@@ -89,6 +92,16 @@ class MainWindow(QMainWindow):
         # 显示欢迎消息
         self.status_bar_manager.show_message("欢迎使用AI小说生成器")
 
+    def closeEvent(self, event):
+        """
+        关闭事件处理，关闭模型共用的HTTP连接池
+
+        Args:
+            event: 关闭事件
+        """
+        http_pool.close_all()
+        super().closeEvent(event)
+
     def _load_font(self):
         """加载字体"""
         font_path = "SourceHanSansCN-Normal.otf"
@@ -230,6 +243,28 @@ class MainWindow(QMainWindow):
             )
 
     def get_model(self, model_type):
+        """
+        获取指定类型的模型，返回的模型带有重试，并按 [RESILIENCE] failover_chain 的顺序故障转移
+
+        Args:
+            model_type: 模型类型，如 gpt、siliconflow 或自定义模型名称
+
+        Returns:
+            ResilientModel 实例
+        """
+        models = [(model_type, self._get_base_model(model_type))]
+        chain = self.config_manager.get_config('RESILIENCE', 'failover_chain', '')
+        for fallback_type in [name.strip() for name in chain.split(',') if name.strip()]:
+            if fallback_type == model_type or any(fallback_type == name for name, _ in models):
+                continue
+            try:
+                models.append((fallback_type, self._get_base_model(fallback_type)))
+            except ValueError:
+                # 未配置或初始化失败的模型不参与故障转移
+                continue
+        return ResilientModel(self.config_manager, models)
+
+    def _get_base_model(self, model_type):
         """获取指定类型的模型"""
         # 检查是否是自定义模型
         if model_type in self.custom_openai_models:
@@ -286,20 +321,35 @@ class MainWindow(QMainWindow):
 
     def _init_embedding_model(self):
         """初始化 Embedding 模型"""
-        # 优先使用 SiliconFlow Embedding，如果配置了的话
-        if self.config_manager.get_api_key('siliconflow_embedding') or self.config_manager.get_api_key('siliconflow'): # 兼容旧配置
+        # provider 为 auto 时优先使用 SiliconFlow Embedding，未配置密钥时退回本地嵌入模型
+        provider = self.config_manager.get_config('EMBEDDING_MODELS', 'provider', 'auto').lower()
+        has_siliconflow_key = self.config_manager.get_api_key('siliconflow_embedding') or self.config_manager.get_api_key('siliconflow') # 兼容旧配置
+        if provider == 'siliconflow' or (provider == 'auto' and has_siliconflow_key):
              try:
                  # 注意：SiliconFlowEmbedding 可能需要 config_manager
                  self.embedding_model = SiliconFlowEmbedding(self.config_manager)
                  print("SiliconFlow Embedding 模型初始化成功。")
+                 return
              except Exception as e:
-                 self.embedding_model = None
                  print(f"SiliconFlow Embedding 模型初始化失败: {e}")
-                 QMessageBox.warning(self, "Embedding模型失败", "SiliconFlow Embedding 模型初始化失败，知识库功能可能受限。")
-        else:
-             self.embedding_model = None
-             print("未配置 SiliconFlow Embedding 模型。知识库功能将受限。")
-             # 这里可以考虑添加对其他 Embedding 模型的支持，或者提示用户配置
+                 if provider == 'siliconflow':
+                     self.embedding_model = None
+                     QMessageBox.warning(self, "Embedding模型失败", "SiliconFlow Embedding 模型初始化失败，知识库功能可能受限。")
+                     return
+                 # 本地模型的向量与 SiliconFlow 的不可比较，明确告知用户已退回本地模型
+                 self.embedding_model = LocalEmbedding(self.config_manager)
+                 print(f"已退回本地 Embedding 模型 {self.embedding_model.model_name}。")
+                 QMessageBox.warning(
+                     self, "Embedding模型已退回本地",
+                     f"SiliconFlow Embedding 模型初始化失败: {e}\n\n"
+                     f"当前使用本地嵌入模型 {self.embedding_model.model_name}，"
+                     f"用 SiliconFlow 构建的知识库在恢复 SiliconFlow 之前无法查询。"
+                 )
+                 return
+
+        # 本地嵌入模型不需要网络和密钥，保证知识库功能离线可用
+        self.embedding_model = LocalEmbedding(self.config_manager)
+        print("使用本地 Embedding 模型。")
 
     def _init_knowledge_base_manager(self):
         """初始化知识库管理器"""
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import mmap
+import threading
+import numpy as np
+
+
+class ChunkStore:
+    """
+    紧凑的文本块存储，按文本块ID以O(1)读取
+
+    由两个文件组成：
+        <name>.bin  所有文本块的UTF-8字节依次拼接
+        <name>.idx  int64 数组，第i行为ID为i的文本块的 (偏移, 长度)，长度为-1表示不存在或已删除
+        <name>.pages int32 数组，第i行为ID为i的文本块起点所在的页码，-1表示没有页码（可选）
+    读取时两个文件都以内存映射方式打开，只有被访问的页面会被读入内存。
+    """
+
+    def __init__(self, directory, name="chunks"):
+        """
+        初始化文本块存储
+
+        Args:
+            directory: 所在目录
+            name: 文件名前缀
+        """
+        self.directory = directory
+        self.blob_path = os.path.join(directory, f"{name}.bin")
+        self.offsets_path = os.path.join(directory, f"{name}.idx")
+        self.pages_path = os.path.join(directory, f"{name}.pages")
+        self._blob = None
+        self._offsets = None
+        self._pages = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def exists(directory, name="chunks"):
+        """
+        判断目录中是否存在文本块存储
+
+        Args:
+            directory: 所在目录
+            name: 文件名前缀
+
+        Returns:
+            是否存在
+        """
+        return os.path.exists(os.path.join(directory, f"{name}.idx"))
+
+    @classmethod
+    def from_documents(cls, directory, documents, name="chunks"):
+        """
+        从旧版元数据中的 documents 字典创建文本块存储
+
+        Args:
+            directory: 所在目录
+            documents: {文本块ID字符串: 文本}
+            name: 文件名前缀
+
+        Returns:
+            ChunkStore 实例
+        """
+        store = cls(directory, name)
+        store.truncate(0)
+        items = sorted((int(chunk_id), text) for chunk_id, text in documents.items())
+        if items:
+            store.append([chunk_id for chunk_id, _ in items], [text for _, text in items])
+        return store
+
+    def __len__(self):
+        """ID槽位数量，即最大文本块ID加一"""
+        if not os.path.exists(self.offsets_path):
+            return 0
+        return os.path.getsize(self.offsets_path) // 16
+
+    def get(self, chunk_id):
+        """
+        读取文本块
+
+        Args:
+            chunk_id: 文本块ID
+
+        Returns:
+            文本内容，不存在时返回None
+        """
+        return self.get_many([chunk_id])[0]
+
+    def get_many(self, chunk_ids):
+        """
+        批量读取文本块
+
+        Args:
+            chunk_ids: 文本块ID列表
+
+        Returns:
+            与chunk_ids一一对应的文本列表，不存在的位置为None
+        """
+        with self._lock:
+            blob, offsets = self._mapped()
+            results = []
+            for chunk_id in chunk_ids:
+                chunk_id = int(chunk_id)
+                if offsets is None or chunk_id < 0 or chunk_id >= len(offsets):
+                    results.append(None)
+                    continue
+                offset, length = offsets[chunk_id]
+                if length < 0:
+                    results.append(None)
+                else:
+                    results.append(blob[offset:offset + length].decode("utf-8") if length else "")
+            return results
+
+    def get_pages(self, chunk_ids):
+        """
+        批量读取文本块的来源页码
+
+        Args:
+            chunk_ids: 文本块ID列表
+
+        Returns:
+            与chunk_ids一一对应的页码列表，没有页码的位置为None
+        """
+        with self._lock:
+            self._mapped()
+            pages = self._pages
+            results = []
+            for chunk_id in chunk_ids:
+                chunk_id = int(chunk_id)
+                page = int(pages[chunk_id]) if pages is not None and 0 <= chunk_id < len(pages) else -1
+                results.append(page if page >= 0 else None)
+            return results
+
+    def iter_chunks(self):
+        """
+        依次遍历全部有效文本块
+
+        Yields:
+            (文本块ID, 文本)
+        """
+        total = len(self)
+        for start in range(0, total, 1024):
+            ids = list(range(start, min(start + 1024, total)))
+            for chunk_id, text in zip(ids, self.get_many(ids)):
+                if text is not None:
+                    yield chunk_id, text
+
+    def append(self, chunk_ids, texts, pages=None):
+        """
+        追加文本块，ID必须不小于当前槽位数量，中间空缺的ID记为不存在
+
+        Args:
+            chunk_ids: 递增的文本块ID列表
+            texts: 与chunk_ids一一对应的文本列表
+            pages: 与chunk_ids一一对应的页码列表，没有页码的位置为None
+        """
+        if not chunk_ids:
+            return
+
+        with self._lock:
+            self._close_maps()
+            count = len(self)
+            if int(chunk_ids[0]) < count:
+                raise ValueError(f"文本块ID {chunk_ids[0]} 已存在，追加的ID必须不小于 {count}")
+
+            blob_size = os.path.getsize(self.blob_path) if os.path.exists(self.blob_path) else 0
+            rows = np.full((int(chunk_ids[-1]) + 1 - count, 2), -1, dtype='int64')
+            payload = []
+            for chunk_id, text in zip(chunk_ids, texts):
+                data = text.encode("utf-8")
+                rows[int(chunk_id) - count] = (blob_size, len(data))
+                blob_size += len(data)
+                payload.append(data)
+
+            # 先写文本和页码再写偏移，中途中断时偏移表不会指向不完整的文本
+            with open(self.blob_path, "ab") as f:
+                f.write(b"".join(payload))
+            if pages is not None and any(page is not None for page in pages) or os.path.exists(self.pages_path):
+                self._append_pages(count, chunk_ids, pages)
+            with open(self.offsets_path, "ab") as f:
+                f.write(rows.tobytes())
+
+    def delete(self, chunk_ids):
+        """
+        将文本块标记为已删除，文本字节保留在文件中直到重建
+
+        Args:
+            chunk_ids: 文本块ID列表
+        """
+        count = len(self)
+        chunk_ids = [int(chunk_id) for chunk_id in chunk_ids if 0 <= int(chunk_id) < count]
+        if not chunk_ids:
+            return
+
+        with self._lock:
+            self._close_maps()
+            offsets = np.memmap(self.offsets_path, dtype='int64', mode='r+', shape=(count, 2))
+            offsets[chunk_ids, 1] = -1
+            offsets.flush()
+            del offsets
+
+    def truncate(self, count):
+        """
+        截断到指定槽位数量，丢弃ID不小于count的文本块（例如中断的追加留下的残余）
+
+        Args:
+            count: 保留的槽位数量
+        """
+        with self._lock:
+            self._close_maps()
+            os.makedirs(self.directory, exist_ok=True)
+            blob_end = 0
+            if count > 0 and os.path.exists(self.offsets_path):
+                offsets = np.fromfile(self.offsets_path, dtype='int64').reshape(-1, 2)[:count]
+                valid = offsets[offsets[:, 1] >= 0]
+                if len(valid):
+                    blob_end = int((valid[:, 0] + valid[:, 1]).max())
+                count = len(offsets)
+            else:
+                count = 0
+
+            with open(self.offsets_path, "ab"):
+                pass
+            with open(self.blob_path, "ab"):
+                pass
+            os.truncate(self.offsets_path, count * 16)
+            os.truncate(self.blob_path, blob_end)
+            if os.path.exists(self.pages_path):
+                if count == 0:
+                    os.remove(self.pages_path)
+                else:
+                    os.truncate(self.pages_path, min(os.path.getsize(self.pages_path), count * 4))
+
+    def size_bytes(self):
+        """
+        获取偏移表大小，文本部分通过内存映射按需读取，不计入常驻内存
+
+        Returns:
+            字节数
+        """
+        return os.path.getsize(self.offsets_path) if os.path.exists(self.offsets_path) else 0
+
+    def close(self):
+        """关闭内存映射"""
+        with self._lock:
+            self._close_maps()
+
+    def _append_pages(self, count, chunk_ids, pages):
+        """
+        写入页码，页码文件比偏移表短时（如旧版存储或上次中断）先补齐
+
+        Args:
+            count: 追加前的槽位数量
+            chunk_ids: 递增的文本块ID列表
+            pages: 与chunk_ids一一对应的页码列表，可以为None
+        """
+        existing = os.path.getsize(self.pages_path) // 4 if os.path.exists(self.pages_path) else 0
+        if existing > count:
+            os.truncate(self.pages_path, count * 4)
+            existing = count
+
+        rows = np.full(int(chunk_ids[-1]) + 1 - existing, -1, dtype='int32')
+        if pages is not None:
+            for chunk_id, page in zip(chunk_ids, pages):
+                if page is not None:
+                    rows[int(chunk_id) - existing] = page
+        with open(self.pages_path, "ab") as f:
+            f.write(rows.tobytes())
+
+    def _mapped(self):
+        """获取当前的内存映射，文件增长后重新映射"""
+        count = len(self)
+        if count == 0:
+            return None, None
+
+        if self._offsets is None or len(self._offsets) != count:
+            self._close_maps()
+            self._offsets = np.memmap(self.offsets_path, dtype='int64', mode='r', shape=(count, 2))
+            if os.path.getsize(self.blob_path) > 0:
+                with open(self.blob_path, "rb") as f:
+                    self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._blob = b""
+            # 旧版存储或上次中断时页码文件可能比偏移表短，超出部分视为没有页码
+            pages_count = min(count, os.path.getsize(self.pages_path) // 4) if os.path.exists(self.pages_path) else 0
+            if pages_count > 0:
+                self._pages = np.memmap(self.pages_path, dtype='int32', mode='r', shape=(pages_count,))
+        return self._blob, self._offsets
+
+    def _close_maps(self):
+        """释放内存映射，写入前调用，避免映射与文件长度不一致"""
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._blob = None
+        self._offsets = None
+        self._pages = None
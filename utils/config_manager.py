@@ -41,7 +41,73 @@ class ConfigManager:
         }
 
         self.config['EMBEDDING_MODELS'] = {
-            'siliconflow_embedding_model': 'BAAI/bge-m3'
+            'provider': 'auto',  # 嵌入模型提供方：auto / siliconflow / local，auto 在未配置密钥时使用本地模型
+            'siliconflow_embedding_model': 'BAAI/bge-m3',
+            'local_embedding_dimension': '512',  # 本地嵌入模型的向量维度
+            'local_embedding_workers': '0',  # 本地嵌入模型的计算进程数，0 表示使用全部CPU核心
+            'batch_size': '32',  # 每个嵌入请求最多包含的文本数
+            'batch_max_tokens': '16384',  # 每个嵌入请求的估算token上限
+            'max_concurrency': '4',  # 同时进行的嵌入请求数
+            'max_retries': '3'  # 单个批次失败后的最大重试次数
+        }
+
+        self.config['KNOWLEDGE_BASE'] = {
+            'index_cache_mb': '512',  # 常驻内存的索引缓存预算（MB）
+            'mmap_index': 'true',  # 查询时以内存映射方式打开索引，只有被访问的页面读入内存
+            'index_type': 'flat',  # 新建知识库的索引类型：flat / ivf_flat / ivf_pq / hnsw
+            'storage': 'float32',  # 新建知识库的向量存储格式：float32 / float16 / sq8 / pq
+            'pca': '0',  # 新建知识库构建时 PCA 降到的维度，0 表示不降维
+            'nprobe': '16',  # IVF 索引查询时探查的倒排列表数
+            'ef_search': '64',  # HNSW 索引查询时的搜索宽度
+            'build_window_size': '256',  # 构建流水线每个窗口的文本块数
+            'build_queue_size': '2',  # 读取阶段最多领先嵌入阶段的窗口数
+            'build_concurrency': '2',  # 后台构建队列同时构建的知识库数
+            'build_rate_limit': '0',  # 所有构建任务合计每秒最多嵌入的文本块数，0 表示不限制
+            'train_sample_size': '20000',  # 需要训练的索引使用的训练样本数
+            'benchmark_sample_size': '50000',  # 评估索引类型时最多抽取的向量数
+            'extract_workers': '0',  # 解析文档的进程数，0 表示使用全部CPU核心
+            'chunk_unit': 'char',  # 文本块大小的单位：char / token
+            'dedup_threshold': '0',  # 构建时跳过的近似重复文本块的相似度阈值（建议 0.85），0 表示不去重
+            'query_mode': 'vector',  # 默认查询方式：vector / keyword / hybrid
+            'hybrid_alpha': '0.5',  # 混合检索中向量得分的权重，其余为 BM25 得分
+            'fetch_factor': '4',  # 检索阶段取回 返回结果数量×该倍数 的候选，供重排和去冗余挑选
+            'mmr_lambda': '0.7',  # MMR 中相关度的权重，越小结果越分散，1 表示不去冗余
+            'reranker': 'none',  # 候选的重排方式：none / lexical
+            'token_budget': '0'  # 查询结果的估算token总数上限，0 表示按返回结果数量截取
+        }
+
+        self.config['EMBEDDING_CACHE'] = {
+            'enabled': 'true',  # 是否启用持久化嵌入缓存
+            'path': 'embedding_cache'  # 嵌入缓存目录
+        }
+
+        self.config['RESILIENCE'] = {
+            'max_retries': '3',  # 限流、超时、服务端错误的最大重试次数
+            'base_delay': '1',  # 第一次重试的基准等待秒数，之后指数增长，服务端返回 Retry-After 时以其为准
+            'max_delay': '30',  # 指数退避的等待上限（秒）
+            'failover_chain': '',  # 重试用尽后依次尝试的模型类型，逗号分隔，如 siliconflow,modelscope,gpt
+            'resume_stream': 'true'  # 流式生成中途失败时是否以续写的方式继续
+        }
+
+        self.config['HTTP_POOL'] = {
+            'limit': '32',  # 每个模型提供方的总连接数上限
+            'limit_per_host': '8',  # 每个模型提供方对同一主机的连接数上限
+            'keepalive_timeout': '60',  # 空闲连接保持的秒数
+            'dns_cache_ttl': '300'  # DNS 解析结果缓存的秒数
+        }
+
+        self.config['RATE_LIMITS'] = {
+            'default_rpm': '0',  # 每个提供方每个API密钥的每分钟请求数上限，0 表示不限制
+            'default_tpm': '0',  # 每分钟token数上限（提示词与输出的估算值之和），0 表示不限制
+            'default_concurrency': '0',  # 同时进行的请求数上限，0 表示不限制
+            'expected_output_tokens': '1024'  # 请求前为输出预留的token数，请求结束后按实际输出修正
+        }
+
+        self.config['RESPONSE_CACHE'] = {
+            'enabled': 'false',  # 是否缓存模型响应，相同的提示词、模型和参数直接返回缓存的结果
+            'path': 'response_cache.db',  # 缓存文件路径（SQLite）
+            'max_size_mb': '200',  # 缓存总大小上限（MB），超出时淘汰最久未用的条目，0 表示不限制
+            'ttl_hours': '168'  # 条目的有效期（小时），0 表示永不过期
         }
 
         self.config['CUSTOM_OPENAI'] = {
@@ -122,6 +188,20 @@ class ConfigManager:
 
         return self.config[section].get(key, default)
 
+    def get_int_config(self, section, key, default=0):
+        """获取整数类型的配置项，缺失或格式错误时返回默认值"""
+        try:
+            return int(self.get_config(section, key, default))
+        except (TypeError, ValueError):
+            return default
+
+    def get_float_config(self, section, key, default=0.0):
+        """获取浮点数类型的配置项，缺失或格式错误时返回默认值"""
+        try:
+            return float(self.get_config(section, key, default))
+        except (TypeError, ValueError):
+            return default
+
     def set_config(self, section, key, value):
         """设置指定配置项"""
         if section not in self.config:
@@ -19,6 +19,23 @@ class DocumentProcessor(ABC):
         """
         pass
 
+    def iter_segments(self, file_path):
+        """
+        按顺序逐段读取文档，分页的文档（如PDF）每页一段，调用方可以边读边处理，不必持有全文
+
+        默认实现把 process 的结果作为单个无页码的片段返回。
+
+        Args:
+            file_path: 文档路径
+
+        Yields:
+            (页码, 文本)，页码从1开始，没有分页的文档为None；读取失败时抛出异常
+        """
+        text = self.process(file_path)
+        if text is None:
+            raise ValueError("读取文档失败")
+        yield None, text
+
     @abstractmethod
     def get_supported_extensions(self):
         """
@@ -28,3 +45,28 @@ class DocumentProcessor(ABC):
             支持的文件扩展名列表
         """
         pass
+
+
+def extract_chunks(processor, file_path, splitter):
+    """
+    读取单个文档并分块，作为进程池任务执行，因此定义为模块级函数
+
+    Args:
+        processor: 文档处理器实例，为None表示不支持该文件类型
+        file_path: 文档路径
+        splitter: TextSplitter 实例
+
+    Returns:
+        (文档路径, 文本块列表, 与文本块对应的页码列表, 错误信息)，成功时错误信息为None
+    """
+    if processor is None:
+        return file_path, [], [], "不支持的文件类型"
+
+    try:
+        chunks, pages = [], []
+        for chunk, page in splitter.split_segments(processor.iter_segments(file_path)):
+            chunks.append(chunk)
+            pages.append(page)
+        return file_path, chunks, pages, None
+    except Exception as e:
+        return file_path, [], [], str(e)
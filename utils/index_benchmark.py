@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import numpy as np
+import faiss
+
+from utils.vector_store import INDEX_TYPES
+
+
+# 评估时最多使用的向量数，大知识库只抽取一部分，避免重建全部向量
+DEFAULT_SAMPLE_SIZE = 50000
+
+
+def benchmark_index_types(vector_store, kb_name, index_types=None, index_params=None,
+                          search_params=None, num_queries=100, top_k=10, sample_size=DEFAULT_SAMPLE_SIZE):
+    """
+    在同一知识库的向量上比较各索引类型的召回率与查询延迟，以精确检索结果为基准
+
+    Args:
+        vector_store: VectorStore 实例
+        kb_name: 知识库名称
+        index_types: 要评估的索引类型列表，为None时评估全部类型
+        index_params: 各索引类型的构建参数，键为索引类型
+        search_params: 各索引类型的查询参数列表，键为索引类型，
+            如 {"ivf_flat": [{"nprobe": 1}, {"nprobe": 16}]}，未指定时使用默认参数
+        num_queries: 查询样本数量，从抽样向量中留出，不加入被评估的索引
+        top_k: 计算召回率时使用的结果数量
+        sample_size: 最多抽取的向量数
+
+    Returns:
+        评估结果列表，见 benchmark_configurations
+    """
+    index_types = index_types or list(INDEX_TYPES.keys())
+    index_params = index_params or {}
+    search_params = search_params or {}
+    configurations = [
+        {"index_type": index_type, "index_params": index_params.get(index_type),
+         "search_params": search_params.get(index_type)}
+        for index_type in index_types
+    ]
+    return benchmark_configurations(vector_store, kb_name, configurations, num_queries, top_k, sample_size)
+
+
+def benchmark_configurations(vector_store, kb_name, configurations, num_queries=100, top_k=10,
+                             sample_size=DEFAULT_SAMPLE_SIZE):
+    """
+    在同一知识库的向量上比较多种索引配置（索引类型、存储格式、PCA降维）的召回率、延迟和内存占用
+
+    向量按固定种子随机抽取至多 sample_size 个，其中 num_queries 个留作查询，其余用于构建被评估的索引，
+    查询向量不在索引中，召回率不会因为查询命中自身而偏高。
+
+    Args:
+        vector_store: VectorStore 实例
+        kb_name: 知识库名称
+        configurations: 配置列表，每项包含 index_type，可选 index_params 和 search_params（查询参数列表）
+        num_queries: 查询样本数量，从抽样向量中留出，不加入被评估的索引
+        top_k: 计算召回率时使用的结果数量
+        sample_size: 最多抽取的向量数
+
+    Returns:
+        评估结果列表，每项包含 index_type、index_params、factory（实际使用的索引描述）、search_params、
+        recall、latency_ms、build_seconds、bytes_per_vector
+    """
+    sample = vector_store.sample_vectors(kb_name, sample_size)
+    if sample is None or len(sample) < 2:
+        return []
+
+    # 留出查询向量，其余向量构建索引
+    sample = np.ascontiguousarray(sample, dtype='float32')
+    rng = np.random.default_rng(0)
+    held_out = np.zeros(len(sample), dtype=bool)
+    held_out[rng.choice(len(sample), min(num_queries, len(sample) // 2), replace=False)] = True
+    queries = sample[held_out]
+    vectors = sample[~held_out]
+    dimension = vectors.shape[1]
+    top_k = min(top_k, len(vectors))
+
+    # 精确检索作为召回率基准
+    exact_index = faiss.IndexFlatL2(dimension)
+    exact_index.add(vectors)
+    _, ground_truth = exact_index.search(queries, top_k)
+
+    results = []
+    for configuration in configurations:
+        index_type = configuration["index_type"]
+        index_params = configuration.get("index_params") or {}
+        factory = vector_store.index_factory_string(dimension, index_type, index_params, len(vectors))
+
+        start = time.perf_counter()
+        index = faiss.index_factory(dimension, factory)
+        vector_store.train_index(index, vectors)
+        index.add(vectors)
+        build_seconds = time.perf_counter() - start
+        bytes_per_vector = len(faiss.serialize_index(index)) / len(vectors)
+
+        for params in configuration.get("search_params") or [{}]:
+            faiss_params = vector_store.search_parameters(index, params.get("nprobe"), params.get("ef_search"))
+
+            start = time.perf_counter()
+            _, ids = index.search(queries, top_k, params=faiss_params)
+            latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+            results.append({
+                "index_type": index_type,
+                "index_params": index_params,
+                "factory": factory,
+                "search_params": params,
+                "recall": _recall_at_k(ids, ground_truth),
+                "latency_ms": latency_ms,
+                "build_seconds": build_seconds,
+                "bytes_per_vector": bytes_per_vector
+            })
+
+    return results
+
+
+def format_benchmark_report(results, top_k=10):
+    """
+    将评估结果格式化为文本报告
+
+    Args:
+        results: benchmark_index_types 或 benchmark_configurations 的返回值
+        top_k: 计算召回率时使用的结果数量
+
+    Returns:
+        报告文本
+    """
+    if not results:
+        return "没有可评估的向量"
+
+    lines = [f"{'索引类型':<24}{'索引结构':<24}{'查询参数':<20}{f'召回率@{top_k}':>10}"
+             f"{'单次查询(ms)':>14}{'字节/向量':>12}{'构建(s)':>10}"]
+    for result in results:
+        params = ", ".join(f"{k}={v}" for k, v in result["search_params"].items()) or "默认"
+        lines.append(
+            f"{INDEX_TYPES.get(result['index_type'], result['index_type']):<24}{result.get('factory', ''):<24}{params:<20}"
+            f"{result['recall']:>10.4f}{result['latency_ms']:>14.3f}{result.get('bytes_per_vector', 0):>12.1f}"
+            f"{result['build_seconds']:>10.2f}"
+        )
+    return "\n".join(lines)
+
+
+def _recall_at_k(ids, ground_truth):
+    """计算每个查询结果与精确结果交集占比的平均值"""
+    hits = 0
+    for found, expected in zip(ids, ground_truth):
+        hits += len(set(found[found >= 0]) & set(expected))
+    return hits / ground_truth.size
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import threading
+from collections import Counter
+import numpy as np
+
+_TOKEN_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+|[a-z0-9]+')
+_CJK_START = '\u3040'
+
+
+def tokenize(text):
+    """
+    分词，中日韩文字使用重叠二元组（单字片段保留单字），英文和数字按单词切分并转为小写
+
+    Args:
+        text: 文本
+
+    Returns:
+        词项列表
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        run = match.group()
+        if run[0] >= _CJK_START:
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+class InvertedIndex:
+    """
+    基于 BM25 的轻量倒排索引，文档ID与文本块ID一致
+
+    倒排表以 CSR 形式保存：offsets[t]:offsets[t+1] 是词项 t 的 (文本块ID, 词频) 区间。
+    新增的文本块先暂存为三元组数组，检索或保存前再合并进 CSR。
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        """
+        初始化倒排索引
+
+        Args:
+            k1: BM25 词频饱和参数
+            b: BM25 文档长度归一化参数
+        """
+        self.k1 = k1
+        self.b = b
+        self.terms = []  # 词项ID -> 词项
+        self.term_ids = {}  # 词项 -> 词项ID
+        self.offsets = np.zeros(1, dtype='int64')
+        self.doc_ids = np.zeros(0, dtype='int64')
+        self.tfs = np.zeros(0, dtype='int32')
+        self.doc_lengths = np.zeros(0, dtype='int32')  # 按文本块ID索引的词项数
+        self.live = np.zeros(0, dtype=bool)  # 按文本块ID索引，False 表示不存在或已删除
+        self._pending = []  # 尚未合并的 (词项ID数组, 文本块ID数组, 词频数组)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        """
+        从文件加载倒排索引
+
+        Args:
+            path: .npz 文件路径
+
+        Returns:
+            InvertedIndex 实例
+        """
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(float(data["k1"]), float(data["b"]))
+            blob = data["terms"].tobytes().decode("utf-8")
+            index.terms = blob.split("\n") if blob else []
+            index.term_ids = {term: term_id for term_id, term in enumerate(index.terms)}
+            index.offsets = data["offsets"]
+            index.doc_ids = data["doc_ids"]
+            index.tfs = data["tfs"]
+            index.doc_lengths = data["doc_lengths"]
+            index.live = data["live"]
+        return index
+
+    def save(self, path):
+        """
+        保存倒排索引，已删除文本块的倒排项在保存时被清除
+
+        Args:
+            path: .npz 文件路径
+        """
+        with self._lock:
+            self._merge(drop_deleted=True)
+            tmp_path = path + ".tmp.npz"
+            np.savez(
+                tmp_path,
+                k1=np.float64(self.k1),
+                b=np.float64(self.b),
+                terms=np.frombuffer("\n".join(self.terms).encode("utf-8"), dtype='uint8'),
+                offsets=self.offsets,
+                doc_ids=self.doc_ids,
+                tfs=self.tfs,
+                doc_lengths=self.doc_lengths,
+                live=self.live
+            )
+            os.replace(tmp_path, path)
+
+    def add(self, chunk_ids, texts):
+        """
+        添加文本块
+
+        Args:
+            chunk_ids: 文本块ID列表
+            texts: 与chunk_ids一一对应的文本列表
+        """
+        if not len(chunk_ids):
+            return
+
+        term_ids, doc_ids, tfs = [], [], []
+        lengths = []
+        for chunk_id, text in zip(chunk_ids, texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_id = self.term_ids.get(term)
+                if term_id is None:
+                    term_id = len(self.terms)
+                    self.term_ids[term] = term_id
+                    self.terms.append(term)
+                term_ids.append(term_id)
+                doc_ids.append(int(chunk_id))
+                tfs.append(tf)
+
+        with self._lock:
+            max_id = int(max(chunk_ids)) + 1
+            if max_id > len(self.doc_lengths):
+                self.doc_lengths = np.concatenate([self.doc_lengths, np.zeros(max_id - len(self.doc_lengths), dtype='int32')])
+                self.live = np.concatenate([self.live, np.zeros(max_id - len(self.live), dtype=bool)])
+            ids = np.asarray(chunk_ids, dtype='int64')
+            self.doc_lengths[ids] = lengths
+            self.live[ids] = True
+            self._pending.append((np.asarray(term_ids, dtype='int64'), np.asarray(doc_ids, dtype='int64'),
+                                  np.asarray(tfs, dtype='int32')))
+
+    def delete(self, chunk_ids):
+        """
+        标记文本块为已删除
+
+        Args:
+            chunk_ids: 文本块ID列表
+        """
+        with self._lock:
+            ids = np.asarray([int(chunk_id) for chunk_id in chunk_ids if 0 <= int(chunk_id) < len(self.live)],
+                             dtype='int64')
+            self.live[ids] = False
+            self.doc_lengths[ids] = 0
+
+    def search(self, query, top_k=5):
+        """
+        BM25 检索
+
+        Args:
+            query: 查询文本
+            top_k: 返回结果数量
+
+        Returns:
+            (文本块ID数组, BM25得分数组)，按得分降序
+        """
+        with self._lock:
+            self._merge()
+            live_count = int(self.live.sum())
+            term_ids = [self.term_ids[term] for term in set(tokenize(query)) if term in self.term_ids]
+            if not term_ids or live_count == 0:
+                return np.zeros(0, dtype='int64'), np.zeros(0, dtype='float32')
+
+            avg_length = max(float(self.doc_lengths[self.live].mean()), 1e-6)
+            scores = np.zeros(len(self.live), dtype='float32')
+            for term_id in term_ids:
+                start, end = self.offsets[term_id], self.offsets[term_id + 1]
+                doc_ids = self.doc_ids[start:end]
+                tfs = self.tfs[start:end]
+                mask = self.live[doc_ids]
+                doc_ids, tfs = doc_ids[mask], tfs[mask].astype('float32')
+                if len(doc_ids) == 0:
+                    continue
+
+                df = len(doc_ids)
+                idf = np.log(1.0 + (live_count - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1.0 - self.b + self.b * self.doc_lengths[doc_ids] / avg_length)
+                scores[doc_ids] += idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        order = np.argsort(-scores[matched], kind="stable")
+        return matched[order], scores[matched][order]
+
+    def _merge(self, drop_deleted=False):
+        """
+        将暂存的三元组合并进 CSR 倒排表
+
+        Args:
+            drop_deleted: 是否同时清除已删除文本块的倒排项
+        """
+        if not self._pending and not drop_deleted:
+            return
+
+        counts = np.diff(self.offsets)
+        term_ids = [np.repeat(np.arange(len(counts), dtype='int64'), counts)]
+        doc_ids = [self.doc_ids]
+        tfs = [self.tfs]
+        for pending in self._pending:
+            term_ids.append(pending[0])
+            doc_ids.append(pending[1])
+            tfs.append(pending[2])
+        self._pending = []
+
+        term_ids = np.concatenate(term_ids)
+        doc_ids = np.concatenate(doc_ids)
+        tfs = np.concatenate(tfs)
+        if drop_deleted:
+            keep = self.live[doc_ids]
+            term_ids, doc_ids, tfs = term_ids[keep], doc_ids[keep], tfs[keep]
+
+        order = np.lexsort((doc_ids, term_ids))
+        self.doc_ids = doc_ids[order]
+        self.tfs = tfs[order]
+        self.offsets = np.zeros(len(self.terms) + 1, dtype='int64')
+        np.cumsum(np.bincount(term_ids, minlength=len(self.terms)), out=self.offsets[1:])
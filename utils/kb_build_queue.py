@@ -0,0 +1,503 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import copy
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import threading
+import numpy as np
+from utils.chunk_store import ChunkStore
+
+# 构建任务的状态，键为状态标识，值为显示名称
+JOB_STATUSES = {
+    "queued": "排队中",
+    "running": "构建中",
+    "done": "已完成",
+    "failed": "失败",
+    "cancelled": "已取消"
+}
+
+# 构建任务所处的阶段，键为阶段标识，值为显示名称
+BUILD_STAGES = {
+    "extracting": "解析分块",
+    "embedding": "嵌入"
+}
+
+# 任务目录位于知识库根目录下，以点开头，不会被当作知识库列出
+JOBS_DIR = ".jobs"
+
+
+class RateBudget:
+    """所有构建任务共享的嵌入速率预算（令牌桶），单位为文本块/秒"""
+
+    def __init__(self, rate=0):
+        """
+        初始化速率预算
+
+        Args:
+            rate: 每秒允许嵌入的文本块数，0 表示不限制
+        """
+        self.rate = max(0.0, float(rate))
+        self._tokens = self.rate
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    async def acquire(self, amount):
+        """
+        等待直到预算允许嵌入指定数量的文本块
+
+        Args:
+            amount: 文本块数量
+        """
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                # 桶容量至少为一次申请的数量，否则大于每秒速率的窗口永远无法通过
+                capacity = max(self.rate, amount)
+                self._tokens = min(capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            await asyncio.sleep(wait)
+
+
+class BuildCheckpoint:
+    """
+    构建任务的断点
+
+    任务目录中包含两个文件：
+        job.json     任务参数、状态、进度，以及已分配ID的文档及其文本块ID范围（document_ranges）
+        vectors.f32  按文本块ID顺序追加的已嵌入向量，第i行为ID为i的文本块
+    文本块本身写在知识库未提交的一代中（见 VectorStore.new_chunk_store），恢复时与向量一起截断到最后一个完整的文档。
+    """
+
+    def __init__(self, path, job=None):
+        """
+        初始化断点
+
+        Args:
+            path: 任务目录
+            job: 任务信息字典，为None时从 job.json 读取
+        """
+        self.path = path
+        self.job_path = os.path.join(path, "job.json")
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        self._lock = threading.Lock()
+        if job is None:
+            with open(self.job_path, "r", encoding="utf-8") as f:
+                job = json.load(f)
+        self.job = job
+
+    @property
+    def generation(self):
+        """构建中的文本块所在的未提交的一代，尚未开始时为None"""
+        return self.job.get("generation")
+
+    def begin(self, generation, embedding_model):
+        """
+        从头开始构建，清空已有的进度
+
+        Args:
+            generation: 本次构建写入的一代所在目录
+            embedding_model: 嵌入模型名称，恢复时模型不同则不能复用已嵌入的向量
+        """
+        with self._lock:
+            self.job.update({"generation": os.path.abspath(generation), "embedding_model": embedding_model,
+                             "written_id": 0, "document_ranges": {}, "dimension": None})
+            if os.path.exists(self.vectors_path):
+                os.remove(self.vectors_path)
+            self._save()
+
+    def can_resume(self, embedding_model):
+        """
+        判断断点能否用于恢复构建
+
+        Args:
+            embedding_model: 当前的嵌入模型名称
+
+        Returns:
+            是否可以恢复
+        """
+        generation = self.generation
+        return (generation is not None and ChunkStore.exists(generation)
+                and self.job.get("embedding_model") == embedding_model)
+
+    def restore(self):
+        """
+        读取已完成的进度，丢弃最后一个不完整文档及其之后的向量
+
+        Returns:
+            (已完成文档的元数据, 已嵌入的向量数组或None, 下一个文本块ID)
+        """
+        with self._lock:
+            ranges = self.job.get("document_ranges", {})
+            dimension = self.job.get("dimension")
+            written_id = self.job.get("written_id", 0)
+            vectors = None
+            if dimension and os.path.exists(self.vectors_path):
+                vectors = np.fromfile(self.vectors_path, dtype='float32')
+                vectors = vectors[:len(vectors) // dimension * dimension].reshape(-1, dimension)
+                written_id = min(written_id, len(vectors))
+            else:
+                written_id = 0
+
+            # 文本块按ID顺序写入，最后一个文本块ID小于 written_id 的文档已经完整，
+            # 从第一个不完整的文档处继续
+            done = {name: doc for name, doc in ranges.items() if doc["start"] + doc["count"] <= written_id}
+            next_id = min([doc["start"] for name, doc in ranges.items() if name not in done] + [written_id])
+            if vectors is not None:
+                vectors = vectors[:next_id]
+                os.truncate(self.vectors_path, next_id * dimension * 4)
+
+            self.job["written_id"] = next_id
+            self.job["document_ranges"] = done
+            self._save()
+
+        doc_metadata = {name: {"path": doc["path"], "chunk_indices": list(range(doc["start"], doc["start"] + doc["count"]))}
+                        for name, doc in done.items()}
+        return doc_metadata, vectors, next_id
+
+    def record(self, vectors, doc_metadata, written_id):
+        """
+        记录一个已写入的窗口，先追加向量再更新进度，中途中断时多出的向量行在恢复时被截掉
+
+        Args:
+            vectors: 窗口的向量数组，ID连续且紧接上一个窗口
+            doc_metadata: 已分配ID的全部文档的元数据
+            written_id: 已写入的最大文本块ID加一
+        """
+        with self._lock:
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.ascontiguousarray(vectors, dtype='float32').tobytes())
+            self.job["dimension"] = int(vectors.shape[1])
+            self.job["written_id"] = int(written_id)
+            self.job["document_ranges"] = {
+                name: {"path": doc["path"], "start": doc["chunk_indices"][0], "count": len(doc["chunk_indices"])}
+                for name, doc in doc_metadata.items()
+            }
+            self._save()
+
+    def update(self, **fields):
+        """
+        更新任务状态或进度并写入磁盘
+
+        Args:
+            **fields: 要更新的字段
+        """
+        with self._lock:
+            self.job.update(fields)
+            self.job["updated"] = time.time()
+            self._save()
+
+    def snapshot(self):
+        """
+        获取任务信息的副本
+
+        Returns:
+            任务信息字典，不含文档ID范围
+        """
+        with self._lock:
+            job = copy.deepcopy(self.job)
+        job.pop("document_ranges", None)
+        return job
+
+    def clear_vectors(self):
+        """构建完成后删除已不再需要的向量文件"""
+        with self._lock:
+            if os.path.exists(self.vectors_path):
+                os.remove(self.vectors_path)
+
+    def _save(self):
+        """原子地写入 job.json"""
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = self.job_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.job, f, ensure_ascii=False)
+        os.replace(tmp_path, self.job_path)
+
+
+class KnowledgeBaseBuildQueue:
+    """
+    持久化的知识库构建任务队列
+
+    任务在独立线程的事件循环中运行，最多同时构建 build_concurrency 个知识库（同一知识库同时只构建一个），
+    所有任务共享 build_rate_limit 的嵌入速率预算。每个窗口写入后记录断点，程序重启后未完成的任务从断点继续。
+    """
+
+    def __init__(self, knowledge_base_manager, config_manager, listener=None):
+        """
+        初始化构建队列
+
+        Args:
+            knowledge_base_manager: 知识库管理器实例
+            config_manager: 配置管理器实例
+            listener: 任务状态或进度变化时的回调，参数为任务信息字典，在队列线程中调用
+        """
+        self.knowledge_base_manager = knowledge_base_manager
+        self.jobs_path = os.path.join(knowledge_base_manager.vector_store.base_path, JOBS_DIR)
+        self.max_concurrent = max(1, config_manager.get_int_config('KNOWLEDGE_BASE', 'build_concurrency', 2))
+        self.rate_budget = RateBudget(config_manager.get_float_config('KNOWLEDGE_BASE', 'build_rate_limit', 0))
+        self.listener = listener
+
+        self._checkpoints = {}  # 任务ID -> BuildCheckpoint
+        self._tasks = {}  # 任务ID -> 运行中的 asyncio.Task
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+
+    def start(self):
+        """加载磁盘上的任务并启动队列线程，上次未完成的任务重新排队"""
+        if self._thread is not None:
+            return
+
+        self._load()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="kb-build-queue", daemon=True)
+        self._thread.start()
+        self._loop.call_soon_threadsafe(self._schedule)
+
+    def stop(self):
+        """停止队列线程，运行中的任务保留断点，下次启动时继续"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+        self._thread = None
+
+    def submit(self, kb_name, documents, chunk_size=1000, chunk_overlap=200, index_type=None, index_params=None,
+               chunk_unit=None):
+        """
+        提交知识库构建任务，参数与 KnowledgeBaseManager.create_knowledge_base 一致
+
+        Args:
+            kb_name: 知识库名称
+            documents: 文档路径列表
+            chunk_size: 文本块大小
+            chunk_overlap: 文本块重叠大小
+            index_type: 索引类型
+            index_params: 索引构建参数
+            chunk_unit: 文本块大小的单位
+
+        Returns:
+            任务ID
+        """
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        job = {
+            "id": job_id,
+            "kb_name": kb_name,
+            "document_paths": list(documents),
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "index_type": index_type,
+            "index_params": index_params,
+            "chunk_unit": chunk_unit,
+            "status": "queued",
+            "stage": None,
+            "documents_done": 0,
+            "documents_total": len(documents),
+            "documents_failed": 0,
+            "chunks_done": 0,
+            "chunks_per_second": 0.0,
+            "chunks_deduplicated": 0,
+            "error": None,
+            "created": now,
+            "updated": now
+        }
+        checkpoint = BuildCheckpoint(os.path.join(self.jobs_path, job_id), job)
+        checkpoint.update()
+        with self._lock:
+            self._checkpoints[job_id] = checkpoint
+        self._notify(checkpoint)
+        self._call_in_loop(self._schedule)
+        return job_id
+
+    def cancel(self, job_id):
+        """
+        取消任务，排队中的任务直接取消，运行中的任务在当前窗口结束后停止
+
+        Args:
+            job_id: 任务ID
+        """
+        def cancel_in_loop():
+            task = self._tasks.get(job_id)
+            if task is not None:
+                task.cancel()
+                return
+            checkpoint = self._checkpoints.get(job_id)
+            if checkpoint is not None and checkpoint.job["status"] == "queued":
+                checkpoint.update(status="cancelled")
+                self._notify(checkpoint)
+
+        self._call_in_loop(cancel_in_loop)
+
+    def retry(self, job_id):
+        """
+        重新排队失败或已取消的任务，保留的断点会被复用
+
+        Args:
+            job_id: 任务ID
+        """
+        checkpoint = self._checkpoints.get(job_id)
+        if checkpoint is None or checkpoint.job["status"] not in ("failed", "cancelled"):
+            return
+        checkpoint.update(status="queued", error=None)
+        self._notify(checkpoint)
+        self._call_in_loop(self._schedule)
+
+    def remove(self, job_id):
+        """
+        移除未在运行的任务，丢弃其断点和未提交的一代
+
+        Args:
+            job_id: 任务ID
+
+        Returns:
+            是否已移除
+        """
+        with self._lock:
+            checkpoint = self._checkpoints.get(job_id)
+            if checkpoint is None or checkpoint.job["status"] in ("queued", "running"):
+                return False
+            del self._checkpoints[job_id]
+
+        self._discard(checkpoint)
+        return True
+
+    def jobs(self):
+        """
+        获取全部任务
+
+        Returns:
+            任务信息字典列表，按提交时间排序
+        """
+        with self._lock:
+            checkpoints = list(self._checkpoints.values())
+        return sorted((checkpoint.snapshot() for checkpoint in checkpoints), key=lambda job: job["created"])
+
+    def _load(self):
+        """加载磁盘上的任务，清理已完成和已取消的任务"""
+        if not os.path.isdir(self.jobs_path):
+            return
+
+        for job_id in os.listdir(self.jobs_path):
+            path = os.path.join(self.jobs_path, job_id)
+            try:
+                checkpoint = BuildCheckpoint(path)
+            except Exception as e:
+                print(f"读取构建任务 '{job_id}' 出错: {e}")
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+
+            status = checkpoint.job["status"]
+            if status in ("done", "cancelled"):
+                self._discard(checkpoint)
+                continue
+            if status == "running":
+                checkpoint.update(status="queued")
+            with self._lock:
+                self._checkpoints[job_id] = checkpoint
+
+    def _schedule(self):
+        """在队列线程中启动排队的任务，直到达到并发上限"""
+        with self._lock:
+            checkpoints = sorted(self._checkpoints.values(), key=lambda checkpoint: checkpoint.job["created"])
+        building = {self._checkpoints[job_id].job["kb_name"] for job_id in self._tasks}
+        for checkpoint in checkpoints:
+            if len(self._tasks) >= self.max_concurrent:
+                break
+            job = checkpoint.job
+            if job["status"] != "queued" or job["kb_name"] in building:
+                continue
+            building.add(job["kb_name"])
+            self._tasks[job["id"]] = self._loop.create_task(self._run(checkpoint))
+
+    async def _run(self, checkpoint):
+        """
+        运行一个构建任务
+
+        Args:
+            checkpoint: 任务的断点
+        """
+        job = checkpoint.job
+        manager = self.knowledge_base_manager
+        checkpoint.update(status="running", stage="extracting", error=None)
+        self._notify(checkpoint)
+
+        def on_progress(progress):
+            done = progress["documents_done"] + progress.get("documents_restored", 0)
+            checkpoint.update(
+                stage="extracting" if done < job["documents_total"] else "embedding",
+                documents_done=done,
+                documents_failed=len(progress["documents_failed"]),
+                chunks_done=progress["chunks_done"],
+                chunks_per_second=progress["chunks_per_second"],
+                chunks_deduplicated=progress.get("chunks_deduplicated", 0)
+            )
+            self._notify(checkpoint)
+
+        try:
+            success = await manager.create_knowledge_base(
+                job["kb_name"], job["document_paths"], job["chunk_size"], job["chunk_overlap"],
+                index_type=job["index_type"], index_params=job["index_params"], progress_callback=on_progress,
+                chunk_unit=job["chunk_unit"], checkpoint=checkpoint, rate_limiter=self.rate_budget
+            )
+            if success:
+                checkpoint.clear_vectors()
+                checkpoint.update(status="done", stage=None, chunks_per_second=0.0)
+            else:
+                checkpoint.update(status="failed", stage=None, chunks_per_second=0.0,
+                                  error="构建失败，可重试从断点继续")
+        except asyncio.CancelledError:
+            checkpoint.update(status="cancelled", stage=None, chunks_per_second=0.0)
+        except Exception as e:
+            print(f"构建知识库 '{job['kb_name']}' 出错: {e}")
+            checkpoint.update(status="failed", stage=None, chunks_per_second=0.0, error=str(e))
+        finally:
+            self._tasks.pop(job["id"], None)
+            self._notify(checkpoint)
+            self._schedule()
+
+    def _discard(self, checkpoint):
+        """
+        删除任务目录，未完成的任务同时丢弃其未提交的一代
+
+        Args:
+            checkpoint: 任务的断点
+        """
+        generation = checkpoint.generation
+        if checkpoint.job["status"] != "done" and generation and os.path.isdir(generation):
+            self.knowledge_base_manager.vector_store.discard_chunk_store(checkpoint.job["kb_name"], ChunkStore(generation))
+        shutil.rmtree(checkpoint.path, ignore_errors=True)
+
+    def _notify(self, checkpoint):
+        """
+        通知任务变化
+
+        Args:
+            checkpoint: 任务的断点
+        """
+        if self.listener is None:
+            return
+        try:
+            self.listener(checkpoint.snapshot())
+        except Exception as e:
+            print(f"构建任务回调出错: {e}")
+
+    def _call_in_loop(self, callback):
+        """
+        在队列线程中执行回调，队列未启动时只记录状态
+
+        Args:
+            callback: 无参数的回调函数
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(callback)
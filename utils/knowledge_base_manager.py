@@ -3,9 +3,33 @@
 
 import os
 import json
+import time
 import asyncio
-from utils.vector_store import VectorStore
-from utils.document_processor import DocumentProcessor
+import heapq
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import faiss
+import numpy as np
+from utils.vector_store import VectorStore, VECTOR_STORAGE_TYPES
+from utils.inverted_index import InvertedIndex
+from utils.text_splitter import TextSplitter
+from utils.near_duplicate import NearDuplicateFilter
+from utils.result_ranker import RERANKERS, relevance_scores, lexical_scores, mmr_order, pack_by_tokens
+from utils.document_processor import DocumentProcessor, extract_chunks
+from utils.index_benchmark import benchmark_index_types, benchmark_configurations, format_benchmark_report, \
+    DEFAULT_SAMPLE_SIZE
+
+# 支持的查询方式，键为方式标识，值为显示名称
+QUERY_MODES = {
+    "vector": "向量检索",
+    "keyword": "关键词检索 (BM25)",
+    "hybrid": "混合检索"
+}
+
+
+class EmbeddingMismatchError(ValueError):
+    """知识库构建时使用的嵌入模型与当前嵌入模型不一致，查询向量与索引中的向量不可比较"""
+
 
 class KnowledgeBaseManager:
     """知识库管理器"""
@@ -20,7 +44,10 @@ class KnowledgeBaseManager:
         """
         self.config_manager = config_manager
         self.embedding_model = embedding_model
-        self.vector_store = VectorStore()
+        self.vector_store = VectorStore(
+            cache_size_mb=config_manager.get_float_config('KNOWLEDGE_BASE', 'index_cache_mb', 512),
+            mmap_index=config_manager.get_config('KNOWLEDGE_BASE', 'mmap_index', 'true').lower() == 'true'
+        )
         self.document_processors = {}  # 文档处理器字典，键为文件扩展名，值为处理器实例
 
     def register_processor(self, processor):
@@ -33,123 +60,992 @@ class KnowledgeBaseManager:
         for ext in processor.get_supported_extensions():
             self.document_processors[ext] = processor
 
-    async def create_knowledge_base(self, kb_name, documents, chunk_size=1000, chunk_overlap=200):
+    async def create_knowledge_base(self, kb_name, documents, chunk_size=1000, chunk_overlap=200,
+                                    index_type=None, index_params=None, search_params=None,
+                                    progress_callback=None, chunk_unit=None, checkpoint=None, rate_limiter=None):
         """
         创建知识库
 
+        文档以流水线方式处理：读取、分块、嵌入和写入索引按固定大小的窗口推进，
+        各阶段之间通过有界队列反压，峰值内存取决于窗口大小而不是语料大小。
+
         Args:
             kb_name: 知识库名称
             documents: 文档路径列表
-            chunk_size: 文本块大小
-            chunk_overlap: 文本块重叠大小
+            chunk_size: 文本块大小上限
+            chunk_overlap: 文本块重叠大小上限，重叠部分由完整的句子组成
+            index_type: 索引类型，为None时使用配置中的默认值
+            index_params: 索引构建参数，如 {"nlist": 1024, "m": 64, "storage": "sq8", "pca": 256}，见 VectorStore.index_factory_string
+            search_params: 默认查询参数，如 {"nprobe": 16, "ef_search": 64}
+            progress_callback: 进度回调函数，参数为进度信息字典，见 _run_build_pipeline
+            chunk_unit: 文本块大小的单位，char 或 token，为None时使用配置中的默认值
+            checkpoint: 构建断点（kb_build_queue.BuildCheckpoint），提供时每个窗口写入后记录进度，
+                可恢复时从断点继续，构建失败时保留未提交的一代供下次恢复
+            rate_limiter: 嵌入速率预算，提供 acquire(文本块数) 协程，多个构建任务共享
 
         Returns:
             是否创建成功
         """
+        if chunk_unit is None:
+            chunk_unit = self.config_manager.get_config('KNOWLEDGE_BASE', 'chunk_unit', 'char')
+        if index_type is None:
+            index_type = self.config_manager.get_config('KNOWLEDGE_BASE', 'index_type', 'flat')
+        if index_params is None:
+            index_params = {
+                "storage": self.config_manager.get_config('KNOWLEDGE_BASE', 'storage', 'float32'),
+                "pca": self.config_manager.get_int_config('KNOWLEDGE_BASE', 'pca', 0)
+            }
+        if search_params is None:
+            search_params = {
+                "nprobe": self.config_manager.get_int_config('KNOWLEDGE_BASE', 'nprobe', 16),
+                "ef_search": self.config_manager.get_int_config('KNOWLEDGE_BASE', 'ef_search', 64)
+            }
+
+        chunk_store = None
         try:
-            # 处理文档
-            all_chunks = []
-            doc_metadata = {}
-
-            for doc_path in documents:
-                # 获取文件扩展名
-                _, ext = os.path.splitext(doc_path)
-                ext = ext.lower()
-
-                # 获取处理器
-                processor = self.document_processors.get(ext)
-                if processor is None:
-                    print(f"不支持的文件类型: {ext}")
-                    continue
+            def create_index(dimension, num_vectors):
+                return self.vector_store.create_index(kb_name, dimension, index_type, index_params, num_vectors)
 
-                # 处理文档
-                text = processor.process(doc_path)
-                if not text:
-                    continue
+            # 文本块写入新的一代，保存索引时才切换，构建期间查询继续使用已有的同名知识库
+            restored_metadata, restored_vectors, start_id = {}, None, 0
+            inverted_index = InvertedIndex()
+            dedup_filter = self._dedup_filter()
+            if checkpoint is not None and checkpoint.can_resume(self.embedding_model.model_name):
+                chunk_store = self.vector_store.resume_chunk_store(kb_name, checkpoint.generation)
+            if chunk_store is not None:
+                # 从断点继续：截掉不完整的文档，已完成文档的向量直接复用，倒排索引从文本块重建
+                restored_metadata, restored_vectors, start_id = checkpoint.restore()
+                chunk_store.truncate(start_id)
+                ids, texts = [], []
+                for chunk_id, text in chunk_store.iter_chunks():
+                    ids.append(chunk_id)
+                    texts.append(text)
+                await asyncio.to_thread(inverted_index.add, ids, texts)
+                if dedup_filter is not None:
+                    await asyncio.to_thread(dedup_filter.seed, texts)
+                restored_paths = {doc["path"] for doc in restored_metadata.values()}
+                documents = [doc_path for doc_path in documents if doc_path not in restored_paths]
+                print(f"知识库 '{kb_name}' 从断点继续构建，已完成 {len(restored_metadata)} 个文档、{start_id} 个文本块")
+            else:
+                if checkpoint is not None and checkpoint.generation:
+                    # 断点不可用（如更换了嵌入模型），丢弃上次写入的一代
+                    stale = self.vector_store.resume_chunk_store(kb_name, checkpoint.generation)
+                    if stale is not None:
+                        self.vector_store.discard_chunk_store(kb_name, stale)
+                chunk_store = self.vector_store.new_chunk_store(kb_name)
+                if checkpoint is not None:
+                    checkpoint.begin(chunk_store.directory, self.embedding_model.model_name)
 
-                # 分块
-                chunks = self._split_text(text, chunk_size, chunk_overlap)
-                
-                # 添加到列表
-                start_idx = len(all_chunks)
-                all_chunks.extend(chunks)
-                end_idx = len(all_chunks)
-
-                # 添加元数据
-                doc_metadata[os.path.basename(doc_path)] = {
-                    "path": doc_path,
-                    "chunk_indices": list(range(start_idx, end_idx))
-                }
-
-            if not all_chunks:
-                return False
+            def _restored_progress(progress):
+                progress = dict(progress, documents_restored=len(restored_metadata))
+                progress["chunks_done"] += start_id
+                progress_callback(progress)
 
-            # 嵌入文本
-            embeddings = await self.embedding_model.embed_batch(all_chunks)
+            def _checkpoint_window(ids, vectors, doc_metadata):
+                checkpoint.record(vectors, {**restored_metadata, **doc_metadata}, int(ids[-1]) + 1)
 
-            # 创建索引
-            dimension = len(embeddings[0])
-            index = self.vector_store.create_index(kb_name, dimension)
+            # 从断点继续时进度计入已恢复的部分
+            on_progress = _restored_progress if progress_callback and restored_metadata else progress_callback
+            window_callback = _checkpoint_window if checkpoint is not None else None
 
-            # 添加向量
-            import numpy as np
-            vectors = np.array(embeddings).astype('float32')
-            index.add(vectors)
+            initial_vectors = None
+            if restored_vectors is not None and len(restored_vectors):
+                initial_vectors = (np.arange(start_id, dtype='int64'), restored_vectors)
+
+            index, _, doc_metadata, next_id = await self._run_build_pipeline(
+                documents, TextSplitter(chunk_size, chunk_overlap, chunk_unit), start_id, None, chunk_store,
+                inverted_index, create_index,
+                self.vector_store.requires_training(index_type, index_params), on_progress,
+                initial_vectors=initial_vectors, window_callback=window_callback, rate_limiter=rate_limiter,
+                dedup_filter=dedup_filter
+            )
+            doc_metadata = {**restored_metadata, **doc_metadata}
+
+            if index is None:
+                if checkpoint is None:
+                    self.vector_store.discard_chunk_store(kb_name, chunk_store)
+                return False
 
             # 保存元数据
             metadata = {
-                "documents": {str(i): chunk for i, chunk in enumerate(all_chunks)},
                 "doc_metadata": doc_metadata,
                 "chunk_size": chunk_size,
                 "chunk_overlap": chunk_overlap,
-                "embedding_model": self.embedding_model.__class__.__name__
+                "chunk_unit": chunk_unit,
+                "embedding_model": self.embedding_model.__class__.__name__,
+                "embedding_model_name": self.embedding_model.model_name,
+                "embedding_dimension": int(index.d),
+                "index_type": index_type,
+                "index_params": index_params or {},
+                "search_params": search_params,
+                "next_id": next_id,
+                "deleted_ids": []
             }
 
             # 保存索引
-            return self.vector_store.save_index(kb_name, index, metadata)
+            if not self.vector_store.save_index(kb_name, index, metadata, chunk_store, inverted_index):
+                if checkpoint is None:
+                    self.vector_store.discard_chunk_store(kb_name, chunk_store)
+                return False
+            return True
 
         except Exception as e:
             print(f"创建知识库出错: {e}")
+            if chunk_store is not None and checkpoint is None:
+                self.vector_store.discard_chunk_store(kb_name, chunk_store)
             return False
 
-    async def query(self, kb_name, query, top_k=5):
+    async def add_documents(self, kb_name, documents, progress_callback=None):
+        """
+        向已有知识库增量添加文档，同名文档会先被移除再重新添加
+
+        Args:
+            kb_name: 知识库名称
+            documents: 文档路径列表
+            progress_callback: 进度回调函数，参数为进度信息字典
+
+        Returns:
+            是否添加成功
+        """
+        chunk_store = None
+        try:
+            index, metadata = self._load_for_update(kb_name)
+            if index is None:
+                return False
+            self._check_embedding_model(kb_name, index, metadata)
+
+            # 同名文档视为更新，先标记旧文本块为已删除
+            replaced = [os.path.basename(doc_path) for doc_path in documents
+                        if os.path.basename(doc_path) in metadata["doc_metadata"]]
+            removed_ids = self._remove_from_metadata(metadata, replaced)
+
+            # 新文本块从 next_id 开始编号，已有ID保持不变，只嵌入新增的文本块；
+            # 修改写入新的一代，旧版布局中上次中断的追加可能留下残余文本块，先截掉
+            start_id = metadata.get("next_id", index.ntotal)
+            chunk_store = self.vector_store.open_chunk_store(kb_name)
+            if len(chunk_store) > start_id:
+                chunk_store.truncate(start_id)
+            inverted_index = self.vector_store.load_inverted_index(kb_name, use_cache=False)
+            if inverted_index is None:
+                self.vector_store.discard_chunk_store(kb_name, chunk_store)
+                return False
+
+            # 新文档与知识库中保留的文本块比较，被替换文档的旧文本块不参与比较
+            dedup_filter = self._dedup_filter()
+            if dedup_filter is not None:
+                excluded = set(removed_ids)
+                existing = (text for chunk_id, text in chunk_store.iter_chunks() if chunk_id not in excluded)
+                await asyncio.to_thread(dedup_filter.seed, existing)
+
+            _, chunks_added, doc_metadata, next_id = await self._run_build_pipeline(
+                documents, self._splitter_for(metadata), start_id, index, chunk_store, inverted_index,
+                progress_callback=progress_callback, dedup_filter=dedup_filter
+            )
+            if not chunks_added and not replaced:
+                self.vector_store.discard_chunk_store(kb_name, chunk_store)
+                return False
+
+            chunk_store.delete(removed_ids)
+            inverted_index.delete(removed_ids)
+            metadata["doc_metadata"].update(doc_metadata)
+            metadata["next_id"] = next_id
+
+            if not self.vector_store.save_index(kb_name, index, metadata, chunk_store, inverted_index):
+                self.vector_store.discard_chunk_store(kb_name, chunk_store)
+                return False
+            return True
+
+        except EmbeddingMismatchError:
+            raise
+        except Exception as e:
+            print(f"添加文档出错: {e}")
+            if chunk_store is not None:
+                self.vector_store.discard_chunk_store(kb_name, chunk_store)
+            return False
+
+    async def _run_build_pipeline(self, documents, splitter, start_id, index, chunk_store,
+                                  inverted_index, create_index=None, deferred_training=False, progress_callback=None,
+                                  initial_vectors=None, window_callback=None, rate_limiter=None, dedup_filter=None):
+        """
+        流式构建流水线：读取分块 -> 嵌入 -> 写入索引和文本块存储
+
+        读取分块在工作线程中进行，按窗口放入有界队列，嵌入和写入阶段逐窗口消费；
+        队列满时读取阶段等待，从而限制同时驻留内存的文本块和向量数量。
+
+        Args:
+            documents: 文档路径列表
+            splitter: TextSplitter 实例
+            start_id: 第一个文本块的ID
+            index: 已有索引，为None时在拿到第一批向量后调用 create_index 创建
+            chunk_store: 文本块存储，每个窗口的文本在嵌入后追加写入
+            inverted_index: 倒排索引，与嵌入请求并行地为每个窗口分词
+            create_index: 创建索引的函数，参数为 (维度, 预计向量数)
+            deferred_training: 新索引是否需要训练，需要时向量先追加到临时文件，全部嵌入后再从中抽样训练、创建索引
+            progress_callback: 进度回调函数，参数为包含 documents_done、documents_total、
+                documents_failed（(文档名, 错误信息) 列表）、chunks_done、chunks_per_second、
+                chunks_deduplicated（跳过的近似重复文本块数，即节省的嵌入次数）的字典
+            initial_vectors: 断点恢复时已嵌入的 (ID数组, 向量数组)，与新窗口一样写入索引
+            window_callback: 每个窗口写入后的回调，参数为 (ID数组, 向量数组, 已分配ID的文档元数据)
+            rate_limiter: 嵌入速率预算，每个窗口嵌入前等待 acquire(文本块数)
+            dedup_filter: 近似重复过滤器，文本块在分配ID之前过滤，重复的文本块不嵌入、不存储
+
+        Returns:
+            (索引对象, 新增文本块数量, 文档元数据, 下一个可用的文本块ID)
+        """
+        window_size = max(1, self.config_manager.get_int_config('KNOWLEDGE_BASE', 'build_window_size', 256))
+        queue_size = max(1, self.config_manager.get_int_config('KNOWLEDGE_BASE', 'build_queue_size', 2))
+        train_sample_size = max(1, self.config_manager.get_int_config('KNOWLEDGE_BASE', 'train_sample_size', 20000))
+
+        queue = asyncio.Queue(maxsize=queue_size)
+        doc_metadata = {}
+        progress = {"documents_done": 0, "documents_total": len(documents), "documents_failed": [],
+                    "chunks_done": 0, "chunks_per_second": 0.0, "chunks_deduplicated": 0}
+        next_id = start_id
+
+        async def produce():
+            nonlocal next_id
+            extraction = self._extract_documents(documents, splitter)
+            try:
+                window = []
+                # 文档按完成顺序返回，单个文档失败只记录错误，不影响其余文档
+                async for doc_path, chunks, pages, error in extraction:
+                    progress["documents_done"] += 1
+                    if error:
+                        print(f"处理文档 '{doc_path}' 出错: {error}")
+                        progress["documents_failed"].append((os.path.basename(doc_path), error))
+                        if progress_callback:
+                            progress_callback(dict(progress))
+                        continue
+                    if dedup_filter is not None and chunks:
+                        keep = await asyncio.to_thread(dedup_filter.filter, chunks)
+                        progress["chunks_deduplicated"] += keep.count(False)
+                        chunks = [chunk for chunk, kept in zip(chunks, keep) if kept]
+                        pages = [page for page, kept in zip(pages, keep) if kept]
+                    if not chunks:
+                        continue
+
+                    doc_metadata[os.path.basename(doc_path)] = {
+                        "path": doc_path,
+                        "chunk_indices": list(range(next_id, next_id + len(chunks)))
+                    }
+                    for chunk, page in zip(chunks, pages):
+                        window.append((next_id, chunk, page))
+                        next_id += 1
+                        if len(window) >= window_size:
+                            await queue.put(window)
+                            window = []
+                if window:
+                    await queue.put(window)
+            finally:
+                await extraction.aclose()
+                await queue.put(None)
+
+        producer = asyncio.create_task(produce())
+        # 需要训练的索引等全部向量嵌入后再从中随机抽取训练样本，向量暂存在磁盘上，不占用内存
+        pending_ids, pending_file = [], None
+
+        def defer(ids, vectors):
+            nonlocal pending_file
+            if pending_file is None:
+                pending_file = tempfile.NamedTemporaryFile(dir=chunk_store.directory, suffix=".f32", delete=False)
+            pending_file.write(np.ascontiguousarray(vectors, dtype='float32').tobytes())
+            pending_ids.append(ids)
+
+        if initial_vectors is not None:
+            if index is None and not deferred_training:
+                index = create_index(initial_vectors[1].shape[1], None)
+            if index is None:
+                defer(initial_vectors[0], initial_vectors[1])
+            else:
+                index.add_with_ids(initial_vectors[1], initial_vectors[0])
+        started = time.perf_counter()
+
+        try:
+            while True:
+                window = await queue.get()
+                if window is None:
+                    break
+
+                ids = np.array([chunk_id for chunk_id, _, _ in window], dtype='int64')
+                texts = [text for _, text, _ in window]
+                if rate_limiter is not None:
+                    await rate_limiter.acquire(len(texts))
+                # 分词在线程中进行，与嵌入请求重叠
+                vectors, _ = await asyncio.gather(
+                    self.embedding_model.embed_batch(texts),
+                    asyncio.to_thread(inverted_index.add, ids.tolist(), texts)
+                )
+                vectors = np.asarray(vectors, dtype='float32')
+                chunk_store.append(ids.tolist(), texts, [page for _, _, page in window])
+
+                if index is None and not deferred_training:
+                    index = create_index(vectors.shape[1], None)
+
+                if index is None:
+                    defer(ids, vectors)
+                else:
+                    index.add_with_ids(vectors, ids)
+                if window_callback:
+                    window_callback(ids, vectors, doc_metadata)
+
+                progress["chunks_done"] += len(window)
+                progress["chunks_per_second"] = progress["chunks_done"] / max(time.perf_counter() - started, 1e-6)
+                if progress_callback:
+                    progress_callback(dict(progress))
+
+            # 读取阶段的异常在这里重新抛出
+            await producer
+
+            if pending_ids:
+                pending_file.close()
+                index = await asyncio.to_thread(self._create_trained_index, create_index, pending_ids,
+                                                pending_file.name, train_sample_size)
+        except BaseException:
+            producer.cancel()
+            raise
+        finally:
+            if pending_file is not None:
+                pending_file.close()
+                os.remove(pending_file.name)
+
+        if progress["chunks_deduplicated"]:
+            print(f"跳过 {progress['chunks_deduplicated']} 个近似重复的文本块，节省同样次数的嵌入调用")
+
+        return index, progress["chunks_done"], doc_metadata, next_id
+
+    def _create_trained_index(self, create_index, pending_ids, vectors_path, train_sample_size, batch_size=65536):
+        """
+        创建索引，用按固定种子从全部向量中随机抽取的样本训练，随后分批写入全部向量
+
+        Args:
+            create_index: 创建索引的函数，参数为 (维度, 预计向量数)
+            pending_ids: 暂存的ID数组列表
+            vectors_path: 暂存的向量文件，float32，与ID按顺序一一对应
+            train_sample_size: 训练样本数
+            batch_size: 每批写入索引的向量数
+
+        Returns:
+            索引对象
+        """
+        ids = np.concatenate(pending_ids)
+        vectors = np.memmap(vectors_path, dtype='float32', mode='r').reshape(len(ids), -1)
+        index = create_index(vectors.shape[1], len(vectors))
+
+        # 样本覆盖所有文档，不偏向最先处理的文档
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(len(ids), min(train_sample_size, len(ids)), replace=False))
+        self.vector_store.train_index(index, np.ascontiguousarray(vectors[sample]), train_sample_size)
+        for start in range(0, len(ids), batch_size):
+            index.add_with_ids(np.ascontiguousarray(vectors[start:start + batch_size]), ids[start:start + batch_size])
+        del vectors
+        return index
+
+    def remove_documents(self, kb_name, doc_names):
+        """
+        从知识库中移除文档，其文本块在索引中被标记删除，直到执行 compact_knowledge_base
+
+        Args:
+            kb_name: 知识库名称
+            doc_names: 文档名称列表（创建时记录的文件名）
+
+        Returns:
+            是否移除成功
+        """
+        chunk_store = None
+        try:
+            index, metadata = self._load_for_update(kb_name)
+            if index is None:
+                return False
+
+            removed_ids = self._remove_from_metadata(metadata, doc_names)
+            if not removed_ids:
+                return False
+
+            chunk_store = self.vector_store.open_chunk_store(kb_name)
+            chunk_store.delete(removed_ids)
+
+            inverted_index = self.vector_store.load_inverted_index(kb_name, use_cache=False)
+            if inverted_index is not None:
+                inverted_index.delete(removed_ids)
+
+            if not self.vector_store.save_index(kb_name, index, metadata, chunk_store, inverted_index):
+                self.vector_store.discard_chunk_store(kb_name, chunk_store)
+                return False
+            return True
+
+        except Exception as e:
+            print(f"移除文档出错: {e}")
+            if chunk_store is not None:
+                self.vector_store.discard_chunk_store(kb_name, chunk_store)
+            return False
+
+    def compact_knowledge_base(self, kb_name):
+        """
+        压缩知识库，从索引中物理删除已标记删除的文本块（离线操作，耗时与知识库大小相关）
+
+        Args:
+            kb_name: 知识库名称
+
+        Returns:
+            是否压缩成功
+        """
+        try:
+            index, metadata = self._load_for_update(kb_name)
+            if index is None:
+                return False
+
+            deleted_ids = metadata.get("deleted_ids", [])
+            if not deleted_ids:
+                return True
+
+            index = self.vector_store.compact_index(
+                index, deleted_ids, metadata.get("index_type", "flat"), metadata.get("index_params")
+            )
+            metadata["deleted_ids"] = []
+
+            # 重新保存倒排索引会清除已删除文本块的倒排项
+            inverted_index = self.vector_store.load_inverted_index(kb_name, use_cache=False)
+
+            return self.vector_store.save_index(kb_name, index, metadata, inverted_index=inverted_index)
+
+        except Exception as e:
+            print(f"压缩知识库出错: {e}")
+            return False
+
+    def list_documents(self, kb_name):
+        """
+        列出知识库中的文档
+
+        Args:
+            kb_name: 知识库名称
+
+        Returns:
+            文档名称列表
+        """
+        _, metadata = self.vector_store.load_index(kb_name)
+        if metadata is None:
+            return []
+        return list(metadata.get("doc_metadata", {}).keys())
+
+    async def query(self, kb_name, query, top_k=5, search_params=None, mode=None, token_budget=None, reranker=None):
         """
         查询知识库
 
+        先取回 top_k × fetch_factor 个候选，经重排和 MMR 去冗余后再截取，见 _select_results。
+
         Args:
             kb_name: 知识库名称
             query: 查询文本
-            top_k: 返回结果数量
+            top_k: 返回结果数量，指定了token预算时只决定候选数量
+            search_params: 本次查询的索引参数，如 {"nprobe": 32}，为None时使用知识库的默认值
+            mode: 查询方式，见 QUERY_MODES，为None时使用配置中的默认值；
+                vector 的 score 为距离（越小越相关），keyword 为 BM25 得分，hybrid 为融合得分（越大越相关）
+            token_budget: 结果文本的估算token总数上限，0 表示按 top_k 截取，为None时使用配置中的默认值
+            reranker: 重排方式，见 RERANKERS，为None时使用配置中的默认值
 
         Returns:
             查询结果列表
         """
+        if mode is None:
+            mode = self.config_manager.get_config('KNOWLEDGE_BASE', 'query_mode', 'vector')
+
         try:
-            # 嵌入查询文本
-            query_embedding = await self.embedding_model.embed(query)
+            fetch_k = self._candidate_count(top_k)
+            if mode == "keyword":
+                # 关键词检索完全在本地完成，不需要嵌入请求
+                ids, scores = self._keyword_search(kb_name, query, fetch_k)
+            elif mode == "hybrid":
+                ids, scores = await self._hybrid_search(kb_name, query, fetch_k, search_params)
+            else:
+                # 嵌入查询文本
+                query_embedding = await self.embedding_model.embed(query)
+                self._check_embedding_model(kb_name, dimension=len(query_embedding))
 
-            # 搜索
-            distances, ids = self.vector_store.search(kb_name, query_embedding, top_k)
-            if distances is None or ids is None:
+                # 搜索
+                scores, ids = self.vector_store.search(kb_name, query_embedding, fetch_k, search_params)
+            if scores is None or ids is None:
                 return []
 
-            # 获取结果
-            results = []
-            for i, doc_id in enumerate(ids):
-                doc = self.vector_store.get_document(kb_name, doc_id)
+            # 获取候选，一次性取回所有命中的文档
+            docs = self.vector_store.get_documents(kb_name, ids)
+            candidates = []
+            for i, (doc_id, doc) in enumerate(zip(ids, docs)):
                 if doc:
-                    results.append({
+                    candidates.append({
                         "id": int(doc_id),
                         "text": doc,
-                        "score": float(distances[i])
+                        "score": float(scores[i])
                     })
 
-            return results
+            scores = [candidate["score"] for candidate in candidates]
+            if mode not in ("keyword", "hybrid"):
+                scores = self.vector_store.to_similarity(scores, self.vector_store.get_metric_type(kb_name))
+            results = self._select_results(kb_name, query, candidates, relevance_scores(scores), top_k,
+                                           token_budget, reranker)
 
+            return self._attach_pages(kb_name, results)
+
+        except EmbeddingMismatchError:
+            raise
         except Exception as e:
             print(f"查询知识库出错: {e}")
             return []
 
+    def _candidate_count(self, top_k):
+        """
+        计算检索阶段取回的候选数量
+
+        Args:
+            top_k: 返回结果数量
+
+        Returns:
+            候选数量，为 top_k 的 fetch_factor 倍
+        """
+        return top_k * max(1, self.config_manager.get_int_config('KNOWLEDGE_BASE', 'fetch_factor', 4))
+
+    def _select_results(self, kb_name, query, candidates, relevance, top_k, token_budget=None, reranker=None):
+        """
+        检索后处理：重排、MMR 去冗余，再按数量或token预算截取
+
+        重叠分块的知识库中，得分最高的几个候选常常是同一段落，MMR 用候选向量之间的相似度
+        惩罚与已选结果重复的候选。候选向量从索引中重建，不需要额外的嵌入请求。
+
+        Args:
+            kb_name: 知识库名称，候选包含 kb_name 时以候选的为准
+            query: 查询文本
+            candidates: 候选列表，每项至少包含 id、text
+            relevance: 与candidates一一对应的相关度数组，归一化到 [0, 1]
+            top_k: 返回结果数量
+            token_budget: 结果文本的估算token总数上限，0 表示按 top_k 截取，为None时使用配置中的默认值
+            reranker: 重排方式，见 RERANKERS，为None时使用配置中的默认值
+
+        Returns:
+            选中的候选列表，按选中顺序排列
+        """
+        if not candidates:
+            return []
+        if token_budget is None:
+            token_budget = self.config_manager.get_int_config('KNOWLEDGE_BASE', 'token_budget', 0)
+        if reranker is None:
+            reranker = self.config_manager.get_config('KNOWLEDGE_BASE', 'reranker', 'none')
+        mmr_lambda = self.config_manager.get_float_config('KNOWLEDGE_BASE', 'mmr_lambda', 0.7)
+
+        relevance = np.asarray(relevance, dtype='float64')
+        if reranker == "lexical":
+            # 检索得分与候选间的 BM25 得分各占一半
+            relevance = 0.5 * relevance + 0.5 * lexical_scores(query, [candidate["text"] for candidate in candidates])
+        elif reranker not in RERANKERS:
+            print(f"不支持的重排方式: {reranker}，已跳过重排")
+
+        # 按token预算装入时需要完整的候选顺序
+        count = len(candidates) if token_budget > 0 else top_k
+        order = np.argsort(-relevance, kind="stable")[:count].tolist()
+        if mmr_lambda < 1.0 and len(candidates) > 1:
+            vectors = self._candidate_vectors(kb_name, candidates)
+            if vectors is not None:
+                order = mmr_order(relevance, vectors, mmr_lambda, count)
+
+        selected = [candidates[i] for i in order]
+        if token_budget > 0:
+            selected = pack_by_tokens(selected, token_budget)
+        return selected
+
+    def _candidate_vectors(self, kb_name, candidates):
+        """
+        从索引中重建候选的向量，候选来自多个知识库时分别重建
+
+        Args:
+            kb_name: 知识库名称，候选包含 kb_name 时以候选的为准
+            candidates: 候选列表
+
+        Returns:
+            float32 数组，与candidates一一对应；任一知识库无法重建或维度不一致时返回None
+        """
+        groups = {}
+        for position, candidate in enumerate(candidates):
+            groups.setdefault(candidate.get("kb_name", kb_name), []).append(position)
+
+        vectors = None
+        for name, positions in groups.items():
+            group_vectors = self.vector_store.reconstruct_vectors(name, [candidates[i]["id"] for i in positions])
+            if group_vectors is None:
+                return None
+            if vectors is None:
+                vectors = np.zeros((len(candidates), group_vectors.shape[1]), dtype='float32')
+            elif group_vectors.shape[1] != vectors.shape[1]:
+                return None
+            vectors[positions] = group_vectors
+        return vectors
+
+    def _attach_pages(self, kb_name, results):
+        """
+        为查询结果补充来源页码，只有来自分页文档（如PDF）的结果才有 page 字段
+
+        Args:
+            kb_name: 知识库名称
+            results: 查询结果列表，会被原地修改
+
+        Returns:
+            查询结果列表
+        """
+        pages = self.vector_store.get_pages(kb_name, [result["id"] for result in results])
+        for result, page in zip(results, pages):
+            if page is not None:
+                result["page"] = page
+        return results
+
+    def _keyword_search(self, kb_name, query, top_k):
+        """
+        BM25 关键词检索
+
+        Args:
+            kb_name: 知识库名称
+            query: 查询文本
+            top_k: 返回结果数量
+
+        Returns:
+            (ID数组, BM25得分数组)，倒排索引不可用时返回 (None, None)
+        """
+        inverted_index = self.vector_store.load_inverted_index(kb_name)
+        if inverted_index is None:
+            return None, None
+        return inverted_index.search(query, top_k)
+
+    async def _hybrid_search(self, kb_name, query, top_k, search_params=None, query_embedding=None):
+        """
+        混合检索：向量检索与 BM25 各取一批候选，得分分别按最大值归一化后加权融合
+
+        Args:
+            kb_name: 知识库名称
+            query: 查询文本
+            top_k: 返回结果数量
+            search_params: 向量检索的索引参数
+            query_embedding: 已计算的查询向量，为None时在此嵌入
+
+        Returns:
+            (ID列表, 融合得分列表)，按融合得分降序
+        """
+        alpha = self.config_manager.get_float_config('KNOWLEDGE_BASE', 'hybrid_alpha', 0.5)
+        candidates = top_k * 4
+
+        # 关键词检索在本地完成，与嵌入请求并行
+        keyword_task = asyncio.create_task(asyncio.to_thread(self._keyword_search, kb_name, query, candidates))
+        if query_embedding is None:
+            query_embedding = await self.embedding_model.embed(query)
+        self._check_embedding_model(kb_name, dimension=len(query_embedding))
+        distances, vector_ids = self.vector_store.search(kb_name, query_embedding, candidates, search_params)
+        keyword_ids, keyword_scores = await keyword_task
+
+        fused = {}
+        if distances is not None and len(distances):
+            similarity = self.vector_store.to_similarity(distances, self.vector_store.get_metric_type(kb_name))
+            for doc_id, score in zip(vector_ids, similarity / similarity.max()):
+                fused[int(doc_id)] = alpha * float(score)
+        if keyword_scores is not None and len(keyword_scores):
+            for doc_id, score in zip(keyword_ids, keyword_scores / keyword_scores.max()):
+                fused[int(doc_id)] = fused.get(int(doc_id), 0.0) + (1.0 - alpha) * float(score)
+
+        best = heapq.nlargest(top_k, fused.items(), key=lambda item: item[1])
+        return [doc_id for doc_id, _ in best], [score for _, score in best]
+
+    async def query_many(self, kb_name, queries, top_k=5, search_params=None, token_budget=None, reranker=None,
+                         mode=None):
+        """
+        批量查询知识库，所有查询文本一次嵌入、一次检索，结果去重后合并，再经重排和 MMR 去冗余
+
+        Args:
+            kb_name: 知识库名称
+            queries: 查询文本列表
+            top_k: 每个查询返回的结果数量，合并后最多返回 top_k × 查询数 个结果
+            search_params: 本次查询的索引参数，为None时使用知识库的默认值
+            token_budget: 结果文本的估算token总数上限，0 表示按数量截取，为None时使用配置中的默认值
+            reranker: 重排方式，见 RERANKERS，为None时使用配置中的默认值
+            mode: 查询方式，见 QUERY_MODES，为None时使用配置中的默认值；keyword 不调用嵌入接口
+
+        Returns:
+            查询结果列表，按选中顺序排列；score 的含义与 query 相同，同一文本块被多个查询命中时只保留最好的得分，
+            query_indices 记录命中它的查询序号
+        """
+        if mode is None:
+            mode = self.config_manager.get_config('KNOWLEDGE_BASE', 'query_mode', 'vector')
+        # 向量检索的 score 为距离，越小越好；其余方式越大越好
+        larger_is_better = mode in ("keyword", "hybrid")
+
+        try:
+            queries = [query for query in queries if query]
+            if not queries:
+                return []
+
+            fetch_k = self._candidate_count(top_k)
+            if mode == "keyword":
+                # 关键词检索完全在本地完成，不需要嵌入请求
+                hits = []
+                for query in queries:
+                    ids, scores = self._keyword_search(kb_name, query, fetch_k)
+                    hits.append(([], []) if ids is None else (scores, ids))
+            else:
+                # 所有查询文本一次嵌入
+                query_embeddings = await self.embedding_model.embed_batch(queries, store=False)
+                self._check_embedding_model(kb_name, dimension=query_embeddings.shape[1])
+                if mode == "hybrid":
+                    hits = []
+                    for query, query_embedding in zip(queries, query_embeddings):
+                        ids, scores = await self._hybrid_search(kb_name, query, fetch_k, search_params,
+                                                                query_embedding)
+                        hits.append((scores, ids))
+                else:
+                    hits = self.vector_store.search_many(kb_name, query_embeddings, fetch_k, search_params)
+            if hits is None:
+                return []
+
+            # 按文本块ID去重，保留最好的得分
+            better = max if larger_is_better else min
+            merged = {}
+            for query_index, (scores, ids) in enumerate(hits):
+                for score, doc_id in zip(scores, ids):
+                    doc_id = int(doc_id)
+                    result = merged.get(doc_id)
+                    if result is None:
+                        merged[doc_id] = {"id": doc_id, "score": float(score), "query_indices": [query_index]}
+                    else:
+                        result["score"] = better(result["score"], float(score))
+                        result["query_indices"].append(query_index)
+
+            # 获取结果，一次性取回所有命中的文档
+            ordered = sorted(merged.values(), key=lambda result: result["score"], reverse=larger_is_better)
+            docs = self.vector_store.get_documents(kb_name, [result["id"] for result in ordered])
+            candidates = []
+            for result, doc in zip(ordered, docs):
+                if doc:
+                    result["text"] = doc
+                    candidates.append(result)
+
+            scores = [candidate["score"] for candidate in candidates]
+            if not larger_is_better:
+                scores = self.vector_store.to_similarity(scores, self.vector_store.get_metric_type(kb_name))
+            results = self._select_results(kb_name, " ".join(queries), candidates, relevance_scores(scores),
+                                           top_k * len(queries), token_budget, reranker)
+
+            return self._attach_pages(kb_name, results)
+
+        except EmbeddingMismatchError:
+            raise
+        except Exception as e:
+            print(f"批量查询知识库出错: {e}")
+            return []
+
+    async def query_federated(self, kb_names, query, top_k=5, search_params=None, token_budget=None,
+                              reranker=None, mode=None):
+        """
+        跨多个知识库联合查询，查询文本只嵌入一次，各知识库并发检索后按相似度合并，再经重排和 MMR 去冗余
+
+        不同知识库的索引可能使用不同的距离度量，合并前统一转换为越大越相似的得分；
+        BM25 得分依赖各知识库自己的词频统计，合并前按各知识库的最高分归一化。
+        向量检索和混合检索要求所有知识库使用当前的嵌入模型构建，否则抛出 EmbeddingMismatchError。
+
+        Args:
+            kb_names: 知识库名称列表
+            query: 查询文本
+            top_k: 返回结果数量
+            search_params: 本次查询的索引参数，为None时使用各知识库的默认值
+            token_budget: 结果文本的估算token总数上限，0 表示按 top_k 截取，为None时使用配置中的默认值
+            reranker: 重排方式，见 RERANKERS，为None时使用配置中的默认值
+            mode: 查询方式，见 QUERY_MODES，为None时使用配置中的默认值；keyword 不调用嵌入接口
+
+        Returns:
+            查询结果列表，按选中顺序排列，每项包含 kb_name、id、text、score，向量检索时还包含 distance
+        """
+        if mode is None:
+            mode = self.config_manager.get_config('KNOWLEDGE_BASE', 'query_mode', 'vector')
+
+        try:
+            kb_names = list(dict.fromkeys(kb_names))
+            if not kb_names:
+                return []
+
+            # 查询文本只嵌入一次，所有知识库必须用同一个嵌入模型构建；关键词检索不需要
+            query_embedding = None
+            if mode != "keyword":
+                self._check_federation_embeddings(kb_names)
+                query_embedding = await self.embedding_model.embed(query)
+
+            # 各知识库并发检索
+            fetch_k = self._candidate_count(top_k)
+            hits = await asyncio.gather(*[
+                self._search_for_federation(kb_name, query, query_embedding, fetch_k, search_params, mode)
+                for kb_name in kb_names
+            ])
+
+            # 用堆选出全局得分最高的候选
+            candidates = [candidate for kb_hits in hits for candidate in kb_hits]
+            best = heapq.nlargest(fetch_k, candidates, key=lambda candidate: candidate["score"])
+
+            candidates = []
+            for kb_name in kb_names:
+                selected = [candidate for candidate in best if candidate["kb_name"] == kb_name]
+                if not selected:
+                    continue
+                docs = self.vector_store.get_documents(kb_name, [candidate["id"] for candidate in selected])
+                for candidate, doc in zip(selected, docs):
+                    if doc:
+                        candidate["text"] = doc
+                        candidates.append(candidate)
+
+            candidates.sort(key=lambda candidate: candidate["score"], reverse=True)
+            relevance = relevance_scores([candidate["score"] for candidate in candidates])
+            results = self._select_results(None, query, candidates, relevance, top_k, token_budget, reranker)
+
+            for kb_name in kb_names:
+                self._attach_pages(kb_name, [result for result in results if result["kb_name"] == kb_name])
+            return results
+
+        except EmbeddingMismatchError:
+            raise
+        except Exception as e:
+            print(f"联合查询知识库出错: {e}")
+            return []
+
+    def _check_federation_embeddings(self, kb_names):
+        """
+        按嵌入模型签名（模型名称、向量维度）对知识库分组，分组之间不一致或与当前嵌入模型不一致时拒绝联合查询
+
+        Args:
+            kb_names: 知识库名称列表
+
+        Raises:
+            EmbeddingMismatchError: 知识库使用了不同的嵌入模型
+        """
+        groups = {}
+        for kb_name in kb_names:
+            index, metadata = self.vector_store.load_index(kb_name)
+            if index is None:
+                continue
+            signature = (metadata.get("embedding_model_name"), int(metadata.get("embedding_dimension") or index.d))
+            groups.setdefault(signature, []).append(kb_name)
+
+        # 旧版知识库没有记录模型名称，只要求维度一致
+        names = {name for name, _ in groups if name}
+        dimensions = {dimension for _, dimension in groups}
+        if len(names) > 1 or len(dimensions) > 1:
+            details = "；".join(f"{name or '未记录'}（{dimension} 维）: {', '.join(members)}"
+                               for (name, dimension), members in groups.items())
+            raise EmbeddingMismatchError(f"联合查询的知识库使用了不同的嵌入模型，请分别查询或重建知识库：{details}")
+        for members in groups.values():
+            self._check_embedding_model(members[0])
+
+    async def _search_for_federation(self, kb_name, query, query_embedding, top_k, search_params, mode="vector"):
+        """
+        检索单个知识库，得分统一为越大越相关
+
+        Args:
+            kb_name: 知识库名称
+            query: 查询文本
+            query_embedding: 查询向量，关键词检索时为None
+            top_k: 返回结果数量
+            search_params: 索引参数
+            mode: 查询方式，见 QUERY_MODES
+
+        Returns:
+            候选列表，每项包含 kb_name、id、score，向量检索时还包含 distance
+        """
+        if mode in ("keyword", "hybrid"):
+            if mode == "keyword":
+                ids, scores = await asyncio.to_thread(self._keyword_search, kb_name, query, top_k)
+                if ids is None or not len(scores):
+                    return []
+                scores = np.asarray(scores, dtype='float64') / max(float(np.max(scores)), 1e-12)
+            else:
+                # 融合得分已按各知识库的最高分归一化
+                ids, scores = await self._hybrid_search(kb_name, query, top_k, search_params, query_embedding)
+            return [{"kb_name": kb_name, "id": int(doc_id), "score": float(score)}
+                    for doc_id, score in zip(ids, scores)]
+
+        self._check_embedding_model(kb_name, dimension=len(query_embedding))
+
+        # faiss 检索时释放GIL，放到线程中可以真正并行
+        distances, ids = await asyncio.to_thread(self.vector_store.search, kb_name, query_embedding, top_k,
+                                                 search_params)
+        if distances is None or ids is None:
+            return []
+
+        scores = self.vector_store.to_similarity(distances, self.vector_store.get_metric_type(kb_name))
+        return [
+            {"kb_name": kb_name, "id": int(doc_id), "score": float(score), "distance": float(distance)}
+            for doc_id, score, distance in zip(ids, scores, distances)
+        ]
+
+    def benchmark_index_types(self, kb_name, index_types=None, search_params=None, num_queries=100, top_k=10):
+        """
+        比较各索引类型在该知识库上的召回率与查询延迟
+
+        Args:
+            kb_name: 知识库名称
+            index_types: 要评估的索引类型列表，为None时评估全部类型
+            search_params: 各索引类型的查询参数列表，见 benchmark_index_types
+            num_queries: 查询样本数量
+            top_k: 计算召回率时使用的结果数量
+
+        Returns:
+            (评估结果列表, 报告文本)
+        """
+        if search_params is None:
+            search_params = {
+                "ivf_flat": [{"nprobe": n} for n in (1, 8, 32)],
+                "ivf_pq": [{"nprobe": n} for n in (1, 8, 32)],
+                "hnsw": [{"ef_search": n} for n in (16, 64, 256)]
+            }
+        results = benchmark_index_types(self.vector_store, kb_name, index_types,
+                                        search_params=search_params, num_queries=num_queries, top_k=top_k,
+                                        sample_size=self._benchmark_sample_size())
+        return results, format_benchmark_report(results, top_k)
+
+    def benchmark_storage_options(self, kb_name, index_type=None, pca_dims=None, num_queries=100, top_k=10):
+        """
+        比较各向量存储格式与PCA降维在该知识库上的召回率、延迟和每向量字节数
+
+        Args:
+            kb_name: 知识库名称
+            index_type: 评估使用的索引类型，为None时使用知识库当前的索引类型（ivf_pq 按 ivf_flat 评估）
+            pca_dims: 要评估的PCA降维维度列表，为None时评估原维度的1/2和1/4
+            num_queries: 查询样本数量
+            top_k: 计算召回率时使用的结果数量
+
+        Returns:
+            (评估结果列表, 报告文本)
+        """
+        index, metadata = self.vector_store.load_index(kb_name)
+        if index is None or metadata is None:
+            return [], "没有可评估的向量"
+        if index_type is None:
+            index_type = metadata.get("index_type", "flat")
+        if index_type == "ivf_pq":
+            index_type = "ivf_flat"
+
+        dimension = index.d
+        if pca_dims is None:
+            pca_dims = [dimension // 2, dimension // 4]
+
+        # 使用知识库当前的查询参数，只比较存储格式带来的差异
+        relevant = {"ivf_flat": "nprobe", "hnsw": "ef_search"}.get(index_type)
+        search_params = [{k: v for k, v in (metadata.get("search_params") or {}).items() if k == relevant}]
+        configurations = [
+            {"index_type": index_type, "index_params": {"storage": storage}, "search_params": search_params}
+            for storage in VECTOR_STORAGE_TYPES
+        ]
+        configurations += [
+            {"index_type": index_type, "index_params": {"storage": storage, "pca": pca}, "search_params": search_params}
+            for pca in pca_dims if 0 < pca < dimension
+            for storage in ("float32", "sq8")
+        ]
+        results = benchmark_configurations(self.vector_store, kb_name, configurations, num_queries, top_k,
+                                           self._benchmark_sample_size())
+        return results, format_benchmark_report(results, top_k)
+
+    def _benchmark_sample_size(self):
+        """评估索引时最多使用的向量数"""
+        return max(2, self.config_manager.get_int_config('KNOWLEDGE_BASE', 'benchmark_sample_size',
+                                                         DEFAULT_SAMPLE_SIZE))
+
     def list_knowledge_bases(self):
         """
         列出所有知识库
@@ -171,28 +1067,180 @@ class KnowledgeBaseManager:
         """
         return self.vector_store.delete_knowledge_base(kb_name)
 
-    def _split_text(self, text, chunk_size, chunk_overlap):
+    async def _extract_documents(self, documents, splitter):
         """
-        分割文本
+        并行读取并分块文档，CPU密集的解析在进程池中进行，结果按完成顺序返回
+
+        同时在途的文档数限制为工作进程数的两倍，下游处理不过来时不会继续提交新文档。
 
         Args:
-            text: 文本
-            chunk_size: 文本块大小
-            chunk_overlap: 文本块重叠大小
+            documents: 文档路径列表
+            splitter: TextSplitter 实例
+
+        Yields:
+            (文档路径, 文本块列表, 页码列表, 错误信息)，成功时错误信息为None
+        """
+        workers = self.config_manager.get_int_config('KNOWLEDGE_BASE', 'extract_workers', 0) or os.cpu_count() or 1
+        workers = max(1, min(workers, len(documents)))
+
+        loop = asyncio.get_running_loop()
+        # 单个文档或单个工作进程时不值得启动进程池，在线程中处理即可
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        pending = iter(documents)
+        in_flight = {}
+
+        def submit_next():
+            doc_path = next(pending, None)
+            if doc_path is None:
+                return
+            processor = self.document_processors.get(os.path.splitext(doc_path)[1].lower())
+            if executor is not None:
+                future = loop.run_in_executor(executor, extract_chunks, processor, doc_path, splitter)
+            else:
+                future = asyncio.ensure_future(asyncio.to_thread(extract_chunks, processor, doc_path, splitter))
+            in_flight[future] = doc_path
+
+        try:
+            for _ in range(workers * 2):
+                submit_next()
+
+            while in_flight:
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    doc_path = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # 工作进程崩溃或处理器无法序列化
+                        result = (doc_path, [], [], str(e))
+                    submit_next()
+                    yield result
+        finally:
+            for future in in_flight:
+                future.cancel()
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def _check_embedding_model(self, kb_name, index=None, metadata=None, dimension=None):
+        """
+        检查知识库构建时使用的嵌入模型与当前嵌入模型是否一致
+
+        旧版知识库没有记录嵌入模型名称，只比较向量维度。
+
+        Args:
+            kb_name: 知识库名称
+            index: 已加载的索引，为None时从共享缓存加载
+            metadata: 已加载的元数据，为None时从共享缓存加载
+            dimension: 当前查询向量的维度，为None时只比较模型名称
+
+        Raises:
+            EmbeddingMismatchError: 模型名称或向量维度不一致
+        """
+        if metadata is None:
+            index, metadata = self.vector_store.load_index(kb_name)
+            if index is None:
+                return
+
+        built_with = metadata.get("embedding_model_name")
+        current = self.embedding_model.model_name
+        if built_with and current and built_with != current:
+            raise EmbeddingMismatchError(
+                f"知识库 '{kb_name}' 使用嵌入模型 {built_with} 构建，当前嵌入模型为 {current}，"
+                f"请切换回原嵌入模型或重建知识库"
+            )
+
+        expected = metadata.get("embedding_dimension") or index.d
+        if dimension is not None and int(dimension) != int(expected):
+            raise EmbeddingMismatchError(
+                f"知识库 '{kb_name}' 的向量维度为 {expected}，当前嵌入模型 {current} 的向量维度为 {dimension}，"
+                f"请切换回原嵌入模型或重建知识库"
+            )
+
+    def _load_for_update(self, kb_name):
+        """
+        加载知识库的独立副本用于修改，旧版知识库的索引会被转换为以ID寻址的索引
+
+        Args:
+            kb_name: 知识库名称
 
         Returns:
-            文本块列表
+            (索引对象, 元数据)
         """
-        if not text:
-            return []
+        # 不使用缓存，避免修改正在被查询共享的索引
+        index, metadata = self.vector_store.load_index(kb_name, use_cache=False)
+        if index is None:
+            return None, None
+
+        if not isinstance(index, faiss.IndexIDMap2):
+            ids, vectors = self.vector_store.reconstruct_all(index)
+            id_index = faiss.IndexIDMap2(self.vector_store.build_index(index.d, metadata.get("index_type", "flat"),
+                                                                       metadata.get("index_params"), len(ids)))
+            self.vector_store.train_index(id_index, vectors)
+            id_index.add_with_ids(vectors, ids)
+            index = id_index
+
+        metadata.setdefault("next_id", index.ntotal)
+        metadata.setdefault("deleted_ids", [])
+        return index, metadata
+
+    def _remove_from_metadata(self, metadata, doc_names):
+        """
+        从元数据中移除文档，并将其文本块ID加入删除标记
+
+        Args:
+            metadata: 知识库元数据
+            doc_names: 文档名称列表
+
+        Returns:
+            被移除的文本块ID列表，没有文档被移除时为空列表
+        """
+        removed = []
+        deleted_ids = set(metadata.get("deleted_ids", []))
+        for doc_name in doc_names:
+            doc_info = metadata["doc_metadata"].pop(doc_name, None)
+            if doc_info is None:
+                continue
+            removed.extend(doc_info["chunk_indices"])
+            deleted_ids.update(doc_info["chunk_indices"])
+
+        metadata["deleted_ids"] = sorted(deleted_ids)
+        return removed
+
+    def _dedup_filter(self):
+        """
+        按配置创建近似重复过滤器
+
+        Returns:
+            NearDuplicateFilter 实例，dedup_threshold 为0时返回None
+        """
+        threshold = self.config_manager.get_float_config('KNOWLEDGE_BASE', 'dedup_threshold', 0)
+        if threshold <= 0:
+            return None
+        return NearDuplicateFilter(min(threshold, 1.0))
+
+    def _splitter_for(self, metadata):
+        """
+        按知识库创建时的分块参数构建分割器
+
+        Args:
+            metadata: 知识库元数据
 
-        chunks = []
-        start = 0
-        text_len = len(text)
+        Returns:
+            TextSplitter 实例
+        """
+        return TextSplitter(metadata["chunk_size"], metadata["chunk_overlap"], metadata.get("chunk_unit", "char"))
+
+    def _split_text(self, text, chunk_size, chunk_overlap, chunk_unit="char"):
+        """
+        分割文本，文本块在句子和段落边界处结束
 
-        while start < text_len:
-            end = min(start + chunk_size, text_len)
-            chunks.append(text[start:end])
-            start += chunk_size - chunk_overlap
+        Args:
+            text: 文本
+            chunk_size: 文本块大小上限
+            chunk_overlap: 文本块重叠大小上限
+            chunk_unit: 长度单位，char 或 token
 
-        return chunks
+        Returns:
+            文本块列表
+        """
+        return TextSplitter(chunk_size, chunk_overlap, chunk_unit).split(text)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+import threading
+import numpy as np
+
+# 归一化时去掉的字符：空白和常见中英文标点，排版差异不影响相似度
+_NORMALIZE_PATTERN = re.compile(r'[\s\u3000-\u303f\uff00-\uff0f\uff1a-\uff20!-/:-@\[-`{-~\u201c\u201d\u2018\u2019\u2026\u2014]+')
+
+# 滚动哈希的乘数（64位，奇数）
+_SHINGLE_PRIME = np.uint64(0x100000001b3)
+
+# 计算签名时每批最多的文本数和 n-gram 数，中间矩阵为 num_perm × n-gram 数的 uint64，
+# 64 个哈希函数时每批约 32MB，与输入总量无关
+SIGNATURE_BATCH_TEXTS = 256
+SIGNATURE_BATCH_SHINGLES = 65536
+
+
+class NearDuplicateFilter:
+    """
+    基于 MinHash 的近似重复文本块过滤器
+
+    每个文本块取字符 n-gram 集合计算 MinHash 签名，签名分段后做局部敏感哈希（LSH）寻找候选，
+    候选与已保留文本块的签名一致比例（Jaccard 相似度的估计值）达到阈值即视为近似重复。
+    字符 n-gram 对中文和英文同样适用，不需要分词。
+    """
+
+    def __init__(self, threshold=0.9, num_perm=64, bands=16, shingle_size=5, seed=1):
+        """
+        初始化过滤器
+
+        Args:
+            threshold: 判定为近似重复的 Jaccard 相似度阈值
+            num_perm: MinHash 签名长度
+            bands: LSH 分段数，必须能整除 num_perm；分段越多，越低的相似度也会成为候选
+            shingle_size: 字符 n-gram 的长度
+            seed: 哈希函数的随机种子，同一知识库的构建必须一致
+        """
+        if num_perm % bands != 0:
+            raise ValueError(f"LSH分段数 {bands} 必须能整除签名长度 {num_perm}")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+
+        # 乘加移位哈希族 h(x) = ((a * x + b) mod 2^64) >> 32，a 为奇数
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+
+        self._signatures = []  # 已保留文本块的签名
+        self._buckets = [{} for _ in range(bands)]  # 每段一个字典：分段字节 -> 已保留签名的下标列表
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.duplicates = 0
+
+    def filter(self, texts):
+        """
+        过滤近似重复的文本块，保留的文本块会被记录，之后的文本与其比较
+
+        Args:
+            texts: 文本列表，列表内部的重复同样会被过滤
+
+        Returns:
+            与texts一一对应的布尔列表，True 表示保留
+        """
+        if not texts:
+            return []
+
+        signatures = self.signatures(texts)
+        rows = self.num_perm // self.bands
+        keep = []
+        with self._lock:
+            for signature in signatures:
+                keys = [signature[band * rows:(band + 1) * rows].tobytes() for band in range(self.bands)]
+                candidates = {index for band, key in enumerate(keys) for index in self._buckets[band].get(key, ())}
+                duplicate = any(np.mean(self._signatures[index] == signature) >= self.threshold
+                                for index in candidates)
+
+                self.checked += 1
+                if duplicate:
+                    self.duplicates += 1
+                    keep.append(False)
+                    continue
+
+                index = len(self._signatures)
+                self._signatures.append(signature)
+                for band, key in enumerate(keys):
+                    self._buckets[band].setdefault(key, []).append(index)
+                keep.append(True)
+        return keep
+
+    def seed(self, texts, window=SIGNATURE_BATCH_TEXTS * 4):
+        """
+        逐窗口记录已有的文本块，之后的文本与其比较；texts 可以是迭代器，不会一次读入全部文本
+
+        Args:
+            texts: 文本的可迭代对象
+            window: 每次处理的文本数
+        """
+        batch = []
+        for text in texts:
+            batch.append(text)
+            if len(batch) >= window:
+                self.filter(batch)
+                batch = []
+        if batch:
+            self.filter(batch)
+
+    def signatures(self, texts):
+        """
+        批量计算 MinHash 签名，按文本数和 n-gram 数分批，峰值内存与输入总量无关
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            uint32 数组，形状为 (len(texts), num_perm)
+        """
+        result = np.empty((len(texts), self.num_perm), dtype='uint32')
+        batch, batch_start, batch_shingles = [], 0, 0
+        for position, text in enumerate(texts):
+            hashes = self._shingles(text)
+            if batch and (len(batch) >= SIGNATURE_BATCH_TEXTS or batch_shingles + len(hashes) > SIGNATURE_BATCH_SHINGLES):
+                result[batch_start:position] = self._batch_signatures(batch)
+                batch, batch_start, batch_shingles = [], position, 0
+            batch.append(hashes)
+            batch_shingles += len(hashes)
+        if batch:
+            result[batch_start:] = self._batch_signatures(batch)
+        return result
+
+    def _batch_signatures(self, shingles):
+        """
+        计算一批文本的签名
+
+        Args:
+            shingles: 每个文本的 n-gram 哈希数组列表
+
+        Returns:
+            uint32 数组，形状为 (len(shingles), num_perm)
+        """
+        if len(shingles) == 1:
+            # 单个超长文本按列分段取最小值
+            minimum = np.full(self.num_perm, np.iinfo('uint64').max, dtype='uint64')
+            for start in range(0, len(shingles[0]), SIGNATURE_BATCH_SHINGLES):
+                hashes = shingles[0][start:start + SIGNATURE_BATCH_SHINGLES]
+                permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) >> np.uint64(32)
+                minimum = np.minimum(minimum, permuted.min(axis=1))
+            return minimum[None, :].astype('uint32')
+
+        lengths = np.array([len(hashes) for hashes in shingles], dtype='int64')
+        hashes = np.concatenate(shingles)
+
+        # 一批文本的 n-gram 一次完成哈希，再按文本分段取最小值
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) >> np.uint64(32)
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        return np.minimum.reduceat(permuted, starts, axis=1).T.astype('uint32')
+
+    def _shingles(self, text):
+        """
+        计算文本的字符 n-gram 哈希
+
+        Args:
+            text: 文本
+
+        Returns:
+            uint64 数组，至少包含一个元素
+        """
+        codes = np.frombuffer(_NORMALIZE_PATTERN.sub("", text.lower()).encode("utf-32-le"), dtype='uint32')
+        codes = codes.astype('uint64')
+        count = len(codes) - self.shingle_size + 1
+        if count <= 0:
+            # 短于一个 n-gram 的文本整体作为一个片段
+            hashes = np.zeros(1, dtype='uint64')
+            for code in codes:
+                hashes = hashes * _SHINGLE_PRIME + code
+            return hashes
+
+        hashes = np.zeros(count, dtype='uint64')
+        for k in range(self.shingle_size):
+            hashes = hashes * _SHINGLE_PRIME + codes[k:k + count]
+        return np.unique(hashes)
@@ -18,15 +18,25 @@ class PdfProcessor(DocumentProcessor):
             处理后的文本内容
         """
         try:
-            doc = fitz.open(file_path)
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            return text
+            return "".join(text for _, text in self.iter_segments(file_path))
         except Exception as e:
             print(f"处理PDF文档出错: {e}")
             return None
 
+    def iter_segments(self, file_path):
+        """
+        逐页读取PDF文档，同一时间只持有一页的文本
+
+        Args:
+            file_path: 文档路径
+
+        Yields:
+            (页码, 页面文本)，页码从1开始
+        """
+        with fitz.open(file_path) as doc:
+            for page_no, page in enumerate(doc, start=1):
+                yield page_no, page.get_text()
+
     def get_supported_extensions(self):
         """
         获取支持的文件扩展名
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from collections import Counter
+import numpy as np
+from utils.inverted_index import tokenize
+from embedding_models.embedding_model import estimate_tokens
+
+# 支持的重排方式，键为重排方式标识，值为显示名称
+RERANKERS = {
+    "none": "不重排",
+    "lexical": "关键词重排"
+}
+
+
+def relevance_scores(scores, larger_is_better=True):
+    """
+    将检索得分归一化到 [0, 1]，越大越相关
+
+    Args:
+        scores: 得分数组
+        larger_is_better: 得分是否越大越相关，为False时（如L2距离）先取相反数
+
+    Returns:
+        float64 数组，最相关的候选为1
+    """
+    scores = np.asarray(scores, dtype='float64')
+    if len(scores) == 0:
+        return scores
+    if not larger_is_better:
+        scores = -scores
+    low, high = scores.min(), scores.max()
+    if high - low < 1e-12:
+        return np.ones(len(scores))
+    return (scores - low) / (high - low)
+
+
+def lexical_scores(query, texts, k1=1.5, b=0.75):
+    """
+    以候选集合为语料计算 BM25 得分，作为本地的轻量重排器，不需要模型和网络
+
+    与知识库的 BM25 检索使用同一分词方式，IDF 只在候选之间比较，
+    因此能区分"都与查询语义相近"的候选中谁真正包含查询中的词。
+
+    Args:
+        query: 查询文本
+        texts: 候选文本列表
+        k1: BM25 词频饱和参数
+        b: BM25 长度归一化参数
+
+    Returns:
+        float64 数组，归一化到 [0, 1]，没有任何候选包含查询词时全为0
+    """
+    terms = set(tokenize(query))
+    scores = np.zeros(len(texts))
+    if not terms or not texts:
+        return scores
+
+    counts = [Counter(tokenize(text)) for text in texts]
+    lengths = np.array([sum(count.values()) for count in counts], dtype='float64')
+    norm = k1 * (1.0 - b + b * lengths / max(lengths.mean(), 1e-6))
+    for term in terms:
+        tfs = np.array([count.get(term, 0) for count in counts], dtype='float64')
+        df = int((tfs > 0).sum())
+        if df == 0:
+            continue
+        idf = np.log(1.0 + (len(texts) - df + 0.5) / (df + 0.5))
+        scores += idf * tfs * (k1 + 1.0) / (tfs + norm)
+
+    high = scores.max()
+    return scores / high if high > 0 else scores
+
+
+def mmr_order(relevance, vectors, lambda_mult=0.7, count=None):
+    """
+    最大边际相关性（MMR）排序：每一步选择 lambda*相关度 - (1-lambda)*与已选结果的最大相似度 最高的候选
+
+    候选之间的余弦相似度矩阵一次算出，之后每步只需一次向量化的取最大值更新。
+
+    Args:
+        relevance: 候选的相关度数组，越大越相关
+        vectors: 候选的向量数组，形状为 (候选数, 维度)
+        lambda_mult: 相关度的权重，1 时等同于按相关度排序，越小结果越分散
+        count: 选出的结果数量，为None时对全部候选排序
+
+    Returns:
+        选中候选的下标列表，按选中顺序排列
+    """
+    relevance = np.asarray(relevance, dtype='float64')
+    total = len(relevance)
+    count = total if count is None else min(count, total)
+    if count <= 0:
+        return []
+
+    vectors = np.asarray(vectors, dtype='float32')
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    normalized = vectors / np.maximum(norms, 1e-12)
+    similarity = normalized @ normalized.T
+
+    selected = []
+    max_similarity = np.full(total, -np.inf)
+    available = np.ones(total, dtype=bool)
+    for _ in range(count):
+        redundancy = np.where(np.isfinite(max_similarity), max_similarity, 0.0)
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        chosen = int(np.argmax(scores))
+        selected.append(chosen)
+        available[chosen] = False
+        max_similarity = np.maximum(max_similarity, similarity[chosen])
+    return selected
+
+
+def pack_by_tokens(results, token_budget):
+    """
+    按顺序装入结果，直到估算的token总数达到预算；放不下的结果跳过，继续尝试后面较短的结果
+
+    Args:
+        results: 已排序的结果列表，每项包含 text
+        token_budget: token预算
+
+    Returns:
+        装入的结果列表，保持原顺序；预算小于第一个结果时至少返回第一个结果
+    """
+    packed = []
+    remaining = token_budget
+    for result in results:
+        tokens = estimate_tokens(result["text"])
+        if tokens <= remaining:
+            packed.append(result)
+            remaining -= tokens
+    if not packed and results:
+        packed.append(results[0])
+    return packed
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+from bisect import bisect_right
+import numpy as np
+
+# 支持的分块长度单位，键为单位标识，值为显示名称
+CHUNK_UNITS = {
+    "char": "字符",
+    "token": "token"
+}
+
+# 段落边界（空行）与句子边界（中英文句末标点及其后的引号、括号，单个换行）
+_BOUNDARY_PATTERN = re.compile(
+    r'(?P<para>\n[ \t　]*\n\s*)'
+    r'|[。！？!?…；;]+[”’"」』）)\]]*[ \t　]*'
+    r'|(?<=[A-Za-z0-9])\.[”’"」』）)\]]*\s+'
+    r'|\n'
+)
+
+# 文本块达到上限的该比例后才回退到段落边界结束，过早结束会产生更多、更短的文本块
+PARAGRAPH_SNAP_FRACTION = 0.8
+
+# 与 embedding_model.estimate_tokens 一致：中日韩文字每字约1个token，其余约4个字符1个token
+_CJK_RANGES = ((0x3040, 0x30ff), (0x3400, 0x4dbf), (0x4e00, 0x9fff), (0xac00, 0xd7af), (0xf900, 0xfaff))
+
+
+class TextSplitter:
+    """
+    按句子和段落边界分块的文本分割器
+
+    先用一次正则扫描找出全部边界，再用 numpy 累加各句长度、二分查找每个文本块的终点，
+    文本块接近上限时尽量在段落处结束，相邻文本块最多重叠一个完整的句子。
+    """
+
+    def __init__(self, chunk_size=1000, chunk_overlap=200, unit="char"):
+        """
+        初始化分割器
+
+        Args:
+            chunk_size: 文本块大小上限
+            chunk_overlap: 相邻文本块重叠大小上限；重叠为前一块的最后一句，
+                其长度不超过该值按前一块实际长度占 chunk_size 的比例缩放后的值，否则不重叠
+            unit: 长度单位，char 按字符计算，token 按估算的token数计算
+        """
+        if unit not in CHUNK_UNITS:
+            raise ValueError(f"不支持的分块单位: {unit}")
+        self.chunk_size = max(1, int(chunk_size))
+        self.chunk_overlap = max(0, min(int(chunk_overlap), self.chunk_size - 1))
+        self.unit = unit
+        # token 模式下以1/4 token为计量单位，避免浮点累加
+        self._scale = 4 if unit == "token" else 1
+
+    def split(self, text):
+        """
+        分割文本
+
+        Args:
+            text: 文本
+
+        Returns:
+            文本块列表
+        """
+        return [text[start:end].strip() for start, end in self.split_spans(text)]
+
+    def split_segments(self, segments):
+        """
+        逐段分割文档，每读入一段只对未完成的尾部文本重新分块，内存占用与文档总长度无关
+
+        Args:
+            segments: (页码, 文本) 的可迭代对象，如 DocumentProcessor.iter_segments 的返回值
+
+        Yields:
+            (文本块, 文本块起点所在的页码)
+        """
+        buffer = ""
+        marks = []  # (片段在缓冲区中的起点, 页码)
+
+        def page_at(offset):
+            return marks[bisect_right([start for start, _ in marks], offset) - 1][1]
+
+        for page, text in segments:
+            if not text:
+                continue
+            marks.append((len(buffer), page))
+            buffer += text
+
+            # 最后一个文本块可能延续到下一段，保留在缓冲区中
+            spans = self.split_spans(buffer)
+            if len(spans) < 2:
+                continue
+            for start, end in spans[:-1]:
+                yield buffer[start:end].strip(), page_at(start)
+
+            carry = spans[-1][0]
+            first = bisect_right([start for start, _ in marks], carry) - 1
+            marks = [(max(start - carry, 0), page) for start, page in marks[first:]]
+            buffer = buffer[carry:]
+
+        for start, end in self.split_spans(buffer):
+            yield buffer[start:end].strip(), page_at(start)
+
+    def split_spans(self, text):
+        """
+        分割文本，返回各文本块在原文中的位置
+
+        Args:
+            text: 文本
+
+        Returns:
+            (起始位置, 结束位置) 列表
+        """
+        if not text:
+            return []
+
+        limit = self.chunk_size * self._scale
+        overlap = self.chunk_overlap * self._scale
+        starts, ends, paragraph = self._segments(text)
+        cjk = self._cjk_mask(text) if self.unit == "token" else None
+        costs = self._costs(starts, ends, cjk)
+
+        # 超过上限的长句按固定长度硬切
+        if (costs > limit).any():
+            starts, ends, paragraph, costs = self._split_oversized(starts, ends, paragraph, costs, cjk, limit)
+
+        cumulative = np.cumsum(costs)
+        spans = []
+        count = len(ends)
+        i = 0
+        while i < count:
+            base = cumulative[i - 1] if i else 0
+            # 能放进当前文本块的最后一个句子，至少包含一句
+            j = max(int(np.searchsorted(cumulative, base + limit, side='right')) - 1, i)
+
+            # 接近上限处有段落边界时在段落处结束
+            if j < count - 1:
+                candidates = np.flatnonzero(paragraph[i:j + 1]) + i
+                candidates = candidates[cumulative[candidates] - base >= limit * PARAGRAPH_SNAP_FRACTION]
+                if len(candidates):
+                    j = int(candidates[-1])
+
+            if text[starts[i]:ends[j]].strip():
+                spans.append((int(starts[i]), int(ends[j])))
+            if j >= count - 1:
+                break
+
+            # 最后一句足够短时作为下一块的开头，重叠上限按当前块的实际长度缩放
+            next_start = j + 1
+            if overlap > 0 and j > i and costs[j] * limit <= overlap * (cumulative[j] - base):
+                next_start = j
+            i = next_start
+
+        return spans
+
+    def _segments(self, text):
+        """
+        一次正则扫描找出全部句子
+
+        Args:
+            text: 文本
+
+        Returns:
+            (句子起点数组, 句子终点数组, 是否以段落边界结束的布尔数组)
+        """
+        ends = []
+        paragraph = []
+        for match in _BOUNDARY_PATTERN.finditer(text):
+            if match.end() > 0:
+                ends.append(match.end())
+                paragraph.append(match.lastgroup == "para")
+        if not ends or ends[-1] != len(text):
+            ends.append(len(text))
+            paragraph.append(True)
+
+        ends = np.asarray(ends, dtype='int64')
+        starts = np.concatenate([[0], ends[:-1]]).astype('int64')
+        return starts, ends, np.asarray(paragraph, dtype=bool)
+
+    @staticmethod
+    def _cjk_mask(text):
+        """
+        标记文本中的中日韩文字
+
+        Args:
+            text: 文本
+
+        Returns:
+            与文本等长的布尔数组
+        """
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype='uint32')
+        cjk = np.zeros(len(codes), dtype=bool)
+        for low, high in _CJK_RANGES:
+            cjk |= (codes >= low) & (codes <= high)
+        return cjk
+
+    @staticmethod
+    def _costs(starts, ends, cjk=None):
+        """
+        计算各句子的长度
+
+        Args:
+            starts: 句子起点数组
+            ends: 句子终点数组
+            cjk: token 模式下的中日韩文字标记，字符模式为None
+
+        Returns:
+            长度数组，token 模式下单位为1/4 token
+        """
+        lengths = ends - starts
+        if cjk is None:
+            return lengths
+
+        cjk_counts = np.add.reduceat(cjk, starts, dtype='int64')
+        return cjk_counts * 4 + (lengths - cjk_counts)
+
+    def _split_oversized(self, starts, ends, paragraph, costs, cjk, limit):
+        """
+        将超过上限的句子切成不超过上限的片段
+
+        Args:
+            starts: 句子起点数组
+            ends: 句子终点数组
+            paragraph: 段落边界标记数组
+            costs: 句子长度数组
+            cjk: 中日韩文字标记，字符模式为None
+            limit: 长度上限
+
+        Returns:
+            切分后的 (起点数组, 终点数组, 段落边界标记数组, 长度数组)
+        """
+        new_starts, new_ends, new_paragraph = [], [], []
+        for start, end, is_paragraph, cost in zip(starts, ends, paragraph, costs):
+            if cost <= limit:
+                new_starts.append(start)
+                new_ends.append(end)
+                new_paragraph.append(is_paragraph)
+                continue
+
+            # 逐字累加长度，在每个上限整数倍处切开
+            if cjk is None:
+                cumulative = np.arange(1, end - start + 1)
+            else:
+                cumulative = np.cumsum(np.where(cjk[start:end], 4, 1))
+            cuts = np.searchsorted(cumulative, np.arange(limit, cumulative[-1], limit), side='right')
+            bounds = [start] + [int(start + cut) for cut in np.unique(cuts) if 0 < cut < end - start] + [end]
+            for piece_start, piece_end in zip(bounds[:-1], bounds[1:]):
+                new_starts.append(piece_start)
+                new_ends.append(piece_end)
+                new_paragraph.append(False)
+            new_paragraph[-1] = is_paragraph
+
+        starts = np.asarray(new_starts, dtype='int64')
+        ends = np.asarray(new_ends, dtype='int64')
+        return starts, ends, np.asarray(new_paragraph, dtype=bool), self._costs(starts, ends, cjk)
@@ -2,94 +2,884 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
 import json
+import shutil
+import threading
+from collections import OrderedDict
 import faiss
 import numpy as np
 import pickle
+from utils.chunk_store import ChunkStore
+from utils.inverted_index import InvertedIndex
+
+
+class IndexRegistry:
+    """进程内索引注册表，缓存已加载的索引和元数据，按文件修改时间失效，超出内存预算时按LRU淘汰"""
+
+    def __init__(self, memory_budget_mb=512):
+        """
+        初始化索引注册表
+
+        Args:
+            memory_budget_mb: 内存预算（MB），以索引和元数据文件的磁盘大小估算占用
+        """
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self._entries = OrderedDict()  # 键为知识库路径，值为 (签名, 缓存内容, 占用字节数)
+        self._used_bytes = 0
+        self._lock = threading.RLock()  # 查询运行在多个 GenerationThread 中，需要加锁
+        self.hits = 0
+        self.misses = 0
+
+    def set_memory_budget(self, memory_budget_mb):
+        """
+        设置内存预算
+
+        Args:
+            memory_budget_mb: 内存预算（MB）
+        """
+        with self._lock:
+            self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+            self._evict()
+
+    def get(self, key, signature):
+        """
+        获取缓存的索引
+
+        Args:
+            key: 知识库路径或倒排索引文件路径
+            signature: 当前文件签名，与缓存签名不一致时视为失效
+
+        Returns:
+            缓存内容，如 (索引对象, 元数据, 文本块存储) 或倒排索引，未命中时返回None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != signature:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, signature, value, size):
+        """
+        缓存索引
+
+        Args:
+            key: 知识库路径
+            signature: 文件签名
+            value: 缓存内容，如 (索引对象, 元数据, 文本块存储) 或倒排索引
+            size: 估算的内存占用（字节）
+        """
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (signature, value, size)
+            self._used_bytes += size
+            self._evict()
+
+    def invalidate(self, key):
+        """
+        使指定知识库的缓存失效
+
+        Args:
+            key: 知识库路径
+
+        Returns:
+            被移除的缓存内容，不存在时返回None
+        """
+        with self._lock:
+            if key in self._entries:
+                return self._remove(key)
+            return None
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._used_bytes = 0
+
+    def stats(self):
+        """
+        获取缓存统计信息
+
+        Returns:
+            统计信息字典
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "used_bytes": self._used_bytes,
+                "memory_budget": self.memory_budget,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._used_bytes -= entry[2]
+        return entry[1]
+
+    def _evict(self):
+        # 至少保留最近使用的一个条目，即使它单独超出预算
+        while self._used_bytes > self.memory_budget and len(self._entries) > 1:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+
+
+# 全局共享的索引注册表，所有 VectorStore 实例共用
+index_registry = IndexRegistry()
+
+# 共享索引首次按ID重建向量时需要建立直接映射，建立与读取需互斥
+_reconstruct_lock = threading.Lock()
+
+# 知识库的每次保存写入一个新的代目录 gen-NNNNNN，CURRENT 文件记录当前生效的代，
+# 替换 CURRENT 是唯一的提交动作，写入中途崩溃不会影响已生效的代
+CURRENT_FILE = "CURRENT"
+GENERATION_PATTERN = re.compile(r'gen-(\d+)')
+
+# 关键词检索使用的 BM25 倒排索引文件名
+INVERTED_INDEX_FILE = "bm25.npz"
+
+# 支持的索引类型，键为类型标识，值为显示名称
+INDEX_TYPES = {
+    "flat": "精确检索 (Flat)",
+    "ivf_flat": "倒排索引 (IVF-Flat)",
+    "ivf_pq": "倒排+乘积量化 (IVF-PQ)",
+    "hnsw": "图索引 (HNSW)"
+}
+
+# 支持的向量存储格式，键为格式标识，值为显示名称；float32 以外的格式以少量召回率换取内存
+VECTOR_STORAGE_TYPES = {
+    "float32": "原始向量 (float32)",
+    "float16": "半精度 (float16)",
+    "sq8": "标量量化 (int8)",
+    "pq": "乘积量化 (PQ)"
+}
+
+# 需要训练的索引类型在向量数少于此值时退化为精确检索，小知识库暴力搜索已经足够快
+MIN_VECTORS_FOR_TRAINING = 1000
+
+# PQ 每个子空间训练256个中心，faiss 建议每个中心至少39个样本
+MIN_VECTORS_FOR_PQ = 256 * 39
+
+# 以内存映射方式打开索引时依次尝试的读取标志：先尝试零拷贝映射向量数据（较新的 faiss 支持），
+# 再尝试映射 IVF 倒排表；都不支持时整体读入内存
+MMAP_READ_FLAGS = [getattr(faiss, name) | faiss.IO_FLAG_READ_ONLY
+                   for name in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP") if hasattr(faiss, name)]
+
 
 class VectorStore:
     """向量数据库管理器"""
 
-    def __init__(self, base_path="knowledge_bases"):
+    def __init__(self, base_path="knowledge_bases", cache_size_mb=None, mmap_index=True):
         """
         初始化向量数据库管理器
 
         Args:
             base_path: 知识库基础路径
+            cache_size_mb: 索引缓存的内存预算（MB），为None时使用注册表的当前设置
+            mmap_index: 查询用的共享索引是否以内存映射方式打开，只有被访问的页面会读入内存
         """
         self.base_path = base_path
+        self.mmap_index = mmap_index
+        self.index_registry = index_registry
+        if cache_size_mb is not None:
+            self.index_registry.set_memory_budget(cache_size_mb)
         os.makedirs(base_path, exist_ok=True)
 
-    def create_index(self, kb_name, dimension):
+    def create_index(self, kb_name, dimension, index_type="flat", index_params=None, num_vectors=None):
         """
         创建索引
 
         Args:
             kb_name: 知识库名称
             dimension: 向量维度
+            index_type: 索引类型，见 INDEX_TYPES
+            index_params: 索引构建参数，如 nlist、m、hnsw_m
+            num_vectors: 预计的向量数量，用于推算 nlist 及判断是否足够训练
 
         Returns:
-            索引对象
+            以文本块ID寻址的索引对象（IndexIDMap2），需使用 add_with_ids 添加向量
         """
-        index = faiss.IndexFlatL2(dimension)
+        index = faiss.IndexIDMap2(self.build_index(dimension, index_type, index_params, num_vectors))
         kb_path = os.path.join(self.base_path, kb_name)
         os.makedirs(kb_path, exist_ok=True)
         return index
 
-    def save_index(self, kb_name, index, metadata):
+    def build_index(self, dimension, index_type="flat", index_params=None, num_vectors=None):
+        """
+        按类型构建空索引
+
+        Args:
+            dimension: 向量维度
+            index_type: 索引类型，见 INDEX_TYPES
+            index_params: 索引构建参数
+            num_vectors: 预计的向量数量
+
+        Returns:
+            索引对象
+        """
+        return faiss.index_factory(dimension, self.index_factory_string(dimension, index_type, index_params, num_vectors))
+
+    def index_factory_string(self, dimension, index_type="flat", index_params=None, num_vectors=None):
+        """
+        生成 faiss.index_factory 使用的索引描述字符串
+
+        Args:
+            dimension: 向量维度
+            index_type: 索引类型，见 INDEX_TYPES
+            index_params: 索引构建参数，除 nlist、m、hnsw_m 外还支持
+                storage: 向量存储格式，见 VECTOR_STORAGE_TYPES（ivf_pq 固定使用 PQ）
+                pca: 构建时用 PCA 降到的维度，0 或不填表示不降维
+            num_vectors: 预计的向量数量
+
+        Returns:
+            索引描述字符串
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"不支持的索引类型: {index_type}")
+
+        params = index_params or {}
+        storage = params.get("storage") or "float32"
+        if storage not in VECTOR_STORAGE_TYPES:
+            raise ValueError(f"不支持的向量存储格式: {storage}")
+
+        # PCA 降维作为前置变换，后续的量化参数都基于降维后的维度
+        prefix = ""
+        pca = int(params.get("pca") or 0)
+        if 0 < pca < dimension:
+            if num_vectors is not None and num_vectors < MIN_VECTORS_FOR_TRAINING:
+                print(f"向量数量 {num_vectors} 不足以训练PCA，不进行降维")
+            else:
+                prefix = f"PCA{pca},"
+                dimension = pca
+
+        if index_type == "ivf_pq":
+            storage = "pq"
+        if storage == "pq" and num_vectors is not None and num_vectors < MIN_VECTORS_FOR_PQ:
+            # IVF-PQ 退化为 IVF-Flat，其他类型退化为同样节省内存的 int8 标量量化
+            storage = "float32" if index_type == "ivf_pq" else "sq8"
+            print(f"向量数量 {num_vectors} 不足以训练乘积量化，改用 {VECTOR_STORAGE_TYPES[storage]}")
+
+        m = int(params.get("m") or self._default_pq_m(dimension))
+        if storage == "pq" and dimension % m != 0:
+            raise ValueError(f"PQ子空间数 {m} 必须能整除向量维度 {dimension}")
+        codec = {"float32": "Flat", "float16": "SQfp16", "sq8": "SQ8", "pq": f"PQ{m}"}[storage]
+
+        if index_type == "hnsw":
+            hnsw_m = int(params.get('hnsw_m', 32))
+            if storage == "float32":
+                return f"{prefix}HNSW{hnsw_m}"
+            if storage == "pq":
+                return f"{prefix}HNSW{hnsw_m}_{codec}"
+            return f"{prefix}HNSW{hnsw_m},{codec}"
+
+        if index_type in ("ivf_flat", "ivf_pq"):
+            if num_vectors is not None and num_vectors < MIN_VECTORS_FOR_TRAINING:
+                print(f"向量数量 {num_vectors} 不足以训练 {INDEX_TYPES[index_type]}，改用精确检索")
+                return f"{prefix}{codec}"
+
+            nlist = int(params.get("nlist") or self._default_nlist(num_vectors))
+            return f"{prefix}IVF{nlist},{codec}"
+
+        return f"{prefix}{codec}"
+
+    @staticmethod
+    def requires_training(index_type, index_params=None):
+        """
+        判断索引是否需要先训练再添加向量
+
+        Args:
+            index_type: 索引类型
+            index_params: 索引构建参数，使用 int8/PQ 存储或 PCA 降维时同样需要训练
+
+        Returns:
+            是否需要训练
+        """
+        params = index_params or {}
+        return (index_type in ("ivf_flat", "ivf_pq") or params.get("storage") in ("sq8", "pq")
+                or int(params.get("pca") or 0) > 0)
+
+    def train_index(self, index, vectors, sample_size=100000):
+        """
+        训练索引，对不需要训练的索引直接返回
+
+        Args:
+            index: 索引对象
+            vectors: 训练向量（float32 numpy 数组）
+            sample_size: 最多使用的训练样本数量，超出时随机抽样
+
+        Returns:
+            索引对象
+        """
+        if index.is_trained:
+            return index
+
+        if len(vectors) > sample_size:
+            rng = np.random.default_rng(0)
+            vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+
+        index.train(np.ascontiguousarray(vectors, dtype='float32'))
+        return index
+
+    @staticmethod
+    def search_parameters(index, nprobe=None, ef_search=None, exclude_ids=None):
+        """
+        构建单次查询使用的搜索参数，不修改共享索引本身的状态
+
+        Args:
+            index: 索引对象
+            nprobe: IVF 索引探查的倒排列表数
+            ef_search: HNSW 索引的搜索宽度
+            exclude_ids: 需要从结果中排除的ID（已删除的文本块）
+
+        Returns:
+            faiss.SearchParameters 对象，无可用参数时返回None
+        """
+        inner = index
+        # 剥离 IDMap、PreTransform 等包装层，找到真正的检索索引
+        while hasattr(inner, "index") and inner.index is not None:
+            inner = faiss.downcast_index(inner.index)
+        inner = faiss.downcast_index(inner)
+
+        if nprobe and isinstance(inner, faiss.IndexIVF):
+            params = faiss.SearchParametersIVF(nprobe=int(nprobe))
+        elif ef_search and isinstance(inner, faiss.IndexHNSW):
+            params = faiss.SearchParametersHNSW(efSearch=int(ef_search))
+        elif exclude_ids:
+            params = faiss.SearchParameters()
+        else:
+            return None
+
+        if exclude_ids:
+            batch = faiss.IDSelectorBatch(np.asarray(list(exclude_ids), dtype='int64'))
+            selector = faiss.IDSelectorNot(batch)
+            params.sel = selector
+            # SearchParameters 不持有选择器的所有权，需保留Python引用防止被回收
+            params.referenced_objects = [batch, selector]
+        return params
+
+    @staticmethod
+    def reconstruct_all(index):
+        """
+        从索引中重建全部向量及其ID，量化索引返回的是近似值
+
+        Args:
+            index: 索引对象
+
+        Returns:
+            (ID数组, float32 向量数组)
+        """
+        if isinstance(index, faiss.IndexIDMap):
+            ids = faiss.vector_to_array(index.id_map).astype('int64')
+            inner = faiss.downcast_index(index.index)
+        else:
+            # 旧版知识库直接使用位置作为ID
+            ids = np.arange(index.ntotal, dtype='int64')
+            inner = index
+
+        ivf = faiss.try_extract_index_ivf(inner)
+        if ivf is not None:
+            ivf.make_direct_map()
+        return ids, inner.reconstruct_n(0, inner.ntotal)
+
+    def compact_index(self, index, exclude_ids, index_type="flat", index_params=None):
         """
-        保存索引
+        物理删除索引中已标记删除的向量
+
+        Args:
+            index: 索引对象
+            exclude_ids: 需要删除的ID集合
+            index_type: 重建索引时使用的索引类型
+            index_params: 重建索引时使用的构建参数
+
+        Returns:
+            压缩后的索引对象，始终为 IndexIDMap2
+        """
+        exclude = np.asarray(sorted(exclude_ids), dtype='int64')
+
+        # 只有 Flat 索引可以原地删除：IDMap2 压缩 id_map 后，Flat 的行号随之前移保持对应；
+        # IVF 倒排列表中保存的是加入时的顺序号，删除后与 id_map 错位，HNSW 则不支持删除，都走重建流程
+        if isinstance(index, faiss.IndexIDMap2) and isinstance(faiss.downcast_index(index.index), faiss.IndexFlat):
+            index.remove_ids(exclude)
+            return index
+
+        ids, vectors = self.reconstruct_all(index)
+        keep = ~np.isin(ids, exclude)
+        ids, vectors = ids[keep], vectors[keep]
+
+        compacted = faiss.IndexIDMap2(self.build_index(index.d, index_type, index_params, len(ids)))
+        if len(ids):
+            self.train_index(compacted, vectors)
+            compacted.add_with_ids(vectors, ids)
+        return compacted
+
+    @staticmethod
+    def _default_nlist(num_vectors):
+        """按经验值 4*sqrt(N) 推算倒排列表数，并保证每个列表至少有约39个训练样本"""
+        if not num_vectors:
+            return 1024
+        return int(max(1, min(4 * np.sqrt(num_vectors), num_vectors // 39)))
+
+    @staticmethod
+    def _default_pq_m(dimension):
+        """选择能整除维度且不超过64的最大PQ子空间数"""
+        for m in range(min(64, dimension), 0, -1):
+            if dimension % m == 0:
+                return m
+        return 1
+
+    def save_index(self, kb_name, index, metadata, chunk_store=None, inverted_index=None):
+        """
+        保存索引，所有文件写入新的一代并落盘后再切换 CURRENT，查询在切换前一直使用旧的一代
 
         Args:
             kb_name: 知识库名称
             index: 索引对象
-            metadata: 元数据
+            metadata: 元数据，若仍包含旧版的 documents 字段，会被转存到文本块存储
+            chunk_store: new_chunk_store 或 open_chunk_store 返回的文本块存储，为None时沿用当前的文本块
+            inverted_index: 与文本块对应的倒排索引，为None时沿用当前的倒排索引
 
         Returns:
             是否保存成功
         """
         try:
-            kb_path = os.path.join(self.base_path, kb_name)
-            os.makedirs(kb_path, exist_ok=True)
+            # 文本块存储已经在待提交的一代中，其余文件写到同一目录
+            if chunk_store is not None and self._is_staged(kb_name, chunk_store.directory):
+                chunk_store.close()
+                generation_path = chunk_store.directory
+            else:
+                generation_path = self._new_generation(kb_name)
 
-            # 保存索引
-            faiss.write_index(index, os.path.join(kb_path, "index.faiss"))
+            # 文本不再写入元数据，避免每次加载都解析全部文本
+            metadata = dict(metadata)
+            documents = metadata.pop("documents", None)
+            if documents is not None:
+                ChunkStore.from_documents(generation_path, documents).close()
 
-            # 保存元数据
-            with open(os.path.join(kb_path, "metadata.json"), "w", encoding="utf-8") as f:
+            faiss.write_index(index, os.path.join(generation_path, "index.faiss"))
+            with open(os.path.join(generation_path, "metadata.json"), "w", encoding="utf-8") as f:
                 json.dump(metadata, f, ensure_ascii=False, indent=2)
 
+            inverted_path = os.path.join(generation_path, INVERTED_INDEX_FILE)
+            if inverted_index is not None:
+                inverted_index.save(inverted_path)
+            else:
+                current_inverted_path = os.path.join(self._current_path(kb_name), INVERTED_INDEX_FILE)
+                if os.path.exists(current_inverted_path):
+                    self._link_or_copy(current_inverted_path, inverted_path)
+
+            self._commit_generation(kb_name, generation_path)
+
+            # 文件已更新，丢弃旧的缓存
+            self.index_registry.invalidate(self._registry_key(kb_name))
+            self.index_registry.invalidate(self._inverted_registry_key(kb_name))
+
             return True
         except Exception as e:
             print(f"保存索引出错: {e}")
             return False
 
-    def load_index(self, kb_name):
+    def new_chunk_store(self, kb_name):
         """
-        加载索引
+        在新的一代中创建空的文本块存储，save_index 时随索引一起生效，构建失败不影响当前的知识库
 
         Args:
             kb_name: 知识库名称
 
         Returns:
-            (索引对象, 元数据)
+            ChunkStore 实例
         """
-        try:
-            kb_path = os.path.join(self.base_path, kb_name)
+        store = ChunkStore(self._new_generation(kb_name, copy_chunks=False))
+        store.truncate(0)
+        return store
 
-            # 加载索引
-            index = faiss.read_index(os.path.join(kb_path, "index.faiss"))
+    def open_chunk_store(self, kb_name):
+        """
+        打开知识库的文本块存储用于增量修改，修改写入新的一代，save_index 时生效
 
-            # 加载元数据
-            with open(os.path.join(kb_path, "metadata.json"), "r", encoding="utf-8") as f:
-                metadata = json.load(f)
+        Args:
+            kb_name: 知识库名称
+
+        Returns:
+            ChunkStore 实例
+        """
+        return ChunkStore(self._new_generation(kb_name))
+
+    def resume_chunk_store(self, kb_name, directory):
+        """
+        重新打开上次中断的构建写入的文本块存储
 
+        Args:
+            kb_name: 知识库名称
+            directory: new_chunk_store 返回的文本块存储所在目录
+
+        Returns:
+            ChunkStore 实例，该目录已提交、已被清理或不属于该知识库时返回None
+        """
+        if not self._is_staged(kb_name, directory) or not ChunkStore.exists(directory):
+            return None
+        return ChunkStore(directory)
+
+    def discard_chunk_store(self, kb_name, chunk_store):
+        """
+        丢弃未提交的文本块存储所在的一代，构建失败或没有修改时调用；已提交的不受影响
+
+        Args:
+            kb_name: 知识库名称
+            chunk_store: new_chunk_store 或 open_chunk_store 返回的文本块存储
+        """
+        chunk_store.close()
+        if not self._is_staged(kb_name, chunk_store.directory):
+            return
+
+        shutil.rmtree(chunk_store.directory, ignore_errors=True)
+        # 新建知识库失败时不留下空目录
+        kb_path = os.path.join(self.base_path, kb_name)
+        if os.path.isdir(kb_path) and not os.listdir(kb_path):
+            os.rmdir(kb_path)
+
+    def load_index(self, kb_name, use_cache=True):
+        """
+        加载索引
+
+        Args:
+            kb_name: 知识库名称
+            use_cache: 是否使用共享的索引缓存，需要修改索引时应传False获取独立副本
+
+        Returns:
+            (索引对象, 元数据)，使用缓存时返回的对象被多个查询共享，不能修改
+        """
+        try:
+            index, metadata, _ = self._load_entry(kb_name, use_cache)
             return index, metadata
         except Exception as e:
             print(f"加载索引出错: {e}")
             return None, None
 
-    def search(self, kb_name, query_vector, top_k=5):
+    def load_inverted_index(self, kb_name, use_cache=True):
+        """
+        加载知识库的 BM25 倒排索引，旧版知识库首次加载时从文本块存储构建
+
+        Args:
+            kb_name: 知识库名称
+            use_cache: 是否使用共享缓存，需要修改时应传False获取独立副本
+
+        Returns:
+            InvertedIndex 实例，加载失败时返回None
+        """
+        try:
+            # 确保文本块存储已迁移
+            if not ChunkStore.exists(self._current_path(kb_name)):
+                self._migrate_chunk_store(kb_name)
+
+            generation_path = self._current_path(kb_name)
+            path = os.path.join(generation_path, INVERTED_INDEX_FILE)
+            if not os.path.exists(path):
+                inverted_index = InvertedIndex()
+                ids, texts = [], []
+                for chunk_id, text in ChunkStore(generation_path).iter_chunks():
+                    ids.append(chunk_id)
+                    texts.append(text)
+                inverted_index.add(ids, texts)
+                inverted_index.save(path)
+
+            key = self._inverted_registry_key(kb_name)
+            signature = (generation_path,) + self._file_signature(path)
+            if use_cache:
+                inverted_index = self.index_registry.get(key, signature)
+                if inverted_index is not None:
+                    return inverted_index
+
+            inverted_index = InvertedIndex.load(path)
+            if use_cache:
+                self.index_registry.put(key, signature, inverted_index, signature[2])
+            return inverted_index
+        except Exception as e:
+            print(f"加载倒排索引出错: {e}")
+            return None
+
+    def _load_entry(self, kb_name, use_cache=True):
+        """
+        加载知识库的索引、元数据和文本块存储
+
+        Args:
+            kb_name: 知识库名称
+            use_cache: 是否使用共享的索引缓存
+
+        Returns:
+            (索引对象, 元数据, 文本块存储)
+        """
+        # 旧版知识库的文本保存在 metadata.json 中，首次打开时迁移到文本块存储
+        if not ChunkStore.exists(self._current_path(kb_name)):
+            self._migrate_chunk_store(kb_name)
+
+        generation_path = self._current_path(kb_name)
+        index_path = os.path.join(generation_path, "index.faiss")
+        metadata_path = os.path.join(generation_path, "metadata.json")
+        chunk_store = ChunkStore(generation_path)
+
+        # 优先使用已缓存的索引，切换到新的一代或文件被修改后签名变化会自动失效
+        key = self._registry_key(kb_name)
+        signature = (generation_path, self._file_signature(index_path), self._file_signature(metadata_path),
+                     self._file_signature(chunk_store.offsets_path))
+        if use_cache:
+            entry = self.index_registry.get(key, signature)
+            if entry is not None:
+                return entry
+
+        # 加载索引，共享的只读索引优先内存映射，需要修改的独立副本整体读入
+        index, resident = self._read_index(index_path, use_cache and self.mmap_index)
+
+        # 加载元数据
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+
+        if use_cache:
+            # 文本内容通过内存映射按需读取，只计入偏移表的大小；索引只计入无法映射、常驻内存的部分
+            size = resident + signature[2][1] + signature[3][1]
+            self.index_registry.put(key, signature, (index, metadata, chunk_store), size)
+
+        return index, metadata, chunk_store
+
+    @staticmethod
+    def _read_index(index_path, mmap_index=True):
+        """
+        读取索引文件
+
+        Args:
+            index_path: 索引文件路径
+            mmap_index: 是否尝试以只读内存映射方式打开，映射的索引不能修改
+
+        Returns:
+            (索引对象, 常驻内存的字节数估计)，用于索引缓存的内存预算
+        """
+        file_size = os.path.getsize(index_path)
+        if mmap_index:
+            for flags in MMAP_READ_FLAGS:
+                try:
+                    index = faiss.read_index(index_path, flags)
+                except Exception as e:
+                    print(f"以内存映射方式打开索引失败，尝试其他方式: {e}")
+                    continue
+                if flags & getattr(faiss, "IO_FLAG_MMAP_IFC", 0):
+                    return index, max(0, file_size - VectorStore._mapped_bytes(index))
+                # 只有 IO_FLAG_MMAP 时 Flat、HNSW 等索引仍整体读入内存，按文件大小计入
+                return index, file_size
+        return faiss.read_index(index_path), file_size
+
+    @staticmethod
+    def _mapped_bytes(index):
+        """
+        估计以 IO_FLAG_MMAP_IFC 打开的索引中零拷贝映射、不常驻内存的字节数
+
+        Flat 的向量编码和 IVF 的倒排表直接映射；HNSW 只有底层存储的向量被映射，图结构仍读入内存；
+        ID 映射表、IVF 的聚类中心等其余部分都常驻内存。
+
+        Args:
+            index: 索引对象
+
+        Returns:
+            字节数
+        """
+        if isinstance(index, faiss.IndexIDMap):
+            index = faiss.downcast_index(index.index)
+        if isinstance(index, faiss.IndexHNSW):
+            index = faiss.downcast_index(index.storage)
+
+        flat_codes = getattr(faiss, "IndexFlatCodes", faiss.IndexFlat)
+        if isinstance(index, flat_codes):
+            return index.ntotal * index.code_size
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            # 倒排表中每个向量保存编码和8字节的ID
+            return ivf.ntotal * (ivf.code_size + 8)
+        return 0
+
+    def _migrate_chunk_store(self, kb_name):
+        """
+        将旧版 metadata.json 中的 documents 迁移到新的一代的文本块存储
+
+        Args:
+            kb_name: 知识库名称
+        """
+        source_path = self._current_path(kb_name)
+        with open(os.path.join(source_path, "metadata.json"), "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+
+        documents = metadata.pop("documents", {})
+        generation_path = self._new_generation(kb_name, copy_chunks=False)
+        ChunkStore.from_documents(generation_path, documents).close()
+        self._link_or_copy(os.path.join(source_path, "index.faiss"), os.path.join(generation_path, "index.faiss"))
+        with open(os.path.join(generation_path, "metadata.json"), "w", encoding="utf-8") as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=2)
+        self._commit_generation(kb_name, generation_path)
+        print(f"知识库 '{kb_name}' 已迁移到文本块存储，共 {len(documents)} 个文本块")
+
+    def _current_path(self, kb_name):
+        """
+        获取知识库当前生效的一代所在目录
+
+        Args:
+            kb_name: 知识库名称
+
+        Returns:
+            目录路径，没有 CURRENT 的旧版知识库返回知识库目录本身
+        """
+        kb_path = os.path.join(self.base_path, kb_name)
+        try:
+            with open(os.path.join(kb_path, CURRENT_FILE), "r", encoding="utf-8") as f:
+                return os.path.join(kb_path, f.read().strip())
+        except FileNotFoundError:
+            return kb_path
+
+    def _is_staged(self, kb_name, directory):
+        """
+        判断目录是否为知识库尚未提交的一代
+
+        Args:
+            kb_name: 知识库名称
+            directory: 目录路径
+
+        Returns:
+            是否为待提交的一代
+        """
+        kb_path = os.path.abspath(os.path.join(self.base_path, kb_name))
+        directory = os.path.abspath(directory)
+        return (os.path.dirname(directory) == kb_path
+                and GENERATION_PATTERN.fullmatch(os.path.basename(directory)) is not None
+                and directory != os.path.abspath(self._current_path(kb_name)))
+
+    def _new_generation(self, kb_name, copy_chunks=True):
+        """
+        创建新的一代目录
+
+        Args:
+            kb_name: 知识库名称
+            copy_chunks: 是否以当前的文本块存储为起点，增量修改时使用
+
+        Returns:
+            新目录路径
+        """
+        kb_path = os.path.join(self.base_path, kb_name)
+        os.makedirs(kb_path, exist_ok=True)
+        numbers = [int(match.group(1)) for match in map(GENERATION_PATTERN.fullmatch, os.listdir(kb_path)) if match]
+        generation_path = os.path.join(kb_path, f"gen-{max(numbers, default=0) + 1:06d}")
+        os.makedirs(generation_path)
+
+        source_path = self._current_path(kb_name)
+        if copy_chunks and ChunkStore.exists(source_path):
+            source = ChunkStore(source_path)
+            target = ChunkStore(generation_path)
+            # 文本文件只追加不改写，旧的一代只引用其原有长度内的字节，可以硬链接共享而不必复制；
+            # 偏移表和页码会被就地修改，必须复制
+            self._link_or_copy(source.blob_path, target.blob_path)
+            shutil.copyfile(source.offsets_path, target.offsets_path)
+            if os.path.exists(source.pages_path):
+                shutil.copyfile(source.pages_path, target.pages_path)
+        return generation_path
+
+    def _commit_generation(self, kb_name, generation_path):
+        """
+        将新的一代落盘后原子地切换 CURRENT，并清理不再需要的旧代
+
+        Args:
+            kb_name: 知识库名称
+            generation_path: 待提交的一代所在目录
+        """
+        kb_path = os.path.join(self.base_path, kb_name)
+        previous_path = self._current_path(kb_name)
+
+        for file in os.listdir(generation_path):
+            self._fsync(os.path.join(generation_path, file))
+        self._fsync_directory(generation_path)
+
+        pointer_path = os.path.join(kb_path, CURRENT_FILE)
+        with open(pointer_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(os.path.basename(generation_path))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer_path + ".tmp", pointer_path)
+        self._fsync_directory(kb_path)
+
+        self._collect_generations(kb_name, previous_path)
+
+    def _collect_generations(self, kb_name, previous_path):
+        """
+        删除比当前更早的代，包括构建失败遗留的未提交的代；上一代保留到下次提交，正在读取它的查询可以继续完成
+
+        Args:
+            kb_name: 知识库名称
+            previous_path: 本次提交之前生效的目录
+        """
+        kb_path = os.path.join(self.base_path, kb_name)
+        current = int(GENERATION_PATTERN.fullmatch(os.path.basename(self._current_path(kb_name))).group(1))
+        for name in os.listdir(kb_path):
+            match = GENERATION_PATTERN.fullmatch(name)
+            if match and int(match.group(1)) < current and name != os.path.basename(previous_path):
+                # 仍被查询映射的旧代在 Windows 上无法删除，留到下次提交时再清理
+                shutil.rmtree(os.path.join(kb_path, name), onerror=self._report_remove_error)
+
+        # 旧版布局的文件直接位于知识库目录，同样保留到下次提交
+        if os.path.abspath(previous_path) != os.path.abspath(kb_path):
+            for file in os.listdir(kb_path):
+                path = os.path.join(kb_path, file)
+                if file != CURRENT_FILE and os.path.isfile(path):
+                    os.remove(path)
+
+    @staticmethod
+    def _report_remove_error(function, path, exc_info):
+        """shutil.rmtree 的错误回调，只记录无法删除的文件，继续删除其余文件"""
+        print(f"删除旧版本文件出错: {path}: {exc_info[1]}")
+
+    @staticmethod
+    def _link_or_copy(source, target):
+        """
+        以硬链接共享不可变文件，文件系统不支持时复制
+
+        Args:
+            source: 源文件路径
+            target: 目标文件路径
+        """
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+
+    @staticmethod
+    def _fsync(path):
+        """
+        将文件内容写入磁盘
+
+        Args:
+            path: 文件路径
+        """
+        with open(path, "r+b") as f:
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _fsync_directory(path):
+        """
+        将目录项写入磁盘，Windows 不支持打开目录，跳过
+
+        Args:
+            path: 目录路径
+        """
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def search(self, kb_name, query_vector, top_k=5, search_params=None):
         """
         搜索
 
@@ -97,25 +887,82 @@ class VectorStore:
             kb_name: 知识库名称
             query_vector: 查询向量
             top_k: 返回结果数量
+            search_params: 查询参数，如 {"nprobe": 16, "ef_search": 64}，为None时使用知识库保存的默认值
 
         Returns:
             (距离列表, ID列表)
         """
+        results = self.search_many(kb_name, [query_vector], top_k, search_params)
+        if results is None:
+            return None, None
+        return results[0]
+
+    def search_many(self, kb_name, query_vectors, top_k=5, search_params=None):
+        """
+        批量搜索，所有查询向量在一次 index.search 调用中完成
+
+        Args:
+            kb_name: 知识库名称
+            query_vectors: 查询向量列表或二维数组
+            top_k: 每个查询返回的结果数量
+            search_params: 查询参数，为None时使用知识库保存的默认值
+
+        Returns:
+            与查询向量一一对应的 (距离列表, ID列表) 列表，出错时返回None
+        """
         try:
             index, metadata = self.load_index(kb_name)
             if index is None:
-                return None, None
+                return None
 
             # 确保查询向量是numpy数组并且形状正确
-            query_vector = np.array(query_vector).reshape(1, -1).astype('float32')
+            query_vectors = np.asarray(query_vectors, dtype='float32').reshape(-1, index.d)
 
             # 搜索
-            distances, ids = index.search(query_vector, top_k)
+            if search_params is None:
+                search_params = metadata.get("search_params", {})
+            params = self.search_parameters(index, search_params.get("nprobe"), search_params.get("ef_search"),
+                                            metadata.get("deleted_ids"))
+            distances, ids = index.search(query_vectors, top_k, params=params)
 
-            return distances[0], ids[0]
+            # 近似索引在候选不足时会返回-1
+            valid = ids >= 0
+            return [(distances[i][valid[i]], ids[i][valid[i]]) for i in range(len(ids))]
         except Exception as e:
             print(f"搜索出错: {e}")
-            return None, None
+            return None
+
+    def get_metric_type(self, kb_name):
+        """
+        获取知识库索引的距离度量
+
+        Args:
+            kb_name: 知识库名称
+
+        Returns:
+            faiss 度量类型，如 faiss.METRIC_L2，加载失败时返回None
+        """
+        index, _ = self.load_index(kb_name)
+        if index is None:
+            return None
+        return index.metric_type
+
+    @staticmethod
+    def to_similarity(distances, metric_type):
+        """
+        将索引返回的距离转换为越大越相似的得分，使不同度量的知识库结果可以比较
+
+        Args:
+            distances: 距离数组
+            metric_type: faiss 度量类型
+
+        Returns:
+            float 得分数组，L2 距离映射为 1/(1+d)，内积映射为 (1+s)/2
+        """
+        distances = np.asarray(distances, dtype='float64')
+        if metric_type == faiss.METRIC_INNER_PRODUCT:
+            return (1.0 + distances) / 2.0
+        return 1.0 / (1.0 + np.maximum(distances, 0.0))
 
     def get_document(self, kb_name, doc_id):
         """
@@ -128,14 +975,139 @@ class VectorStore:
         Returns:
             文档内容
         """
+        return self.get_documents(kb_name, [doc_id])[0]
+
+    def get_documents(self, kb_name, doc_ids):
+        """
+        批量获取文档
+
+        Args:
+            kb_name: 知识库名称
+            doc_ids: 文档ID列表
+
+        Returns:
+            文档内容列表，与doc_ids一一对应，不存在的文档为None
+        """
         try:
-            _, metadata = self.load_index(kb_name)
-            if metadata is None:
+            _, _, chunk_store = self._load_entry(kb_name)
+            return chunk_store.get_many(doc_ids)
+        except Exception as e:
+            print(f"获取文档出错: {e}")
+            return [None] * len(doc_ids)
+
+    def get_pages(self, kb_name, doc_ids):
+        """
+        批量获取文档的来源页码
+
+        Args:
+            kb_name: 知识库名称
+            doc_ids: 文档ID列表
+
+        Returns:
+            页码列表，与doc_ids一一对应，没有页码的文档为None
+        """
+        try:
+            _, _, chunk_store = self._load_entry(kb_name)
+            return chunk_store.get_pages(doc_ids)
+        except Exception as e:
+            print(f"获取页码出错: {e}")
+            return [None] * len(doc_ids)
+
+    def get_vectors(self, kb_name):
+        """
+        从索引中重建全部向量，量化索引返回的是近似值
+
+        Args:
+            kb_name: 知识库名称
+
+        Returns:
+            float32 numpy 数组，加载失败返回None
+        """
+        try:
+            index, metadata = self.load_index(kb_name)
+            if index is None:
                 return None
 
-            return metadata["documents"].get(str(doc_id))
+            ids, vectors = self.reconstruct_all(index)
+            deleted_ids = metadata.get("deleted_ids")
+            if deleted_ids:
+                vectors = vectors[~np.isin(ids, deleted_ids)]
+            return vectors
         except Exception as e:
-            print(f"获取文档出错: {e}")
+            print(f"读取向量出错: {e}")
+            return None
+
+    def sample_vectors(self, kb_name, sample_size, seed=0):
+        """
+        从未删除的向量中按固定种子均匀抽取一部分并重建，避免评估时重建整个知识库
+
+        Args:
+            kb_name: 知识库名称
+            sample_size: 最多抽取的向量数
+            seed: 随机种子，相同种子得到相同的样本
+
+        Returns:
+            float32 numpy 数组，加载失败返回None
+        """
+        try:
+            index, metadata = self.load_index(kb_name)
+            if index is None:
+                return None
+
+            if isinstance(index, faiss.IndexIDMap):
+                ids = faiss.vector_to_array(index.id_map).astype('int64')
+            else:
+                ids = np.arange(index.ntotal, dtype='int64')
+            deleted_ids = metadata.get("deleted_ids")
+            if deleted_ids:
+                ids = ids[~np.isin(ids, deleted_ids)]
+
+            # 样本覆盖大部分向量，或索引不支持按ID重建时，整体重建后再抽取
+            if sample_size >= len(ids) or (isinstance(index, faiss.IndexIDMap)
+                                           and not isinstance(index, faiss.IndexIDMap2)):
+                vectors = self.get_vectors(kb_name)
+                if vectors is None or sample_size >= len(vectors):
+                    return vectors
+                rng = np.random.default_rng(seed)
+                return vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+
+            rng = np.random.default_rng(seed)
+            return self.reconstruct_vectors(kb_name, np.sort(rng.choice(ids, sample_size, replace=False)))
+        except Exception as e:
+            print(f"抽取向量出错: {e}")
+            return None
+
+    def reconstruct_vectors(self, kb_name, doc_ids):
+        """
+        按文本块ID重建向量，量化索引返回的是近似值，PCA 降维的索引返回逆变换后的原始维度向量
+
+        Args:
+            kb_name: 知识库名称
+            doc_ids: 文本块ID列表
+
+        Returns:
+            float32 数组，形状为 (len(doc_ids), 维度)，索引不支持按ID重建或加载失败时返回None
+        """
+        try:
+            index, _ = self.load_index(kb_name)
+            if index is None:
+                return None
+
+            ids = np.asarray(doc_ids, dtype='int64')
+            if len(ids) == 0:
+                return np.zeros((0, index.d), dtype='float32')
+            if isinstance(index, faiss.IndexIDMap) and not isinstance(index, faiss.IndexIDMap2):
+                return None
+            inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+
+            with _reconstruct_lock:
+                # IVF 索引需要直接映射才能按位置重建，只在内存中建立，不修改索引文件
+                ivf = faiss.try_extract_index_ivf(inner)
+                if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+                    ivf.make_direct_map()
+                return np.vstack([index.reconstruct(int(doc_id)) for doc_id in ids]).astype('float32')
+        except Exception as e:
+            print(f"重建向量出错: {e}")
             return None
 
     def list_knowledge_bases(self):
@@ -146,7 +1118,11 @@ class VectorStore:
             知识库列表
         """
         try:
-            return [d for d in os.listdir(self.base_path) if os.path.isdir(os.path.join(self.base_path, d))]
+            # 跳过以点开头的目录（如构建任务目录）和尚未提交过的新知识库
+            return [d for d in os.listdir(self.base_path)
+                    if not d.startswith(".")
+                    and (os.path.exists(os.path.join(self.base_path, d, CURRENT_FILE))
+                         or os.path.exists(os.path.join(self.base_path, d, "metadata.json")))]
         except Exception as e:
             print(f"列出知识库出错: {e}")
             return []
@@ -164,11 +1140,54 @@ class VectorStore:
         try:
             kb_path = os.path.join(self.base_path, kb_name)
             if os.path.exists(kb_path):
-                for file in os.listdir(kb_path):
-                    os.remove(os.path.join(kb_path, file))
-                os.rmdir(kb_path)
+                # 先移出缓存并关闭文本块和索引的内存映射，Windows 上被映射的文件无法删除
+                self.index_registry.invalidate(self._inverted_registry_key(kb_name))
+                entry = self.index_registry.invalidate(self._registry_key(kb_name))
+                if entry is not None:
+                    index, _, chunk_store = entry
+                    chunk_store.close()
+                    del index, entry
+                shutil.rmtree(kb_path)
                 return True
             return False
         except Exception as e:
             print(f"删除知识库出错: {e}")
             return False
+
+    def _registry_key(self, kb_name):
+        """
+        获取知识库在索引注册表中的键
+
+        Args:
+            kb_name: 知识库名称
+
+        Returns:
+            知识库目录的绝对路径
+        """
+        return os.path.abspath(os.path.join(self.base_path, kb_name))
+
+    def _inverted_registry_key(self, kb_name):
+        """
+        获取知识库倒排索引在索引注册表中的键
+
+        Args:
+            kb_name: 知识库名称
+
+        Returns:
+            倒排索引文件的绝对路径
+        """
+        return os.path.join(self._registry_key(kb_name), INVERTED_INDEX_FILE)
+
+    @staticmethod
+    def _file_signature(path):
+        """
+        获取文件签名
+
+        Args:
+            path: 文件路径
+
+        Returns:
+            (修改时间, 文件大小)
+        """
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size